@@ -0,0 +1,92 @@
+"""
+Timing profile for the frontend Lambda's voice preprocessing (prepare_audio).
+
+Builds synthetic WAV clips (speech-like bursts between near-silent gaps) in the formats
+clients send, runs prepare_audio on each and reports the median time, the time as a
+share of the clip length, and the upload bytes saved. Each case must finish within
+its budget (the 16 kHz mono recorder format is held to a tighter one), otherwise the
+script exits non-zero, so it can guard voice latency in CI.
+
+Usage (from lambda/backend):
+    python -m bench.audio_profile
+    python -m bench.audio_profile --seconds 60 --repeat 5 --budget-ms 2000
+"""
+import argparse, importlib, io, json, math, os, statistics, sys, time, wave
+from array import array
+from typing import Any, Dict, List
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend")
+# (label, sample rate, channels); the first is what streamlit/app.py records
+CASES = [
+    ("recorder_16k_mono", 16000, 1),
+    ("wav_44k_stereo", 44100, 2),
+    ("wav_48k_mono", 48000, 1),
+]
+
+def synthetic_wav(rate: int, channels: int, seconds: float) -> bytes:
+    """A 220 Hz tone switched on for two seconds in every three, near-silent otherwise."""
+    n = int(rate * seconds)
+    step = 2 * math.pi * 220 / rate
+    mono = array("h", (int((8000 if (i // rate) % 3 else 40) * math.sin(i * step)) for i in range(n)))
+    samples = mono if channels == 1 else array("h", (s for s in mono for _ in range(channels)))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+def profile(frontend: Any, label: str, rate: int, channels: int, seconds: float, repeat: int) -> Dict[str, Any]:
+    audio = synthetic_wav(rate, channels, seconds)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload, out_rate, encoding = frontend.prepare_audio(audio, "wav")
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    return {
+        "case": label,
+        "input_bytes": len(audio),
+        "output_bytes": len(payload),
+        "output_rate": out_rate,
+        "median_ms": round(median * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1),
+        "realtime_ratio": round(median / seconds, 4),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Clip length")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Fail if any case's median exceeds this")
+    parser.add_argument("--recorder-budget-ms", type=float, default=100.0, help="Budget for the 16 kHz mono recorder format")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DEMO_MODE", "true")
+    sys.path.insert(0, FRONTEND_DIR)
+    frontend = importlib.import_module("main")
+    frontend.log = lambda msg: None
+
+    results: List[Dict[str, Any]] = []
+    over_budget = False
+    for label, rate, channels in CASES:
+        r = profile(frontend, label, rate, channels, args.seconds, args.repeat)
+        budget = args.recorder_budget_ms if label == CASES[0][0] else args.budget_ms
+        r["budget_ms"] = budget
+        results.append(r)
+        print(f"{r['case']:<18} {r['median_ms']:>8.1f} ms (max {r['max_ms']:.1f})  "
+              f"{r['realtime_ratio'] * 100:5.2f}% of clip  {r['input_bytes']:>9} → {r['output_bytes']:>8} bytes")
+        if r["median_ms"] > budget:
+            print(f"  OVER BUDGET: {r['median_ms']} ms > {budget} ms")
+            over_budget = True
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+"""
+Local stand-ins for Quickbase, S3 and Slack used by the offline benchmarks.
+
+- FakeQuickbase: HTTP server (run in a child process so its allocations don't
+  pollute tracemalloc numbers) covering /records/query, /fields, /tables,
+  /relationships and /files, with configurable latency, page caps and 429 injection.
+- FakeS3 / FakeSlack / FakeCloudWatch: in-process objects that count calls.
+
+Point the backend at the fake server by setting QB_API_BASE *before* importing src.
+"""
+import json, random, re, threading, time, multiprocessing
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# ============================================================================
+# DATASET
+# ============================================================================
+CUSTOMERS_TABLE_ID = "bqcust0001"
+TICKETS_TABLE_ID = "bqtick0001"
+NOTES_TABLE_ID = "bqnote0001"
+APP_ID = "bqapp00001"
+
+# (fid, label, fieldType) — labels mirror field_allowlist.py
+CUSTOMER_FIELDS = [
+    (1, "Date Created", "timestamp"),
+    (2, "Date Modified", "timestamp"),
+    (3, "Record ID#", "recordid"),
+    (6, "Customer Name", "text"),
+    (7, "Contact Person", "text"),
+    (8, "Email", "email"),
+    (9, "Phone", "phone"),
+    (10, "Account Type", "text-multiple-choice"),
+    (11, "Annual Revenue", "currency"),
+]
+TICKET_FIELDS = [
+    (1, "Date Created", "timestamp"),
+    (2, "Date Modified", "timestamp"),
+    (3, "Record ID#", "recordid"),
+    (6, "Ticket Id", "text"),
+    (7, "Issue Description", "text"),
+    (8, "Priority", "text-multiple-choice"),
+    (9, "Status", "text-multiple-choice"),
+    (10, "Date Opened", "date"),
+    (11, "Related Customer", "numeric"),
+    (12, "Customer Name", "text"),
+    (13, "Attachment", "file"),
+    (14, "Has Attachment?", "checkbox"),
+]
+TICKET_FK_FID = 11
+NOTE_FIELDS = [
+    (1, "Date Created", "timestamp"),
+    (2, "Date Modified", "timestamp"),
+    (3, "Record ID#", "recordid"),
+    (6, "Note", "text"),
+    (7, "Author", "text"),
+    (8, "Note Date", "date"),
+    (9, "Related Ticket", "numeric"),
+]
+NOTE_FK_FID = 9
+
+BENCH_ALLOW_LISTS = {
+    "Customers": {
+        "id": CUSTOMERS_TABLE_ID,
+        "fields": [
+            "Record ID# [KEY]", "Customer Name [UNIQUE]", "Contact Person",
+            "Email", "Phone", "Account Type", "Annual Revenue"
+        ]
+    },
+    "Customer Support Tickets": {
+        "id": TICKETS_TABLE_ID,
+        "fields": [
+            "Record ID# [KEY]", "Ticket Id [UNIQUE]", "Issue Description", "Priority",
+            "Status", "Date Opened [DATE]", "Related Customer [RELATED KEY]",
+            "Customer Name", "Attachment", "Has Attachment?"
+        ]
+    },
+    "Ticket Notes": {
+        "id": NOTES_TABLE_ID,
+        "fields": [
+            "Record ID# [KEY]", "Note", "Author", "Note Date [DATE]", "Related Ticket [RELATED KEY]"
+        ]
+    }
+}
+
+_ISSUES = ["Authentication error", "API integration problem", "Data sync issue", "Billing question", "Slow dashboard"]
+_PRIORITIES = ["Critical", "High", "Medium", "Low"]
+_STATUSES = ["Open", "In Progress", "Resolved"]
+_ACCOUNT_TYPES = ["Enterprise", "Mid-Market", "Small Business"]
+_AUTHORS = ["Support Agent", "Engineer", "Account Manager"]
+
+class FakeTable:
+    """Rows stored as tuples in field order; lazy per-field value indexes for EX/TV lookups."""
+
+    def __init__(self, table_id: str, name: str, fields: List[Tuple[int, str, str]], rows: List[tuple]):
+        self.id = table_id
+        self.name = name
+        self.fields = fields
+        self.col = {fid: i for i, (fid, _, _) in enumerate(fields)}
+        self.types = {fid: ftype for fid, _, ftype in fields}
+        self.rows = rows
+        self._indexes: Dict[int, Dict[str, List[int]]] = {}
+
+    def value_index(self, fid: int) -> Dict[str, List[int]]:
+        if fid not in self._indexes:
+            idx: Dict[str, List[int]] = {}
+            c = self.col[fid]
+            for i, row in enumerate(self.rows):
+                idx.setdefault(_norm(row[c]), []).append(i)
+            self._indexes[fid] = idx
+        return self._indexes[fid]
+
+def build_dataset(n_tickets: int, n_customers: int = 50, attachment_ratio: float = 0.0,
+                  seed: int = 7) -> Dict[str, FakeTable]:
+    """Deterministic Customers + Customer Support Tickets + Ticket Notes dataset."""
+    rnd = random.Random(seed)
+    today = date.today()
+    now = datetime.utcnow().replace(microsecond=0)
+    customers = []
+    for rid in range(1, n_customers + 1):
+        modified = (now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))).strftime("%Y-%m-%dT%H:%M:%SZ")
+        customers.append((
+            modified, modified, rid, f"Customer {rid:04d}", f"Contact {rid}", f"contact{rid}@example.com",
+            f"555-{rid:04d}", _ACCOUNT_TYPES[rid % 3], float(10000 + rnd.randint(0, 500) * 1000)
+        ))
+    tickets = []
+    for rid in range(1, n_tickets + 1):
+        cust = (rid % n_customers) + 1
+        modified = (now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))).strftime("%Y-%m-%dT%H:%M:%SZ")
+        has_file = rnd.random() < attachment_ratio
+        attachment = {
+            "url": f"/files/{TICKETS_TABLE_ID}/{rid}/13/1",
+            "versions": [{"versionNumber": 1, "fileName": f"ticket_{rid}.txt"}]
+        } if has_file else ""
+        tickets.append((
+            modified, modified, rid, f"T-{rid:06d}", _ISSUES[rid % len(_ISSUES)],
+            _PRIORITIES[rnd.randint(0, 3)], _STATUSES[rnd.randint(0, 2)],
+            (today - timedelta(days=rnd.randint(0, 365))).isoformat(),
+            cust, f"Customer {cust:04d}", attachment, has_file
+        ))
+    notes = []
+    for rid in range(1, n_tickets + 1):
+        # Two notes on each of the first half of the tickets, none on the rest
+        ticket = (rid - 1) // 2 + 1
+        modified = (now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))).strftime("%Y-%m-%dT%H:%M:%SZ")
+        notes.append((
+            modified, modified, rid, f"Update {rid % 2 + 1} on T-{ticket:06d}", _AUTHORS[rid % 3],
+            (today - timedelta(days=rnd.randint(0, 365))).isoformat(), ticket
+        ))
+    return {
+        CUSTOMERS_TABLE_ID: FakeTable(CUSTOMERS_TABLE_ID, "Customers", CUSTOMER_FIELDS, customers),
+        TICKETS_TABLE_ID: FakeTable(TICKETS_TABLE_ID, "Customer Support Tickets", TICKET_FIELDS, tickets),
+        NOTES_TABLE_ID: FakeTable(NOTES_TABLE_ID, "Ticket Notes", NOTE_FIELDS, notes),
+    }
+
+# ============================================================================
+# WHERE CLAUSE EVALUATION
+# ============================================================================
+def _norm(value: Any) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().lower()
+
+def _tokenize(where: str) -> List[Any]:
+    tokens, i, n = [], 0, len(where)
+    while i < n:
+        ch = where[i]
+        if ch.isspace():
+            i += 1
+        elif ch in "()":
+            tokens.append(ch)
+            i += 1
+        elif ch == "{":
+            j, in_quote, buf = i + 1, False, []
+            while j < n:
+                c = where[j]
+                if in_quote and c == "\\" and j + 1 < n:
+                    buf.append(where[j + 1])
+                    j += 2
+                    continue
+                if c == "'":
+                    in_quote = not in_quote
+                    buf.append(c)
+                elif c == "}" and not in_quote:
+                    break
+                else:
+                    buf.append(c)
+                j += 1
+            m = re.match(r"^\s*(\d+)\.([A-Z]+)\.(.*)$", "".join(buf), re.S)
+            if not m:
+                raise ValueError(f"Bad condition near position {i}")
+            raw = m.group(3).strip()
+            if len(raw) >= 2 and raw[0] == raw[-1] == "'":
+                raw = raw[1:-1]
+            tokens.append(("COND", int(m.group(1)), m.group(2), raw))
+            i = j + 1
+        elif where.startswith("AND", i):
+            tokens.append("AND")
+            i += 3
+        elif where.startswith("OR", i):
+            tokens.append("OR")
+            i += 2
+        else:
+            raise ValueError(f"Unexpected character {ch!r} in where clause")
+    return tokens
+
+def _parse(tokens: List[Any]) -> Any:
+    pos = 0
+
+    def parse_or():
+        nonlocal pos
+        node = parse_and()
+        while pos < len(tokens) and tokens[pos] == "OR":
+            pos += 1
+            node = ("OR", node, parse_and())
+        return node
+
+    def parse_and():
+        nonlocal pos
+        node = parse_atom()
+        while pos < len(tokens) and tokens[pos] == "AND":
+            pos += 1
+            node = ("AND", node, parse_atom())
+        return node
+
+    def parse_atom():
+        nonlocal pos
+        tok = tokens[pos]
+        pos += 1
+        if tok == "(":
+            node = parse_or()
+            pos += 1  # ')'
+            return node
+        return tok
+
+    return parse_or()
+
+_REL_RE = re.compile(r"^(?:today-(\d+)([dwmy])|(\d+) (day|week|month|year)s? ago|today)$")
+
+def _to_date(value: Any) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    text = str(value).strip()
+    m = _REL_RE.match(text)
+    if m:
+        if text == "today":
+            return date.today()
+        n = int(m.group(1) or m.group(3))
+        unit = (m.group(2) or m.group(4))[0]
+        days = {"d": 1, "w": 7, "m": 30, "y": 365}[unit] * n
+        return date.today() - timedelta(days=days)
+    for fmt in ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%d", "%m-%d-%Y"):
+        try:
+            return datetime.strptime(text[:20] if "T" in text else text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _matches(table: FakeTable, row: tuple, fid: int, op: str, raw: str) -> bool:
+    if fid not in table.col:
+        return False
+    value = row[table.col[fid]]
+    if op in ("OAF", "AF", "OBF", "BF"):
+        left, right = _to_date(value), _to_date(raw)
+        if left is None or right is None:
+            return False
+        return {"OAF": left >= right, "AF": left > right, "OBF": left <= right, "BF": left < right}[op]
+    if op in ("GT", "GTE", "LT", "LTE"):
+        try:
+            left, right = float(value), float(raw)
+        except (TypeError, ValueError):
+            return False
+        return {"GT": left > right, "GTE": left >= right, "LT": left < right, "LTE": left <= right}[op]
+    if op == "CT":
+        return _norm(raw) in _norm(value)
+    if op == "XEX":
+        return _norm(value) != _norm(raw)
+    return _norm(value) == _norm(raw)  # EX / TV
+
+def _evaluate(table: FakeTable, node: Any) -> set:
+    if node[0] == "COND":
+        _, fid, op, raw = node
+        if op in ("EX", "TV") and fid in table.col:
+            return set(table.value_index(fid).get(_norm(raw), ()))
+        return {i for i, row in enumerate(table.rows) if _matches(table, row, fid, op, raw)}
+    left, right = _evaluate(table, node[1]), _evaluate(table, node[2])
+    return left & right if node[0] == "AND" else left | right
+
+# ============================================================================
+# FAKE QUICKBASE SERVER
+# ============================================================================
+class _QuickbaseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeQuickbase/1.0"
+
+    def log_message(self, format, *args):  # silence per-request stderr logging
+        pass
+
+    def _send_json(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_bytes(json.dumps(payload).encode("utf-8"), "application/json", status, headers)
+
+    def _send_bytes(self, body: bytes, content_type: str, status: int = 200,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _gate(self, endpoint: str) -> bool:
+        """Count the request, apply latency and 429 injection. Returns False if throttled."""
+        srv = self.server
+        with srv.lock:
+            srv.stats[endpoint] = srv.stats.get(endpoint, 0) + 1
+            srv.total_requests += 1
+            throttle = srv.inject_429_every and srv.total_requests % srv.inject_429_every == 0
+            if throttle:
+                srv.stats["throttled"] = srv.stats.get("throttled", 0) + 1
+        if srv.latency_ms:
+            time.sleep(srv.latency_ms / 1000.0)
+        if throttle:
+            self._send_json({"message": "Too Many Requests"}, status=429, headers={"Retry-After": "1"})
+            return False
+        return True
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        query = parse_qs(parsed.query)
+        tables = self.server.tables
+        if path == "/_bench/stats":
+            with self.server.lock:
+                return self._send_json(dict(self.server.stats))
+        if path == "/_bench/reset":
+            with self.server.lock:
+                self.server.stats.clear()
+                self.server.total_requests = 0
+            return self._send_json({"ok": True})
+        if path == "/_bench/load":
+            self.server.tables = build_dataset(
+                int(query.get("n_tickets", ["1000"])[0]),
+                int(query.get("n_customers", ["50"])[0]),
+                float(query.get("attachment_ratio", ["0"])[0])
+            )
+            return self._send_json({"ok": True})
+        m = re.match(r"^/v1/files/([^/]+)/(\d+)/(\d+)/(\d+)$", path)
+        if m:
+            if not self._gate("files"):
+                return
+            body = f"Attachment for record {m.group(2)} field {m.group(3)} v{m.group(4)}\n".encode("utf-8")
+            return self._send_bytes(body * 32, "text/plain")
+        if path == "/v1/fields":
+            if not self._gate("fields"):
+                return
+            table = tables.get(query.get("tableId", [""])[0])
+            if not table:
+                return self._send_json({"message": "Table not found"}, status=404)
+            return self._send_json([{"id": fid, "label": label, "fieldType": ftype} for fid, label, ftype in table.fields])
+        m = re.match(r"^/v1/tables/([^/]+)/relationships$", path)
+        if m:
+            if not self._gate("relationships"):
+                return
+            rels = []
+            if m.group(1) == TICKETS_TABLE_ID:
+                rels.append({
+                    "id": TICKET_FK_FID,
+                    "parentTableId": CUSTOMERS_TABLE_ID,
+                    "childTableId": TICKETS_TABLE_ID,
+                    "foreignKeyField": {"id": TICKET_FK_FID, "label": "Related Customer", "type": "numeric"},
+                    "isCrossApp": False,
+                    "lookupFields": [{"id": 12, "label": "Customer Name", "type": "text"}],
+                    "summaryFields": []
+                })
+            if m.group(1) == NOTES_TABLE_ID:
+                rels.append({
+                    "id": NOTE_FK_FID,
+                    "parentTableId": TICKETS_TABLE_ID,
+                    "childTableId": NOTES_TABLE_ID,
+                    "foreignKeyField": {"id": NOTE_FK_FID, "label": "Related Ticket", "type": "numeric"},
+                    "isCrossApp": False,
+                    "lookupFields": [],
+                    "summaryFields": []
+                })
+            return self._send_json({"relationships": rels, "metadata": {"totalRelationships": len(rels)}})
+        m = re.match(r"^/v1/tables/([^/]+)$", path)
+        if m:
+            if not self._gate("tables"):
+                return
+            table = tables.get(m.group(1))
+            if not table:
+                return self._send_json({"message": "Table not found"}, status=404)
+            return self._send_json({"id": table.id, "name": table.name, "alias": f"_DBID_{table.name.upper()}"})
+        if path == "/v1/tables":
+            if not self._gate("tables"):
+                return
+            return self._send_json([{"id": t.id, "name": t.name} for t in tables.values()])
+        self._send_json({"message": f"Unknown endpoint {path}"}, status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        if path != "/v1/records/query":
+            return self._send_json({"message": f"Unknown endpoint {path}"}, status=404)
+        if not self._gate("records_query"):
+            return
+        body = json.loads(raw.decode("utf-8"))
+        table = self.server.tables.get(body.get("from"))
+        if not table:
+            return self._send_json({"message": "Table not found"}, status=404)
+        where = body.get("where")
+        try:
+            indices = sorted(_evaluate(table, _parse(_tokenize(where)))) if where else list(range(len(table.rows)))
+        except (ValueError, IndexError) as e:
+            return self._send_json({"message": f"Invalid query: {e}"}, status=400)
+        for sort in reversed(body.get("sortBy") or []):
+            fid = sort.get("fieldId")
+            if fid in table.col:
+                c = table.col[fid]
+                indices.sort(key=lambda i: (table.rows[i][c] is None, table.rows[i][c]),
+                             reverse=str(sort.get("order", "ASC")).upper() == "DESC")
+        options = body.get("options") or {}
+        skip = int(options.get("skip", 0))
+        top = int(options.get("top", 1000)) or 1000
+        if self.server.page_cap:
+            top = min(top, self.server.page_cap)
+        page = indices[skip:skip + top]
+        select = [f for f in (body.get("select") or [fid for fid, _, _ in table.fields]) if f in table.col]
+        data = [{str(fid): {"value": table.rows[i][table.col[fid]]} for fid in select} for i in page]
+        with self.server.lock:
+            self.server.stats["rows_returned"] = self.server.stats.get("rows_returned", 0) + len(data)
+        self._send_json({
+            "data": data,
+            "fields": [{"id": fid, "label": table.fields[table.col[fid]][1], "type": table.types[fid]} for fid in select],
+            "metadata": {"totalRecords": len(indices), "numRecords": len(data), "numFields": len(select), "skip": skip}
+        })
+
+def _serve(port_queue, n_tickets, n_customers, attachment_ratio, latency_ms, page_cap, inject_429_every):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _QuickbaseHandler)
+    server.daemon_threads = True
+    server.tables = build_dataset(n_tickets, n_customers, attachment_ratio)
+    server.lock = threading.Lock()
+    server.stats = {}
+    server.total_requests = 0
+    server.latency_ms = latency_ms
+    server.page_cap = page_cap
+    server.inject_429_every = inject_429_every
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+class FakeQuickbase:
+    """Controls a fake Quickbase API server running in a child process."""
+
+    def __init__(self, n_tickets: int = 1000, n_customers: int = 50, attachment_ratio: float = 0.0,
+                 latency_ms: float = 0.0, page_cap: Optional[int] = None, inject_429_every: int = 0):
+        self.args = (n_tickets, n_customers, attachment_ratio, latency_ms, page_cap, inject_429_every)
+        self.process = None
+        self.port = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self) -> "FakeQuickbase":
+        ctx = multiprocessing.get_context("spawn")
+        port_queue = ctx.Queue()
+        self.process = ctx.Process(target=_serve, args=(port_queue, *self.args), daemon=True)
+        self.process.start()
+        self.port = port_queue.get(timeout=120)
+        return self
+
+    def stop(self) -> None:
+        if self.process:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def _control(self, action: str) -> Dict[str, Any]:
+        import urllib.request
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_bench/{action}", timeout=300) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def load(self, n_tickets: int, n_customers: int = 50, attachment_ratio: float = 0.0) -> None:
+        """Regenerate the served dataset without restarting the server."""
+        self._control(f"load?n_tickets={n_tickets}&n_customers={n_customers}&attachment_ratio={attachment_ratio}")
+
+    def stats(self) -> Dict[str, Any]:
+        return self._control("stats")
+
+    def reset_stats(self) -> None:
+        self._control("reset")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+# ============================================================================
+# IN-PROCESS S3 / SLACK / CLOUDWATCH
+# ============================================================================
+class FakeS3:
+    """Minimal boto3 S3 client stand-in (objects kept in memory)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.calls: Dict[str, int] = {}
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs) -> Dict[str, Any]:
+        self._count("put_object")
+        data = Body.encode("utf-8") if isinstance(Body, str) else (Body.read() if hasattr(Body, "read") else bytes(Body))
+        with self.lock:
+            self.objects[(Bucket, Key)] = data
+        return {"ETag": f'"{hash(data) & 0xffffffff:08x}"'}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._count("get_object")
+        import io
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._count("head_object")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        self._count("create_multipart_upload")
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        with self.lock:
+            self.uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: Any, **kwargs) -> Dict[str, Any]:
+        self._count("upload_part")
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        with self.lock:
+            self.uploads[UploadId]["parts"][PartNumber] = data
+        return {"ETag": f'"{hash(data) & 0xffffffff:08x}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        self._count("complete_multipart_upload")
+        with self.lock:
+            upload = self.uploads.pop(UploadId)
+            numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+            self.objects[(Bucket, Key)] = b"".join(upload["parts"][n] for n in numbers)
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs) -> Dict[str, Any]:
+        self._count("abort_multipart_upload")
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600, **kwargs) -> str:
+        self._count("generate_presigned_url")
+        return f"https://fake-s3.local/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+    def bytes_stored(self) -> int:
+        with self.lock:
+            return sum(len(v) for v in self.objects.values())
+
+class FakeCloudWatch:
+    def __init__(self):
+        self.metrics: List[Dict[str, Any]] = []
+
+    def put_metric_data(self, Namespace: str, MetricData: List[Dict[str, Any]]) -> None:
+        self.metrics.extend(MetricData)
+
+class FakeSlack:
+    """Records chat.postMessage calls instead of hitting Slack."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages: List[Tuple[str, str]] = []
+
+    def send_slack_message(self, channel: str, text: str) -> Dict[str, Any]:
+        with self.lock:
+            self.messages.append((channel, text))
+        return {"ok": True, "channel": channel, "ts": f"{time.time():.6f}"}
+
+def install_fakes(s3: FakeS3, slack: FakeSlack, cloudwatch: Optional[FakeCloudWatch] = None) -> None:
+    """Swap the backend's AWS clients and Slack sender for the in-process stand-ins."""
+    import src.config, src.slack_utils
+    src.config._s3_client = s3
+    src.config._cloudwatch_client = cloudwatch or FakeCloudWatch()
+    src.slack_utils.send_slack_message = slack.send_slack_message
+
+def configure_environment(base_url: str) -> None:
+    """Environment the backend reads at import time; call before importing src."""
+    import os
+    os.environ["QB_API_BASE"] = base_url
+    os.environ.setdefault("QB_REALM", "bench.quickbase.com")
+    os.environ.setdefault("QB_USER_TOKEN", "bench-token")
+    os.environ.setdefault("QB_APP_ID", APP_ID)
+    os.environ.setdefault("S3_BUCKET_NAME", "bench-bucket")
+    os.environ.setdefault("AWS_REGION_NAME", "us-east-1")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("SLACK_CHANNEL_ID", "C0BENCH")
+    os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+def install_allow_lists() -> None:
+    """Replace ALLOW_LISTS contents in place so every module sees the bench tables."""
+    from field_allowlist import ALLOW_LISTS
+    ALLOW_LISTS.clear()
+    ALLOW_LISTS.update(json.loads(json.dumps(BENCH_ALLOW_LISTS)))
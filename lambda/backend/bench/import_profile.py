@@ -0,0 +1,95 @@
+"""
+Import-time profile for the Lambda entry points (a parsed `python -X importtime` report).
+
+Runs `import main` in a fresh interpreter for the backend and/or frontend Lambda and
+reports total import time plus the slowest modules by cumulative time. With
+--budget-ms the script exits non-zero when the total exceeds the budget, so it can
+guard cold-start cost in CI.
+
+Usage (from lambda/backend):
+    python -m bench.import_profile
+    python -m bench.import_profile --target frontend --top 15
+    python -m bench.import_profile --budget-ms 150 --repeat 5
+"""
+import argparse, json, os, re, statistics, subprocess, sys
+from typing import Any, Dict, List
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TARGETS = {
+    "backend": os.path.join(LAMBDA_DIR, "backend"),
+    "frontend": os.path.join(LAMBDA_DIR, "frontend"),
+}
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+def profile_once(target_dir: str, module: str = "main") -> List[Dict[str, Any]]:
+    """Import `module` in a fresh interpreter and return per-module self/cumulative microseconds."""
+    env = dict(os.environ)
+    env.setdefault("DEMO_MODE", "true")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=target_dir, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed in {target_dir}:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(4).strip(),
+                "self_us": int(m.group(1)),
+                "cumulative_us": int(m.group(2)),
+                "depth": len(m.group(3)) // 2,
+            })
+    return rows
+
+def report(target: str, repeat: int, top: int) -> Dict[str, Any]:
+    runs = [profile_once(TARGETS[target]) for _ in range(repeat)]
+    totals = [next((r["cumulative_us"] for r in rows if r["module"] == "main"), 0) for rows in runs]
+    # Use the median run for the per-module breakdown
+    median_total = statistics.median(totals)
+    rows = min(runs, key=lambda rs: abs(next((r["cumulative_us"] for r in rs if r["module"] == "main"), 0) - median_total))
+    top_level = [r for r in rows if r["depth"] <= 1 and r["module"] != "main"]
+    return {
+        "target": target,
+        "runs": repeat,
+        "main_import_ms": {
+            "median": round(median_total / 1000, 2),
+            "min": round(min(totals) / 1000, 2),
+            "max": round(max(totals) / 1000, 2),
+        },
+        "modules_imported": len(rows),
+        "slowest": [
+            {"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 2), "self_ms": round(r["self_us"] / 1000, 2)}
+            for r in sorted(top_level, key=lambda r: -r["cumulative_us"])[:top]
+        ],
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["backend", "frontend", "all"], default="backend")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if median `import main` exceeds this")
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args()
+
+    targets = list(TARGETS) if args.target == "all" else [args.target]
+    reports = [report(t, args.repeat, args.top) for t in targets]
+    over_budget = False
+    for rep in reports:
+        ms = rep["main_import_ms"]
+        print(f"== {rep['target']}: import main median {ms['median']} ms "
+              f"(min {ms['min']}, max {ms['max']}, {rep['modules_imported']} modules) ==")
+        for r in rep["slowest"]:
+            print(f"  {r['cumulative_ms']:>9.2f} ms  (self {r['self_ms']:>7.2f})  {r['module']}")
+        if args.budget_ms is not None and ms["median"] > args.budget_ms:
+            print(f"  OVER BUDGET: {ms['median']} ms > {args.budget_ms} ms")
+            over_budget = True
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Event replay load generator for lambda_handler.
+
+Replays recorded Bedrock action-group events (the "parameters" format parsed by
+extract_bedrock_parameters) against the local stand-ins at a configurable rate and
+concurrency. Cold starts are simulated by dropping the backend modules from
+sys.modules and re-importing main (after draining in-flight requests, as a new
+container would).
+
+Input is JSON Lines; each line is either a raw event or {"label": ..., "event": {...}}.
+
+Usage (from lambda/backend):
+    python -m bench.replay bench/events/sample_events.jsonl --concurrency 8 --rate 20 --iterations 10
+    python -m bench.replay events.jsonl --cold-ratio 0.1 --latency-ms 30 --rows 20000
+"""
+import argparse, importlib, json, os, random, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fakes import (
+    FakeQuickbase, FakeS3, FakeSlack, FakeCloudWatch, configure_environment, install_fakes, install_allow_lists
+)
+
+BACKEND_MODULE_PREFIXES = ("main", "src", "field_allowlist")
+
+def load_events(path: str) -> List[Dict[str, Any]]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            event = item.get("event", item)
+            label = item.get("label") or event.get("function", "unknown")
+            events.append({"label": label, "event": event})
+    return events
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class BackendContainer:
+    """Holds the imported backend; reload() simulates a fresh Lambda container."""
+
+    def __init__(self, s3: FakeS3, slack: FakeSlack):
+        self.s3 = s3
+        self.slack = slack
+        self.main = None
+        self.cold_starts = 0
+
+    def reload(self) -> float:
+        for name in list(sys.modules):
+            if name.split(".")[0] in BACKEND_MODULE_PREFIXES:
+                del sys.modules[name]
+        start = time.perf_counter()
+        install_allow_lists()
+        self.main = importlib.import_module("main")
+        install_fakes(self.s3, self.slack, FakeCloudWatch())
+        self.cold_starts += 1
+        return time.perf_counter() - start
+
+    def invoke(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        from src.cache_utils import track_cache_lookups
+        with track_cache_lookups() as lookups:
+            response = self.main.lambda_handler(event, None)
+        return {"response": response, "lookups": lookups}
+
+def _is_error(response: Dict[str, Any]) -> bool:
+    try:
+        body = response["response"]["functionResponse"]["responseBody"]["TEXT"]["body"]
+        return not json.loads(body).get("ok", False)
+    except (KeyError, TypeError, ValueError):
+        return True
+
+def run(events: List[Dict[str, Any]], args: argparse.Namespace, container: BackendContainer) -> List[Dict[str, Any]]:
+    rnd = random.Random(args.seed)
+    samples: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    schedule = [e for _ in range(args.iterations) for e in events]
+    if args.shuffle:
+        rnd.shuffle(schedule)
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+
+    def worker(item: Dict[str, Any], cold: bool, import_seconds: float) -> None:
+        start = time.perf_counter()
+        error = None
+        lookups: Dict[str, Dict[str, int]] = {}
+        try:
+            out = container.invoke(item["event"])
+            lookups = out["lookups"]
+            failed = _is_error(out["response"])
+        except Exception as e:  # lambda_handler should never raise; count it if it does
+            failed, error = True, repr(e)
+        latency = time.perf_counter() - start + import_seconds
+        with lock:
+            samples.append({
+                "label": item["label"], "latency": latency, "error": failed, "exception": error,
+                "cold": cold, "lookups": lookups
+            })
+
+    pending = set()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, item in enumerate(schedule):
+            if interval:
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            cold = container.main is None or rnd.random() < args.cold_ratio
+            import_seconds = 0.0
+            if cold:
+                # A new container only starts once the old one's in-flight work is irrelevant;
+                # drain so the module swap never races a running handler.
+                wait(pending)
+                pending.clear()
+                import_seconds = container.reload()
+            pending = {f for f in pending if not f.done()}
+            pending.add(pool.submit(worker, item, cold, import_seconds))
+        wait(pending)
+    return samples
+
+def summarize(samples: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    by_label: Dict[str, List[Dict[str, Any]]] = {}
+    for s in samples:
+        by_label.setdefault(s["label"], []).append(s)
+    report = {"total": len(samples), "wall_seconds": round(wall_seconds, 3),
+              "throughput_per_sec": round(len(samples) / wall_seconds, 2) if wall_seconds else None, "by_label": {}}
+    for label, group in sorted(by_label.items()):
+        lat = [s["latency"] * 1000 for s in group]
+        warm = [s["latency"] * 1000 for s in group if not s["cold"]]
+        cold = [s["latency"] * 1000 for s in group if s["cold"]]
+        hits = misses = 0
+        per_cache: Dict[str, Dict[str, int]] = {}
+        for s in group:
+            for name, c in s["lookups"].items():
+                agg = per_cache.setdefault(name, {"hits": 0, "misses": 0})
+                agg["hits"] += c["hits"]
+                agg["misses"] += c["misses"]
+                hits += c["hits"]
+                misses += c["misses"]
+        report["by_label"][label] = {
+            "count": len(group),
+            "error_rate": round(sum(1 for s in group if s["error"]) / len(group), 4),
+            "p50_ms": _round(percentile(lat, 50)),
+            "p95_ms": _round(percentile(lat, 95)),
+            "p99_ms": _round(percentile(lat, 99)),
+            "warm_p50_ms": _round(percentile(warm, 50)),
+            "cold_count": len(cold),
+            "cold_p50_ms": _round(percentile(cold, 50)),
+            "cache_hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "cache_hit_ratio_by_cache": {
+                name: round(c["hits"] / (c["hits"] + c["misses"]), 4) for name, c in per_cache.items()
+                if c["hits"] + c["misses"]
+            },
+            "exceptions": sorted({s["exception"] for s in group if s["exception"]})[:3],
+        }
+    return report
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("events", help="JSONL file of recorded Bedrock action-group events")
+    parser.add_argument("--rate", type=float, default=0.0, help="Events per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=1, help="Replay the file this many times")
+    parser.add_argument("--shuffle", action="store_true")
+    parser.add_argument("--cold-ratio", type=float, default=0.0, help="Probability an event lands on a cold container")
+    parser.add_argument("--rows", type=int, default=2000, help="Ticket rows served by the fake Quickbase")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--page-cap", type=int, default=None)
+    parser.add_argument("--inject-429-every", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    events = load_events(args.events)
+    if not events:
+        parser.error("no events found")
+    qb = FakeQuickbase(
+        n_tickets=args.rows, latency_ms=args.latency_ms,
+        page_cap=args.page_cap, inject_429_every=args.inject_429_every
+    ).start()
+    configure_environment(qb.base_url)
+    container = BackendContainer(FakeS3(), FakeSlack())
+    try:
+        started = time.perf_counter()
+        samples = run(events, args, container)
+        report = summarize(samples, time.perf_counter() - started)
+    finally:
+        qb.stop()
+    report["cold_starts"] = container.cold_starts
+    report["slack_posts"] = len(container.slack.messages)
+    report["s3_calls"] = dict(container.s3.calls)
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
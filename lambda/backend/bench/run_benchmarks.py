@@ -0,0 +1,172 @@
+"""
+Offline benchmark suite for the backend hot paths.
+
+Runs handle_single_table, handle_parent_child, format_record and generate_summary
+against the local stand-ins in bench/fakes.py and reports throughput, call counts
+and peak memory. The pipeline_rows / pipeline_batch cases compare row dicts with the
+columnar RecordBatch from fetched pages through formatting, summary and CSV export.
+
+Usage (from lambda/backend):
+    python -m bench.run_benchmarks                      # 1k, 20k, 100k rows
+    python -m bench.run_benchmarks --sizes 1000 --latency-ms 20 --page-cap 500
+    python -m bench.run_benchmarks --json results.json
+"""
+import argparse, gc, json, os, sys, time, tracemalloc
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fakes import (
+    FakeQuickbase, FakeS3, FakeSlack, FakeCloudWatch, configure_environment, install_fakes,
+    install_allow_lists, CUSTOMERS_TABLE_ID, TICKETS_TABLE_ID
+)
+
+DEFAULT_SIZES = [1000, 20000, 100000]
+N_PARENTS = 50
+# Rows per simulated /records/query page for the pipeline cases
+PAGE_SIZE = 1000
+
+def _tables():
+    customers = {"id": CUSTOMERS_TABLE_ID, "name": "Customers"}
+    tickets = {"id": TICKETS_TABLE_ID, "name": "Customer Support Tickets"}
+    return customers, tickets
+
+def _parsed(tables: List[Dict[str, str]], mode: str) -> Dict[str, Any]:
+    return {
+        "mode": mode,
+        "tables": tables,
+        "names": [],
+        "formats": ["csv"],
+        "original_prompt": "benchmark",
+        "date_filter_value": None,
+        "date_filter_unit": None,
+        "sort_by": None,
+        "sort_order": "DESC"
+    }
+
+def _measure(fn: Callable[[], Any], rows: int, memory: bool) -> Dict[str, Any]:
+    gc.collect()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    result = {
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mb"] = round(peak / (1024 * 1024), 2)
+    return result
+
+def run_size(qb: FakeQuickbase, n_rows: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from src.cache_utils import clear_all_caches
+    from src.query_handlers import handle_single_table, handle_parent_child
+    from src.quickbase_api import quickbase_query
+    from src.formatters import format_record
+    from src.summary import generate_summary, SummaryBuilder
+    from src.formatters import format_batch
+    from src.record_batch import RecordBatch
+    from src.exports import save_to_s3, save_batch_to_s3
+    from field_allowlist import ALLOW_LISTS
+
+    customers, tickets = _tables()
+    qb.load(n_rows, N_PARENTS, args.attachment_ratio)
+    results = []
+
+    def case(name: str, fn: Callable[[], Any], rows: int, warm: bool = True) -> None:
+        s3, slack = FakeS3(), FakeSlack()
+        install_fakes(s3, slack, FakeCloudWatch())
+        clear_all_caches()
+        if warm:
+            fn()  # populate field-map / relationship caches, as a warm Lambda would have
+        qb.reset_stats()
+        s3.calls.clear()
+        slack.messages.clear()
+        timing = _measure(fn, rows, memory=not args.no_memory)
+        runs = 2 if not args.no_memory else 1
+        stats = qb.stats()
+        results.append({
+            "case": name,
+            "rows": rows,
+            **timing,
+            "qb_requests": {k: v // runs for k, v in stats.items()},
+            "s3_calls": {k: v // runs for k, v in s3.calls.items()},
+            "slack_posts": len(slack.messages) // runs,
+        })
+        print(_format_row(results[-1]), flush=True)
+
+    case("handle_single_table", lambda: handle_single_table(_parsed([tickets], "single"), n_rows), n_rows)
+    case("handle_parent_child", lambda: handle_parent_child(_parsed([customers, tickets], "parent+child"), N_PARENTS), n_rows)
+
+    raw_rows = quickbase_query(tickets["id"], {}, max_records=n_rows)
+    labels = ALLOW_LISTS[tickets["name"]]["fields"]
+    case("format_record", lambda: [format_record(r, tickets, field_labels=labels) for r in raw_rows], len(raw_rows))
+    formatted = [format_record(r, tickets, field_labels=labels) for r in raw_rows]
+    case("generate_summary", lambda: generate_summary(formatted, tickets["name"], "Bench"), len(formatted))
+
+    # Row dicts vs the columnar RecordBatch, from fetched pages to the uploaded CSV
+    fids = list(raw_rows[0]) if raw_rows else []
+    pages = [raw_rows[i:i + PAGE_SIZE] for i in range(0, len(raw_rows), PAGE_SIZE)]
+
+    def rows_pipeline() -> None:
+        records = [format_record(r, tickets, field_labels=labels) for page in pages for r in page]
+        generate_summary(records, tickets["name"], "Bench")
+        save_to_s3(records, record_name="bench")
+
+    def batch_pipeline() -> None:
+        batch = RecordBatch.for_table(tickets, fids)
+        for page in pages:
+            batch.append_page(page)
+        records = format_batch(batch, tickets, field_labels=labels)
+        summary = SummaryBuilder()
+        summary.add_batch(records)
+        summary.build(tickets["name"], "Bench")
+        save_batch_to_s3(records, record_name="bench")
+
+    case("pipeline_rows", rows_pipeline, len(raw_rows))
+    case("pipeline_batch", batch_pipeline, len(raw_rows))
+    return results
+
+def _format_row(r: Dict[str, Any]) -> str:
+    qb_total = sum(v for k, v in r["qb_requests"].items() if k not in ("rows_returned", "throttled"))
+    return (
+        f"{r['case']:<22} rows={r['rows']:>7}  {r['seconds']:>8.3f}s  {r['rows_per_sec'] or 0:>11.1f} rows/s  "
+        f"peak={r.get('peak_mb', '-'):>7} MB  qb_req={qb_total:<5} s3={sum(r['s3_calls'].values()):<5} "
+        f"slack={r['slack_posts']}"
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Per-request latency added by the fake Quickbase")
+    parser.add_argument("--page-cap", type=int, default=None, help="Max records the fake Quickbase returns per page")
+    parser.add_argument("--inject-429-every", type=int, default=0, help="Return HTTP 429 for every Nth request")
+    parser.add_argument("--attachment-ratio", type=float, default=0.0, help="Fraction of tickets with a file attachment")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    qb = FakeQuickbase(
+        n_tickets=0, n_customers=N_PARENTS, latency_ms=args.latency_ms,
+        page_cap=args.page_cap, inject_429_every=args.inject_429_every
+    ).start()
+    configure_environment(qb.base_url)
+    install_allow_lists()
+
+    all_results = []
+    try:
+        for size in args.sizes:
+            print(f"== {size} rows ==", flush=True)
+            all_results.extend(run_size(qb, size, args))
+    finally:
+        qb.stop()
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "results": all_results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,9 @@
 # If no [DATE] marker, auto-detection will find fields with "date", "created", "opened", etc.
 # [RELATED KEY] fields will be combined with [KEY] fields in searches using OR logic.
 # [UNIQUE] fields are only searched when query contains matching keywords (ticket→Ticket ID, email→Email, etc.)
+#
+# Optional "aliases" list per table: extra names the table resolves by (e.g. "aliases": ["Tickets", "Support Cases"]).
+# Table names also match case/punctuation/plural-insensitively, and close misspellings are suggested or resolved.
 
 ALLOW_LISTS = {
     "Customers": {
@@ -2,7 +2,7 @@ import os, json, time, traceback, logging
 from datetime import datetime
 from typing import Any, Dict
 
-# Setup structured logging
+# Setup structured logging (level and per-invocation budget applied by configure_logging)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s %(name)s %(message)s'
@@ -12,14 +12,32 @@ logger = logging.getLogger("quickbase-agent")
 from src.config import *
 from src.cache_utils import clear_all_caches, get_cache_stats
 from src.bedrock_integration import extract_bedrock_parameters, validate_and_match_tables, format_bedrock_response
-from src.query_handlers import handle_single_table, handle_parent_child
+from src.query_handlers import handle_single_table, handle_parent_child, handle_multi_table
 from src.table_relationships import send_cloudwatch_metrics
+from src.report_cache import report_cache_key, get_cached_report, store_report
+from src.log_utils import LazyJson, configure_logging, reset_log_budget, log_budget_summary
+from src.response_governor import govern_response
+from src.memory_utils import reset_memory_tracking, log_memory_summary, memory_metrics
+from src.deadline import start_deadline, current_deadline
+from src.circuit_breaker import breaker_metrics
+
+configure_logging()
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Hybrid approach: LLM extracts tables, Lambda validates and executes.
     Handles both query_simple and query_advanced functions.
     """
+    reset_log_budget()
+    reset_memory_tracking(context)
+    start_deadline(context)
+    try:
+        return _handle_event(event, context)
+    finally:
+        log_memory_summary()
+        log_budget_summary()
+
+def _handle_event(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if os.getenv("DEBUG_MODE", "false").lower() == "true":
         clear_all_caches()
     start_time = time.time()
@@ -27,50 +45,21 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     def log_action(service, action):
         actions.append({"service": service, "action": action})
     try:
-        logger.info(json.dumps({
-            "event": event,
-            "message": "Received event"
-        }, default=str))
         function_name = event.get('function', 'query_simple')
+        logger.info("Received event: function=%s actionGroup=%s", function_name, event.get('actionGroup'))
+        logger.debug("Raw event: %s", LazyJson(event))
         params = extract_bedrock_parameters(event)
-        logger.info(json.dumps({
+        logger.info("Extracted parameters: %s", LazyJson({
             "function": function_name,
-            "params": {
-                "prompt": params.get('prompt'),
-                "table_names": params.get('table_names'),
-                "entity_names": params.get('entity_names'),
-                "limit": params.get('limit', 50),
-                "date_filter_value": params.get('date_filter_value'),
-                "date_filter_unit": params.get('date_filter_unit'),
-                "sort_field": params.get('sort_field'),
-                "sort_order": params.get('sort_order', 'DESC')
-            },
-            "message": "Extracted parameters"
-        }, default=str))
-        # Additional logging for specific parameters if needed
-        if function_name == 'query_simple':
-            if params.get('entity_names'):
-                logger.info(json.dumps({
-                    "entity_names": params['entity_names'],
-                    "message": "Entity Names"
-                }))
-            logger.info(json.dumps({
-                "limit": params.get('limit', 50),
-                "message": "Limit"
-            }))
-        elif function_name == 'query_advanced':
-            if params.get('date_filter_value') and params.get('date_filter_unit'):
-                logger.info(json.dumps({
-                    "date_filter_value": params['date_filter_value'],
-                    "date_filter_unit": params['date_filter_unit'],
-                    "message": "Date Filter"
-                }))
-            if params.get('sort_field'):
-                logger.info(json.dumps({
-                    "sort_field": params['sort_field'],
-                    "sort_order": params.get('sort_order', 'DESC'),
-                    "message": "Sort Field"
-                }))
+            "prompt": params.get('prompt'),
+            "table_names": params.get('table_names'),
+            "entity_names": params.get('entity_names'),
+            "limit": params.get('limit', 50),
+            "date_filter_value": params.get('date_filter_value'),
+            "date_filter_unit": params.get('date_filter_unit'),
+            "sort_field": params.get('sort_field'),
+            "sort_order": params.get('sort_order', 'DESC')
+        }))
         if not params.get('prompt'):
             raise ValueError("Missing required parameter: prompt")
         if not params.get('table_names'):
@@ -78,10 +67,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         validation = validate_and_match_tables(params['table_names'], QB_APP_ID)
         if validation.get('needs_clarification'):
             elapsed = time.time() - start_time
-            logger.warning(json.dumps({
-                "message": "Table validation failed",
-                "elapsed": elapsed
-            }))
+            logger.warning("Table validation failed (elapsed %.3fs)", elapsed)
             # Do not include actions in clarification response
             return format_bedrock_response(event, {
                 "ok": False,
@@ -90,7 +76,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 "details": {
                     "type": "table_not_found",
                     "requested": params['table_names'],
-                    "available": validation['available_tables']
+                    "available": validation['available_tables'],
+                    "suggestions": validation.get('suggestions', [])
                 }
             })
         parsed = {
@@ -104,55 +91,75 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             "sort_by": params.get('sort_field'),
             "sort_order": params.get('sort_order', 'DESC')
         }
-        logger.debug(json.dumps({
-            "mode": parsed['mode'],
-            "tables": [t['name'] for t in parsed['tables']],
-            "message": "Parsed mode and tables"
-        }))
+        logger.debug("Parsed mode '%s' for tables %s", parsed['mode'], [t['name'] for t in parsed['tables']])
         results = []
-        # Log Quickbase query action
-        log_action("Quickbase", f"Queried tables: {[t['name'] for t in parsed['tables']]}")
-        if parsed["mode"] == "single":
-            results = handle_single_table(parsed, params.get('limit', 50))
-            log_action("Slack", "Sent notification to Slack channel")
-            log_action("S3", "Stored CSV report and generated presigned URL")
-        elif parsed["mode"] == "parent+child":
-            results = handle_parent_child(parsed, params.get('limit', 50))
-            log_action("Slack", "Sent notification to Slack channel")
-            log_action("S3", "Stored CSV report and generated presigned URL")
+        limit = params.get('limit', 50)
+        report_key = report_cache_key(function_name, parsed, limit)
+        cached_results = get_cached_report(report_key)
+        if cached_results is not None:
+            # Identical request within the TTL: reuse the report, skip the duplicate Slack post
+            results = cached_results
+            log_action("Cache", "Reused recent identical report (Slack notification skipped)")
+            log_action("S3", "Generated fresh presigned URL for existing CSV report")
+        else:
+            # Log Quickbase query action
+            log_action("Quickbase", f"Queried tables: {[t['name'] for t in parsed['tables']]}")
+            if parsed["mode"] == "single":
+                results = handle_single_table(parsed, limit)
+                log_action("Slack", "Sent notification to Slack channel")
+                log_action("S3", "Stored CSV report and generated presigned URL")
+            elif parsed["mode"] == "parent+child":
+                results = handle_parent_child(parsed, limit)
+                log_action("Slack", "Sent notification to Slack channel")
+                log_action("S3", "Stored CSV report and generated presigned URL")
+            elif parsed["mode"] == "multi":
+                results = handle_multi_table(parsed, limit)
+                log_action("Slack", "Sent notification to Slack channel")
+                log_action("S3", "Stored report and generated presigned URL")
+            # A report cut short by the deadline or by a failing dependency is not reused
+            # for the next identical request
+            if not current_deadline().partial and not any(r.get("error") for r in results):
+                store_report(report_key, results)
+        continuation = current_deadline().summary()
         elapsed = time.time() - start_time
         cache_stats = get_cache_stats()
-        logger.info(json.dumps({
-            "actions": actions,
-            "message": "Action log"
-        }))
-        logger.info(json.dumps({
+        logger.info("Action log: %s", LazyJson(actions))
+        logger.info("Report generation summary: %s", LazyJson({
             "result_count": len(results),
             "elapsed": elapsed,
-            "cache_stats": cache_stats,
-            "message": "Report generation summary"
+            "cache_stats": cache_stats
         }))
         send_cloudwatch_metrics([
             {'MetricName': 'ReportsGenerated', 'Value': len(results), 'Unit': 'Count', 'Timestamp': datetime.utcnow()},
             {'MetricName': 'ExecutionTime', 'Value': elapsed, 'Unit': 'Seconds', 'Timestamp': datetime.utcnow()},
-            {'MetricName': 'SuccessfulInvocations', 'Value': 1, 'Unit': 'Count', 'Timestamp': datetime.utcnow()}
-        ])
+            {'MetricName': 'SuccessfulInvocations', 'Value': 1, 'Unit': 'Count', 'Timestamp': datetime.utcnow()},
+            {'MetricName': 'PartialResults', 'Value': 1 if continuation else 0, 'Unit': 'Count', 'Timestamp': datetime.utcnow()}
+        ] + [{**m, 'Timestamp': datetime.utcnow()} for m in memory_metrics() + breaker_metrics()])
         # Guarantee 'actions' is always present in the response
         if not actions:
             actions = []
-        return format_bedrock_response(event, {
+        response = {
             "ok": True,
             "reports": results,
             "summary": f"Processed {len(results)} record(s)",
             "actions": actions
-        })
+        }
+        entity_matches = next((r["entity_matches"] for r in results if r.get("entity_matches")), None)
+        if entity_matches:
+            # Names that were not found as written: say what they were matched to
+            response["entity_matches"] = entity_matches
+            response["summary"] += " (matched: " + ", ".join(
+                f"'{m['requested']}' → '{m['matched']}' ({m['score']:.2f})" for m in entity_matches
+            ) + ")"
+        if continuation:
+            # Ran out of time: what was fetched is exported; say what is missing and how to get it
+            response["partial"] = True
+            response["continuation"] = continuation
+            response["summary"] += " (partial: stopped before the Lambda timeout)"
+        # Trimmed to the response budget; report URLs always survive
+        return format_bedrock_response(event, govern_response(response))
     except Exception as e:
         elapsed = time.time() - start_time
-        logger.error(json.dumps({
-            "error": str(e),
-            "elapsed": elapsed,
-            "trace": traceback.format_exc(),
-            "message": "Exception occurred"
-        }))
-    # Do not include actions in error response
-    return format_bedrock_response(event, {"ok": False, "error": str(e)})
+        logger.error("Exception occurred after %.3fs: %s\n%s", elapsed, e, traceback.format_exc())
+        # Do not include actions in error response
+        return format_bedrock_response(event, {"ok": False, "error": str(e)})
@@ -0,0 +1,189 @@
+import re, time, zipfile, logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterator
+
+from src.config import get_s3_client, S3_BUCKET, ATTACHMENT_ARCHIVE_MODE, ATTACHMENT_ARCHIVE_PART_SIZE
+from src.attachments import download_attachment, EXTENSIONS
+from src.exports import presign_s3_key
+from src.circuit_breaker import get_breaker
+
+logger = logging.getLogger("quickbase-agent")
+
+# S3 rejects multipart parts below 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Already-compressed formats are stored as-is; deflating them only costs CPU
+STORED_TYPES = {"application/pdf", "image/png", "image/jpeg", "application/zip", "application/gzip"}
+
+_active_archive: ContextVar[Optional["AttachmentArchive"]] = ContextVar("attachment_archive", default=None)
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("._") or "file"
+
+class _MultipartWriter:
+    """
+    Write-only, non-seekable stream that uploads to S3 in parts as it fills.
+    Nothing is sent until a full part is buffered, so small archives end up as a
+    single put_object and only large ones pay for the multipart round trips.
+    """
+
+    def __init__(self, key: str, part_size: int):
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.parts: List[Dict[str, Any]] = []
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _upload_part(self, data: bytes) -> None:
+        s3 = get_s3_client()
+        if self.upload_id is None:
+            with get_breaker("s3").guard():
+                self.upload_id = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=self.key, ContentType="application/zip")["UploadId"]
+        number = len(self.parts) + 1
+        with get_breaker("s3").guard():
+            etag = s3.upload_part(Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data)["ETag"]
+        self.parts.append({"PartNumber": number, "ETag": etag})
+
+    def complete(self) -> None:
+        s3 = get_s3_client()
+        if self.upload_id is None:
+            with get_breaker("s3").guard():
+                s3.put_object(Bucket=S3_BUCKET, Key=self.key, Body=bytes(self.buffer), ContentType="application/zip")
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            with get_breaker("s3").guard():
+                s3.complete_multipart_upload(
+                    Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+                )
+        self.buffer = bytearray()
+
+    def abort(self) -> None:
+        if self.upload_id is not None:
+            try:
+                get_s3_client().abort_multipart_upload(Bucket=S3_BUCKET, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logger.warning("Failed to abort multipart upload for %s: %s", self.key, e)
+        self.buffer = bytearray()
+
+class AttachmentArchive:
+    """
+    One zip per report: attachments are downloaded from Quickbase and streamed straight
+    into the archive, which is uploaded to S3 in parts. format_record() writes the path
+    inside the archive into the report instead of a per-file presigned URL.
+    """
+
+    def __init__(self, record_name: str, part_size: int = ATTACHMENT_ARCHIVE_PART_SIZE):
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        self.key = f"reports/{_safe(record_name)}_{timestamp}_attachments.zip"
+        self.writer = _MultipartWriter(self.key, part_size)
+        self.zip = zipfile.ZipFile(self.writer, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self.paths: Dict[tuple, str] = {}
+        self.names: set = set()
+        self.started = time.time()
+        self.failed = False
+
+    def _path(self, table: Dict[str, str], record_id: int, file_name: Optional[str], content_type: str) -> str:
+        name = _safe(file_name) if file_name else f"file{EXTENSIONS.get(content_type, '.bin')}"
+        path = f"{_safe(table['name'].lower())}/{record_id}/{name}"
+        stem, dot, ext = path.rpartition(".") if "." in name else (path, "", "")
+        n = 2
+        while path in self.names:
+            path = f"{stem}_{n}{dot}{ext}" if dot else f"{stem}_{n}"
+            n += 1
+        return path
+
+    def add(self, table: Dict[str, str], record_id: int, field_id: int, version: int = 1,
+            file_name: Optional[str] = None) -> Optional[str]:
+        """Stream one attachment into the archive; returns its path inside the zip (None on failure)."""
+        cache_key = (table["id"], record_id, field_id, version)
+        if cache_key in self.paths:
+            return self.paths[cache_key]
+        if self.failed or get_breaker("s3").rejecting():
+            # Nowhere to put it: do not spend a Quickbase download on it
+            return None
+        try:
+            data, content_type = download_attachment(table["id"], record_id, field_id, version)
+        except Exception as e:
+            logger.error("Attachment download failed for record %s: %s", record_id, e)
+            return None
+        path = self._path(table, record_id, file_name, content_type)
+        info = zipfile.ZipInfo(path, date_time=time.gmtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if content_type in STORED_TYPES else zipfile.ZIP_DEFLATED
+        try:
+            self.zip.writestr(info, data)
+        except Exception as e:
+            # S3 rejected a part: the report goes out without its archive rather than failing
+            logger.error("Attachment archive upload failed for %s; skipping remaining attachments: %s", self.key, e)
+            self.failed = True
+            self.abort()
+            return None
+        self.names.add(path)
+        self.paths[cache_key] = path
+        return path
+
+    def close(self) -> Optional[str]:
+        """Finish the upload and return one presigned URL for the archive (None if it is empty or failed)."""
+        if self.failed:
+            return None
+        self.zip.close()
+        if not self.names:
+            self.writer.abort()
+            return None
+        self.writer.complete()
+        logger.info(
+            "Uploaded attachment archive s3://%s/%s: %d file(s), %.1fKB in %d part(s), %.2fs",
+            S3_BUCKET, self.key, len(self.names), self.writer.size / 1000,
+            max(1, len(self.writer.parts)), time.time() - self.started
+        )
+        return presign_s3_key(self.key)
+
+    def abort(self) -> None:
+        try:
+            self.zip.close()
+        except Exception:
+            pass
+        self.writer.abort()
+
+def current_archive() -> Optional[AttachmentArchive]:
+    """The archive collecting attachments for the report being built, if any."""
+    return _active_archive.get()
+
+@contextmanager
+def attachment_archive(record_name: str) -> Iterator[Dict[str, Optional[str]]]:
+    """
+    Collect every attachment formatted inside the block into one zip (when
+    ATTACHMENT_ARCHIVE_MODE is on). Yields a dict whose "url" is set on exit to the
+    archive's presigned URL, or left None when nothing was archived.
+    """
+    result: Dict[str, Optional[str]] = {"url": None}
+    if not ATTACHMENT_ARCHIVE_MODE:
+        yield result
+        return
+    archive = AttachmentArchive(record_name)
+    token = _active_archive.set(archive)
+    try:
+        yield result
+    except BaseException:
+        archive.abort()
+        raise
+    finally:
+        _active_archive.reset(token)
+    try:
+        result["url"] = archive.close()
+    except Exception as e:
+        logger.error("Failed to upload attachment archive %s: %s", archive.key, e)
+        archive.abort()
@@ -1,9 +1,49 @@
-import base64, json, urllib.request, ssl, re
-from typing import Optional, Any
+import base64, json, urllib.request, ssl, re, logging
+from typing import Optional, Any, Tuple
 from datetime import datetime
 
-from src.config import s3, S3_BUCKET, PRESIGNED_URL_EXPIRATION
-from src.quickbase_api import qb_headers
+from src.config import get_s3_client, S3_BUCKET, PRESIGNED_URL_EXPIRATION, QB_API_BASE
+from src.quickbase_api import qb_headers, get_ssl_context, qb_rate_limiter, qb_call
+from src.circuit_breaker import get_breaker
+from src.deadline import current_deadline
+
+logger = logging.getLogger("quickbase-agent")
+
+# Socket timeout for file downloads when the request deadline is not close
+ATTACHMENT_TIMEOUT_SECONDS = 60
+
+EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "text/plain": ".txt",
+    "application/rtf": ".rtf",
+    "application/json": ".json",
+    "text/csv": ".csv",
+}
+
+def download_attachment(table_id: str, record_id: int, field_id: int, version: int = 1) -> Tuple[bytes, str]:
+    """
+    Download a file field version from Quickbase as (bytes, content type).
+    Base64-encoded RTF is decoded back to RTF.
+    """
+    url = f"{QB_API_BASE}/files/{table_id}/{record_id}/{field_id}/{version}"
+    req = urllib.request.Request(url, headers=qb_headers(), method="GET")
+    qb_rate_limiter.acquire(fetch=False)
+    timeout = current_deadline().io_timeout(ATTACHMENT_TIMEOUT_SECONDS)
+    with qb_call(table_id, timeout, ATTACHMENT_TIMEOUT_SECONDS), urllib.request.urlopen(req, timeout=timeout, context=get_ssl_context()) as resp:
+        file_data = resp.read()
+        content_type = resp.headers.get("Content-Type", "application/octet-stream")
+    if file_data.startswith(b"e1xydGY"):
+        try:
+            decoded = base64.b64decode(file_data)
+            if decoded.startswith(b"{\\rtf"):
+                logger.debug("Decoded Base64 RTF content")
+                file_data = decoded
+                content_type = "application/rtf"
+        except Exception as e:
+            logger.warning("Failed to decode Base64 RTF: %s", e)
+    return file_data, content_type.split(";")[0].strip()
 
 def process_attachment(
     table_id: str,
@@ -16,43 +56,25 @@ def process_attachment(
     Download any file from Quickbase and upload to S3.
     Supports binary files, Base64-encoded RTF, and plain text.
     """
+    if get_breaker("s3").rejecting():
+        logger.warning("Skipping attachment for record %s: S3 unavailable (circuit open)", record_id)
+        return None
     try:
-        url = f"https://api.quickbase.com/v1/files/{table_id}/{record_id}/{field_id}/{version}"
-        req = urllib.request.Request(url, headers=qb_headers(), method="GET")
-        context = ssl.create_default_context()
-        with urllib.request.urlopen(req, timeout=60, context=context) as resp:
-            file_data = resp.read()
-            content_type = resp.headers.get("Content-Type", "application/octet-stream")
-        if file_data.startswith(b"e1xydGY"):
-            try:
-                decoded = base64.b64decode(file_data)
-                if decoded.startswith(b"{\\rtf"):
-                    print("INFO: Decoded Base64 RTF content")
-                    file_data = decoded
-                    content_type = "application/rtf"
-            except Exception as e:
-                print(f"WARNING: Failed to decode Base64 RTF: {e}")
-        ext_map = {
-            "application/pdf": ".pdf",
-            "image/png": ".png",
-            "image/jpeg": ".jpg",
-            "text/plain": ".txt",
-            "application/rtf": ".rtf",
-            "application/json": ".json",
-            "text/csv": ".csv",
-        }
-        ext = ext_map.get(content_type, ".bin")
+        file_data, content_type = download_attachment(table_id, record_id, field_id, version)
+        ext = EXTENSIONS.get(content_type, ".bin")
         key = f"attachments/{s3_name_prefix}_{record_id}_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}{ext}"
-        s3.put_object(Bucket=S3_BUCKET, Key=key, Body=file_data, ContentType=content_type)
+        s3 = get_s3_client()
+        with get_breaker("s3").guard():
+            s3.put_object(Bucket=S3_BUCKET, Key=key, Body=file_data, ContentType=content_type)
         url = s3.generate_presigned_url(
             "get_object",
             Params={"Bucket": S3_BUCKET, "Key": key},
             ExpiresIn=PRESIGNED_URL_EXPIRATION
         )
-        print(f"INFO: Uploaded attachment for record {record_id} ({content_type}, {len(file_data)} bytes)")
+        logger.info("Uploaded attachment for record %s (%s, %d bytes)", record_id, content_type, len(file_data))
         return url
     except Exception as e:
-        print(f"Attachment download failed for record {record_id}: {e}")
+        logger.error("Attachment download failed for record %s: %s", record_id, e)
         return None
 
 def _is_qb_attachment_value(val: Any) -> bool:
@@ -1,9 +1,13 @@
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from typing import Dict, Any, List
 
-from src.config import ALLOW_LISTS, QB_APP_ID
+from src.config import ALLOW_LISTS, QB_APP_ID, TABLE_METADATA_VERIFY
 from src.table_relationships import get_table_metadata
+from src.table_index import get_table_index
+from src import json_codec
 
 logger = logging.getLogger("quickbase-agent")
 
@@ -44,47 +48,56 @@ def extract_bedrock_parameters(event: Dict[str, Any]) -> Dict[str, Any]:
             params['limit'] = int(value) if value else 50
     return params
 
+def _fetch_table_metadata(tables: List[Dict[str, str]], app_id: str) -> None:
+    """Verify matched tables against Quickbase (TABLE_METADATA_VERIFY), concurrently when several."""
+    if len(tables) == 1:
+        infos = [get_table_metadata(tables[0]["id"], app_id)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(tables), thread_name_prefix="qb-meta") as executor:
+            futures = [executor.submit(copy_context().run, get_table_metadata, t["id"], app_id) for t in tables]
+            infos = [f.result() for f in futures]
+    for table, info in zip(tables, infos):
+        if info.get("name") and info["name"] != table["name"]:
+            logger.info("Table '%s' is named '%s' in Quickbase", table["name"], info["name"])
+
 def validate_and_match_tables(suggested_tables: List[str], app_id: str) -> Dict[str, Any]:
     """
     Validate LLM-suggested tables using ALLOW_LISTS.
-    Uses lightweight get_table_metadata() instead of full list_tables().
+    Names resolve through the local table index (names, aliases, fuzzy match), so no
+    metadata call is needed; TABLE_METADATA_VERIFY opts back into checking Quickbase.
     """
+    index = get_table_index()
     matched = []
     for suggested in suggested_tables:
-        entry = ALLOW_LISTS.get(suggested)
+        name, suggestions = index.resolve(suggested)
+        entry = ALLOW_LISTS.get(name) if name else None
         if entry and "id" in entry:
-            table_id = entry["id"]
-            table_info = get_table_metadata(table_id, app_id)
-            matched.append(table_info)
-            logger.info(f"Matched table '{table_info['name']}' ({table_info['id']})")
-        else:
-            matched_entry = None
-            for name, data in ALLOW_LISTS.items():
-                if name.lower() == suggested.lower():
-                    matched_entry = data
-                    table_info = get_table_metadata(data["id"], app_id)
-                    matched.append(table_info)
-                    logger.info(f"Matched table '{name}' ({data['id']}) via case-insensitive match")
-                    break
-            if not matched_entry:
-                available = list(ALLOW_LISTS.keys())
-                logger.warning(f"Table '{suggested}' not found in ALLOW_LISTS")
-                
-                # Create a formatted list of available tables
-                table_list = "\n".join([f"- {table}" for table in available])
-                
-                # Check if this might be an entity/customer name instead of a table name
-                suggestion_msg = f"I couldn't find a table named '{suggested}'.\n\n"
-                suggestion_msg += f"Which table would you like to query?\n\n{table_list}\n\n"
-                suggestion_msg += f"(If '{suggested}' is a customer or record name, please specify which table to search in)"
-                
-                return {
-                    "needs_clarification": True,
-                    "error": f"Table '{suggested}' not found in ALLOW_LISTS",
-                    "available_tables": available,
-                    "suggestion": suggestion_msg
-                }
-    mode = "parent+child" if len(matched) == 2 else "single"
+            matched.append({"id": entry["id"], "name": name})
+            logger.info("Matched table '%s' (%s)", name, entry["id"])
+            continue
+        available = list(ALLOW_LISTS.keys())
+        logger.warning("Table '%s' not found in ALLOW_LISTS", suggested)
+        
+        # Create a formatted list of available tables
+        table_list = "\n".join([f"- {table}" for table in available])
+        
+        # Check if this might be an entity/customer name instead of a table name
+        suggestion_msg = f"I couldn't find a table named '{suggested}'.\n\n"
+        if suggestions:
+            suggestion_msg += "Did you mean:\n" + "\n".join(f"- {table}" for table, _ in suggestions) + "\n\n"
+        suggestion_msg += f"Which table would you like to query?\n\n{table_list}\n\n"
+        suggestion_msg += f"(If '{suggested}' is a customer or record name, please specify which table to search in)"
+        
+        return {
+            "needs_clarification": True,
+            "error": f"Table '{suggested}' not found in ALLOW_LISTS",
+            "available_tables": available,
+            "suggestions": [{"table": table, "score": score} for table, score in suggestions],
+            "suggestion": suggestion_msg
+        }
+    if TABLE_METADATA_VERIFY and matched:
+        _fetch_table_metadata(matched, app_id)
+    mode = "multi" if len(matched) > 2 else "parent+child" if len(matched) == 2 else "single"
     return {"ok": True, "tables": matched, "mode": mode}
 
 def format_bedrock_response(event: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
@@ -97,14 +110,9 @@ def format_bedrock_response(event: Dict[str, Any], data: Dict[str, Any]) -> Dict
             "functionResponse": {
                 "responseBody": {
                     "TEXT": {
-                        "body": json_dumps(data)
+                        "body": json_codec.dumps(data)
                     }
                 }
             }
         }
     }
-
-# local wrapper so we don't pull json at top if you prefer to keep imports minimal elsewhere
-def json_dumps(data):
-    import json
-    return json.dumps(data)
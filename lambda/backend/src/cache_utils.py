@@ -1,7 +1,12 @@
 from typing import Dict, Any, Optional
-import time
+import time, logging, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from src.config import CACHE_TTL_SECONDS
+from src.circuit_breaker import breaker_stats
+
+logger = logging.getLogger("quickbase-agent")
 
 # ============================================================================
 # CACHE REGISTRIES
@@ -9,6 +14,34 @@ from src.config import CACHE_TTL_SECONDS
 _field_map_cache: Dict[str, Dict[str, Any]] = {}
 _relationship_cache: Dict[str, Dict[str, Any]] = {}
 _table_metadata_cache: Dict[str, Dict[str, Any]] = {}
+_report_cache: Dict[str, Dict[str, Any]] = {}  # see src/report_cache.py
+_entity_index_cache: Dict[str, Dict[str, Any]] = {}  # see src/entity_index.py
+_relationship_graph_cache: Dict[str, Dict[str, Any]] = {}  # see src/relationship_graph.py
+
+# Hit/miss counters per cache (container lifetime), plus an optional per-request sink
+_cache_counters: Dict[str, Dict[str, int]] = {}
+_counter_lock = threading.Lock()
+_lookup_sink: ContextVar[Optional[Dict[str, Dict[str, int]]]] = ContextVar("cache_lookup_sink", default=None)
+
+def _record_cache_lookup(cache_name: str, hit: bool) -> None:
+    """Count a cache hit or miss globally and in the active track_cache_lookups() sink."""
+    key = "hits" if hit else "misses"
+    with _counter_lock:
+        counters = _cache_counters.setdefault(cache_name, {"hits": 0, "misses": 0})
+        counters[key] += 1
+    sink = _lookup_sink.get()
+    if sink is not None:
+        sink.setdefault(cache_name, {"hits": 0, "misses": 0})[key] += 1
+
+@contextmanager
+def track_cache_lookups():
+    """Collect cache hits/misses made by the current thread/context (used by bench/replay.py)."""
+    sink: Dict[str, Dict[str, int]] = {}
+    token = _lookup_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _lookup_sink.reset(token)
 
 def _is_cache_valid(entry: Optional[Dict[str, Any]], ttl: int = CACHE_TTL_SECONDS) -> bool:
     """True if a cache entry is present and not expired."""
@@ -19,6 +52,7 @@ def _is_cache_valid(entry: Optional[Dict[str, Any]], ttl: int = CACHE_TTL_SECOND
 # --- First (detailed) version preserved under a different name
 def get_cache_stats_detailed() -> Dict[str, Any]:
     """Return cache statistics for diagnostics (detailed ages)."""
+    from src.relationship_graph import dump_relationship_graph  # late import: it depends on this module
     now = time.time()
     def _age(entry):
         return round(now - entry["timestamp"], 1) if entry and "timestamp" in entry else None
@@ -29,21 +63,34 @@ def get_cache_stats_detailed() -> Dict[str, Any]:
         "metadata_age_sec": {k: _age(v) for k, v in _table_metadata_cache.items()},
         "fields_age_sec": {k: _age(v) for k, v in _field_map_cache.items()},
         "relationships_age_sec": {k: _age(v) for k, v in _relationship_cache.items()},
+        "relationship_graph": dump_relationship_graph(),
     }
 
 def clear_all_caches() -> None:
-    """Manually clear all cached field, relationship, and metadata entries."""
+    """Manually clear all cached field, relationship, metadata, report, entity index and graph entries."""
+    from src.table_mirror import clear_mirror  # late import: table_mirror depends on this module
     _field_map_cache.clear()
     _relationship_cache.clear()
     _table_metadata_cache.clear()
-    print("INFO: Cleared all caches")
+    _relationship_graph_cache.clear()
+    _report_cache.clear()
+    _entity_index_cache.clear()
+    clear_mirror()
+    logger.info("Cleared all caches")
 
 # --- Second (later in your file) version that effectively overwrote the first
 def get_cache_stats() -> Dict[str, Any]:
     """Return cache statistics for diagnostics."""
+    from src.table_mirror import get_mirror_stats  # late import: table_mirror depends on this module
     return {
         "cached_tables": len(_field_map_cache),
         "cached_relationships": len(_relationship_cache),
         "cached_metadata": len(_table_metadata_cache),
+        "cached_reports": len(_report_cache),
+        "cached_entity_indexes": len(_entity_index_cache),
+        "relationship_edges": len(_relationship_graph_cache["graph"]["data"].edges) if "graph" in _relationship_graph_cache else 0,
         "table_ids": list(_field_map_cache.keys()),
+        "lookups": {name: dict(c) for name, c in _cache_counters.items()},
+        "mirror": get_mirror_stats(),
+        "circuit_breakers": breaker_stats(),
     }
@@ -0,0 +1,164 @@
+import time, logging, threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Callable, Iterator, Optional
+
+from src.config import (
+    BREAKER_ENABLED, BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE,
+    BREAKER_SLOW_SECONDS, BREAKER_OPEN_SECONDS
+)
+
+logger = logging.getLogger("quickbase-agent")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+class CircuitBreaker:
+    """
+    Container-lifetime breaker for one dependency. The last BREAKER_WINDOW calls are
+    kept; once at least BREAKER_MIN_CALLS are in the window and the share that failed
+    or took longer than BREAKER_SLOW_SECONDS reaches BREAKER_FAILURE_RATE, the breaker
+    opens and calls fail fast with CircuitOpen. After BREAKER_OPEN_SECONDS one probe
+    call is let through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.window: deque = deque(maxlen=max(1, BREAKER_WINDOW))
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _trip(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.probing = False
+        self.times_opened += 1
+        logger.warning("Circuit '%s' opened for %ss: %s", self.name, BREAKER_OPEN_SECONDS, self._rates())
+
+    def _rates(self) -> Dict[str, Any]:
+        calls = len(self.window)
+        failed = sum(1 for ok, slow in self.window if not ok)
+        slow = sum(1 for ok, slow in self.window if ok and slow)
+        return {
+            "calls": calls,
+            "failure_rate": round(failed / calls, 2) if calls else 0.0,
+            "slow_rate": round(slow / calls, 2) if calls else 0.0,
+        }
+
+    def allow(self) -> bool:
+        """True if a call may go ahead now (claims the probe slot when half-open)."""
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def rejecting(self) -> bool:
+        """True while calls would fail fast (used to skip retry sleeps that cannot help)."""
+        return BREAKER_ENABLED and self.state == OPEN and time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        if not BREAKER_ENABLED:
+            return
+        slow = elapsed > BREAKER_SLOW_SECONDS
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN and self.probing:
+                self.probing = False
+                if ok and not slow:
+                    self.state = CLOSED
+                    self.window.clear()
+                    logger.info("Circuit '%s' closed after a successful probe", self.name)
+                else:
+                    self._trip(now)
+                return
+            self.window.append((ok, slow))
+            if self.state == CLOSED and len(self.window) >= BREAKER_MIN_CALLS:
+                bad = sum(1 for ok_, slow_ in self.window if not ok_ or slow_)
+                if bad / len(self.window) >= BREAKER_FAILURE_RATE:
+                    self._trip(now)
+
+    def release(self) -> None:
+        """Give back a probe slot claimed by allow() for a call that never reached the dependency."""
+        with self._lock:
+            self.probing = False
+
+    @contextmanager
+    def guard(self, is_failure: Callable[[BaseException], Optional[bool]] = lambda e: True) -> Iterator[None]:
+        """
+        Run one call to the dependency: raises CircuitOpen without calling it while
+        open, otherwise records the outcome and latency. Exceptions for which
+        `is_failure` is False (bad requests, our own deadline) count as successes;
+        None means the call says nothing about the dependency and is not recorded.
+        """
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is unavailable (circuit open); failing fast")
+        started = time.monotonic()
+        try:
+            yield
+        except CircuitOpen:
+            self.release()
+            raise
+        except BaseException as e:
+            failed = is_failure(e)
+            if failed is None:
+                self.release()
+            else:
+                self.record(not failed, time.monotonic() - started)
+            raise
+        self.record(True, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                **self._rates(),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+_reported_rejections = 0
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The shared breaker for a dependency ("quickbase", "quickbase:<table id>", "s3", "slack")."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+def breaker_metrics() -> List[Dict[str, Any]]:
+    """CloudWatch datapoints: breakers not closed now, and calls rejected since the last report."""
+    global _reported_rejections
+    rejected = sum(b.rejected for b in list(_breakers.values()))
+    new_rejections, _reported_rejections = rejected - _reported_rejections, rejected
+    not_closed = sum(1 for b in list(_breakers.values()) if b.state != CLOSED)
+    return [
+        {"MetricName": "OpenCircuits", "Value": not_closed, "Unit": "Count"},
+        {"MetricName": "CircuitRejections", "Value": new_rejections, "Unit": "Count"},
+    ]
+
+def reset_breakers() -> None:
+    """Forget all breaker state (used between bench runs)."""
+    global _reported_rejections
+    with _registry_lock:
+        _breakers.clear()
+        _reported_rejections = 0
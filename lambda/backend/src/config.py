@@ -1,6 +1,5 @@
-import os, json, io, csv, boto3, urllib.request, ssl, re, time, traceback, logging, base64
-from datetime import datetime
-from typing import Dict, List, Optional, Any, Tuple
+import os, threading
+from typing import Any
 from field_allowlist import ALLOW_LISTS
 
 # ============================================================================
@@ -11,6 +10,8 @@ from field_allowlist import ALLOW_LISTS
 QB_APP_ID = os.getenv("QB_APP_ID")
 QB_REALM = os.getenv("QB_REALM")
 QB_USER_TOKEN = os.getenv("QB_USER_TOKEN")
+# Overridable so the backend can run against a local stand-in (see bench/)
+QB_API_BASE = os.getenv("QB_API_BASE", "https://api.quickbase.com/v1").rstrip("/")
 
 S3_BUCKET = os.getenv("S3_BUCKET_NAME")
 S3_REGION = os.getenv("AWS_REGION_NAME")
@@ -20,20 +21,140 @@ SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 
 # Query thresholds
 QB_LARGE_QUERY_THRESHOLD = int(os.getenv("QB_LARGE_QUERY_THRESHOLD", "20000"))
+# Where clauses with more conditions than this are split into several queries (0 disables)
+QB_MAX_WHERE_TERMS = int(os.getenv("QB_MAX_WHERE_TERMS", "100"))
 PRESIGNED_URL_EXPIRATION = int(os.getenv("PRESIGNED_URL_EXPIRATION", "3600"))
 MAX_FILE_SIZE_BYTES = int(os.getenv("MAX_FILE_SIZE_BYTES", "104857600"))
 
+# Multi-table (3+) reports: per-level row cap, per-level time budget and fetch parallelism.
+# A level that hits either limit is truncated and deeper levels are not fetched past it.
+MULTI_LEVEL_MAX_ROWS = int(os.getenv("MULTI_LEVEL_MAX_ROWS", "5000"))
+MULTI_LEVEL_TIMEOUT_SECONDS = float(os.getenv("MULTI_LEVEL_TIMEOUT_SECONDS", "20"))
+MULTI_TABLE_WORKERS = int(os.getenv("MULTI_TABLE_WORKERS", "4"))
+
+# Parent+child reports: how many parents are queried, formatted and exported at once
+PARENT_CHILD_WORKERS = int(os.getenv("PARENT_CHILD_WORKERS", "4"))
+# Token bucket shared by every Quickbase call in the container (Quickbase allows
+# 100 requests per 10s per user token); 0 disables throttling
+QB_RATE_LIMIT_PER_SEC = float(os.getenv("QB_RATE_LIMIT_PER_SEC", "10"))
+QB_RATE_LIMIT_BURST = int(os.getenv("QB_RATE_LIMIT_BURST", "100"))
+# Fetching stops this many seconds before the Lambda timeout so what was fetched can
+# still be exported and returned as a partial result (src/deadline.py)
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "10"))
+
+# Circuit breakers (src/circuit_breaker.py), one per dependency and per Quickbase table:
+# open when BREAKER_FAILURE_RATE of the last BREAKER_WINDOW calls failed or took longer
+# than BREAKER_SLOW_SECONDS, fail fast for BREAKER_OPEN_SECONDS, then probe once
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "10"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+QB_TABLE_BREAKERS = os.getenv("QB_TABLE_BREAKERS", "true").lower() == "true"
+
 # Feature flags
+# Single-table reports move through formatting, summary and CSV export as columns (src/record_batch.py)
+RECORD_BATCH_ENABLED = os.getenv("RECORD_BATCH_ENABLED", "false").lower() == "true"
 EXPORT_FLATTEN_MODE = os.getenv("EXPORT_FLATTEN_MODE", "true").lower() == "true"
 INCLUDE_ATTACHMENTS = os.getenv("INCLUDE_ATTACHMENTS", "false").lower() == "true"
+# Bundle each report's attachments into one zip (multipart upload) referenced by path from the CSV
+ATTACHMENT_ARCHIVE_MODE = os.getenv("ATTACHMENT_ARCHIVE_MODE", "false").lower() == "true"
+ATTACHMENT_ARCHIVE_PART_SIZE = int(os.getenv("ATTACHMENT_ARCHIVE_PART_SIZE", str(8 * 1024 * 1024)))
+
+# JSON codec: "auto" uses orjson when it is installed, "stdlib" forces the json module.
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
 
 # Slack constants
 SLACK_MAX_MESSAGE_SIZE = 3500
 SLACK_BATCH_SEPARATOR = "\n\n" + "─" * 50 + "\n\n"
 
-# AWS Clients
-s3 = boto3.client("s3", region_name=S3_REGION)
-cloudwatch = boto3.client("cloudwatch", region_name=S3_REGION)
+# AWS Clients — created on first use so cold starts that never touch S3/CloudWatch
+# (e.g. clarification responses) don't pay for importing boto3 and building clients.
+_s3_client = None
+_cloudwatch_client = None
+_client_lock = threading.Lock()
+
+def get_s3_client() -> Any:
+    """Return the shared S3 client, creating it on first use."""
+    global _s3_client
+    if _s3_client is None:
+        with _client_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = boto3.client("s3", region_name=S3_REGION)
+    return _s3_client
+
+def get_cloudwatch_client() -> Any:
+    """Return the shared CloudWatch client, creating it on first use."""
+    global _cloudwatch_client
+    if _cloudwatch_client is None:
+        with _client_lock:
+            if _cloudwatch_client is None:
+                import boto3
+                _cloudwatch_client = boto3.client("cloudwatch", region_name=S3_REGION)
+    return _cloudwatch_client
+
+def __getattr__(name: str) -> Any:
+    # Backwards compatibility for `from src.config import s3, cloudwatch`
+    if name == "s3":
+        return get_s3_client()
+    if name == "cloudwatch":
+        return get_cloudwatch_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Cache expiration time in seconds (default 10 minutes)
 CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "600"))
+
+# Report memo: identical requests within the TTL reuse the previous report (0 disables).
+# Capped at PRESIGNED_URL_EXPIRATION, since attachment links inside the stored CSV expire.
+REPORT_CACHE_TTL_SECONDS = int(os.getenv("REPORT_CACHE_TTL_SECONDS", "300"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "64"))
+
+# Entity index: resolve entity_names to Record IDs locally (exact, then trigram fuzzy match
+# on text fields only; fuzzy matches are reported in the response as "entity_matches").
+# Tables with more than ENTITY_INDEX_MAX_ROWS rows (re-checked every CACHE_TTL_SECONDS), or an
+# index that is still building or whose refresh is overdue, fall back to per-field EX clauses.
+ENTITY_INDEX_ENABLED = os.getenv("ENTITY_INDEX_ENABLED", "true").lower() == "true"
+ENTITY_INDEX_MAX_ROWS = int(os.getenv("ENTITY_INDEX_MAX_ROWS", "20000"))
+ENTITY_INDEX_REFRESH_SECONDS = int(os.getenv("ENTITY_INDEX_REFRESH_SECONDS", "60"))
+ENTITY_FUZZY_THRESHOLD = float(os.getenv("ENTITY_FUZZY_THRESHOLD", "0.6"))
+
+# Table resolution: allowlisted table names resolve locally (names, aliases, fuzzy match).
+# TABLE_METADATA_VERIFY additionally fetches table metadata from Quickbase (concurrently).
+TABLE_FUZZY_THRESHOLD = float(os.getenv("TABLE_FUZZY_THRESHOLD", "0.7"))
+TABLE_SUGGESTION_LIMIT = int(os.getenv("TABLE_SUGGESTION_LIMIT", "3"))
+TABLE_METADATA_VERIFY = os.getenv("TABLE_METADATA_VERIFY", "false").lower() == "true"
+
+# Mirror mode: serve allowlisted tables from a SQLite replica synced by Date Modified deltas.
+# Falls back to the live API when the replica is older than MIRROR_MAX_STALENESS_SECONDS
+# and cannot be synced, or when a query uses syntax/fields the mirror doesn't cover.
+MIRROR_ENABLED = os.getenv("MIRROR_ENABLED", "false").lower() == "true"
+MIRROR_PATH = os.getenv("MIRROR_PATH", "/tmp/quickbase_mirror.sqlite3")
+MIRROR_SYNC_INTERVAL_SECONDS = int(os.getenv("MIRROR_SYNC_INTERVAL_SECONDS", "60"))
+MIRROR_MAX_STALENESS_SECONDS = int(os.getenv("MIRROR_MAX_STALENESS_SECONDS", "900"))
+MIRROR_FULL_RESYNC_SECONDS = int(os.getenv("MIRROR_FULL_RESYNC_SECONDS", "3600"))
+MIRROR_MAX_ROWS = int(os.getenv("MIRROR_MAX_ROWS", "100000"))
+
+# Bedrock response governor: replies larger than RESPONSE_MAX_BYTES (or RESPONSE_MAX_TOKENS × 4
+# when set) are trimmed in stages; the untrimmed response is stored in S3 and linked (0 disables).
+# Bedrock rejects action group responses over 25KB, so the default leaves headroom below that.
+RESPONSE_MAX_BYTES = int(os.getenv("RESPONSE_MAX_BYTES", "20000"))
+RESPONSE_MAX_TOKENS = int(os.getenv("RESPONSE_MAX_TOKENS", "0"))
+
+# Memory: per-stage peaks (RSS, plus tracemalloc when MEMORY_TRACEMALLOC) logged and sent as metrics.
+# The governor spills report rows to SPILL_DIR once their estimated size passes MEMORY_SPILL_FRACTION
+# of the remaining headroom. MEMORY_LIMIT_MB defaults to the Lambda's configured size (0 = unknown).
+MEMORY_GOVERNOR_ENABLED = os.getenv("MEMORY_GOVERNOR_ENABLED", "true").lower() == "true"
+MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "0")))
+MEMORY_SPILL_FRACTION = float(os.getenv("MEMORY_SPILL_FRACTION", "0.5"))
+MEMORY_TRACEMALLOC = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+SPILL_DIR = os.getenv("SPILL_DIR", "/tmp")
+
+# Logging: level plus a per-invocation budget so hot paths can't flood CloudWatch.
+# Repeated messages (same template) are sampled after LOG_SAMPLE_AFTER occurrences.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_BUDGET_BYTES = int(os.getenv("LOG_BUDGET_BYTES", "65536"))
+LOG_BUDGET_LINES = int(os.getenv("LOG_BUDGET_LINES", "400"))
+LOG_SAMPLE_AFTER = int(os.getenv("LOG_SAMPLE_AFTER", "5"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
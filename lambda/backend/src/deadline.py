@@ -0,0 +1,113 @@
+import time, logging, threading
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from src.config import DEADLINE_RESERVE_SECONDS
+
+logger = logging.getLogger("quickbase-agent")
+
+# A request is not started (or retried) with less time than this left
+MIN_IO_SECONDS = 1.0
+# Kept back from the Lambda timeout so the response itself can be returned
+HARD_MARGIN_SECONDS = 1.0
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an I/O call would start or retry after the request deadline."""
+
+class Deadline:
+    """
+    Time budget for one invocation, taken from the Lambda context. Fetching stops
+    DEADLINE_RESERVE_SECONDS before the Lambda timeout (the cutoff) so whatever was
+    fetched can still be formatted, exported and returned; I/O after the cutoff
+    (attachments, S3, Slack) is bounded by the Lambda timeout itself. Work that is cut
+    short is recorded with mark_partial() and reported back as a partial result.
+    """
+
+    def __init__(self, remaining_seconds: Optional[float] = None, reserve_seconds: float = DEADLINE_RESERVE_SECONDS):
+        now = time.monotonic()
+        self.end = None if remaining_seconds is None else now + remaining_seconds - HARD_MARGIN_SECONDS
+        self.cutoff = None if self.end is None else self.end - max(reserve_seconds, 0.0)
+        self.reasons: List[str] = []
+        self.continuation: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds before fetching should stop, or None when there is no deadline."""
+        return None if self.cutoff is None else self.cutoff - time.monotonic()
+
+    def expired(self) -> bool:
+        """True once there is no longer time to start another fetch."""
+        remaining = self.remaining()
+        return remaining is not None and remaining < MIN_IO_SECONDS
+
+    def _bounded(self, default: float, until: Optional[float], what: str) -> float:
+        if until is None:
+            return default
+        left = until - time.monotonic()
+        if left < MIN_IO_SECONDS:
+            raise DeadlineExceeded(f"Request deadline reached before {what}")
+        return min(default, left)
+
+    def fetch_timeout(self, default: float) -> float:
+        """Socket timeout for a Quickbase query, shortened so it ends by the cutoff."""
+        return self._bounded(default, self.cutoff, "fetching")
+
+    def io_timeout(self, default: float) -> float:
+        """Socket timeout for export-side I/O, shortened so it ends before the Lambda does."""
+        return self._bounded(default, self.end, "the request finished")
+
+    def can_retry(self, wait: float, fetch: bool = True) -> bool:
+        """True if sleeping `wait` seconds still leaves time for another attempt."""
+        until = self.cutoff if fetch else self.end
+        return until is None or until - time.monotonic() - wait >= MIN_IO_SECONDS
+
+    def mark_partial(self, reason: str, **continuation: Any) -> None:
+        """Record that part of the result was skipped; `continuation` is merged into the hint."""
+        with self._lock:
+            self.reasons.append(reason)
+            for key, value in continuation.items():
+                if isinstance(value, list):
+                    self.continuation.setdefault(key, []).extend(value)
+                else:
+                    self.continuation[key] = value
+        logger.warning("Partial result: %s", reason)
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.reasons)
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """Continuation hint for the response, or None when nothing was cut short."""
+        if not self.reasons:
+            return None
+        if "remaining_entities" in self.continuation:
+            hint = "Ask again for the remaining_entities listed here to get the rest."
+        else:
+            hint = "Ask again with a smaller limit or a narrower date range to get the rest."
+        return {
+            "reason": "; ".join(self.reasons),
+            **self.continuation,
+            "hint": f"Results were cut short to finish before the Lambda timeout. {hint}",
+        }
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+def start_deadline(context: Any = None) -> Deadline:
+    """New deadline for this invocation from context.get_remaining_time_in_millis() (unbounded without one)."""
+    remaining = None
+    getter = getattr(context, "get_remaining_time_in_millis", None)
+    if callable(getter):
+        try:
+            remaining = getter() / 1000.0
+        except Exception as e:
+            logger.warning("Could not read remaining Lambda time: %s", e)
+    deadline = Deadline(remaining)
+    _current.set(deadline)
+    if remaining is not None:
+        logger.debug("Request deadline: %.1fs left, fetching stops after %.1fs", remaining, deadline.remaining())
+    return deadline
+
+def current_deadline() -> Deadline:
+    """The active invocation's deadline; an unbounded one outside lambda_handler."""
+    deadline = _current.get()
+    return deadline if deadline is not None else Deadline()
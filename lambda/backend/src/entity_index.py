@@ -0,0 +1,203 @@
+import time, logging, threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from src.config import (
+    ENTITY_INDEX_ENABLED, ENTITY_INDEX_MAX_ROWS, ENTITY_INDEX_REFRESH_SECONDS,
+    ENTITY_FUZZY_THRESHOLD, CACHE_TTL_SECONDS
+)
+from src.cache_utils import _entity_index_cache, _is_cache_valid, _record_cache_lookup
+from src.quickbase_api import quickbase_query
+from src.query_builder import build_body, cond
+
+logger = logging.getLogger("quickbase-agent")
+
+DATE_MODIFIED_LABEL = "Date Modified"
+# Only values of these Quickbase field types are fuzzy-matched; IDs and references are exact-only
+FUZZY_FIELD_TYPES = {"text", "text-multi-line", "text-multiple-choice", "rich-text", "email", "user"}
+# Guards the cache and _building only; builds and refreshes run without it
+_index_lock = threading.Lock()
+# Index keys with a build or refresh in flight; concurrent callers fall back to field clauses
+_building: Set[str] = set()
+
+def normalize_entity(value: Any) -> str:
+    """Case/whitespace-insensitive form used for exact lookups (mirrors Quickbase EX matching)."""
+    if isinstance(value, dict):
+        value = value.get("name") or value.get("email") or value.get("id") or ""
+    return " ".join(str(value).lower().split())
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def similarity(a: str, b: str) -> float:
+    """Dice coefficient over padded character trigrams (1.0 for identical strings)."""
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    return 2.0 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+class EntityIndex:
+    """
+    Key-field value → Record ID# index for one table. Built with a single select of
+    Record ID#, Date Modified and the key fields; later refreshes fetch only rows
+    modified since the newest Date Modified seen. Deleted records linger until the
+    next full rebuild (CACHE_TTL_SECONDS), which is harmless: resolved IDs are only
+    used as query filters. A truncated or stale index resolves nothing, so callers
+    keep their per-field EX clauses.
+    """
+
+    def __init__(self, table_id: str, rid_fid: int, key_fids: List[int], modified_fid: Optional[int],
+                 fuzzy_fids: Optional[List[int]] = None):
+        self.table_id = table_id
+        self.rid_fid = rid_fid
+        self.key_fids = key_fids
+        self.modified_fid = modified_fid
+        self.fuzzy_fids = set(fuzzy_fids or [])
+        self.values: Dict[str, Set[int]] = {}
+        self.rid_values: Dict[int, List[str]] = {}
+        self.trigrams: Dict[str, Set[str]] = {}
+        self.last_modified: Optional[str] = None
+        self.complete = False
+        self.refreshed_at = 0.0
+        # Held while a refresh applies its rows and during lookups
+        self._lock = threading.Lock()
+
+    def _select(self) -> List[int]:
+        fids = [self.rid_fid] + [f for f in self.key_fids if f != self.rid_fid]
+        if self.modified_fid and self.modified_fid not in fids:
+            fids.append(self.modified_fid)
+        return fids
+
+    def _upsert(self, row: Dict[str, Any]) -> None:
+        rid_cell = row.get(str(self.rid_fid))
+        if not rid_cell or rid_cell.get("value") in (None, ""):
+            return
+        rid = int(rid_cell["value"])
+        for old in self.rid_values.pop(rid, []):
+            rids = self.values.get(old)
+            if rids is not None:
+                rids.discard(rid)
+                if not rids:
+                    del self.values[old]
+        keys = []
+        for fid in self.key_fids:
+            value = normalize_entity((row.get(str(fid)) or {}).get("value", ""))
+            if value and value not in keys:
+                keys.append(value)
+            if value and fid in self.fuzzy_fids:
+                for gram in _trigrams(value):
+                    self.trigrams.setdefault(gram, set()).add(value)
+        for value in keys:
+            self.values.setdefault(value, set()).add(rid)
+        self.rid_values[rid] = keys
+        if self.modified_fid:
+            modified = (row.get(str(self.modified_fid)) or {}).get("value")
+            if modified and (self.last_modified is None or str(modified) > self.last_modified):
+                self.last_modified = str(modified)
+
+    def build(self) -> None:
+        rows = quickbase_query(self.table_id, build_body(select=self._select()), max_records=ENTITY_INDEX_MAX_ROWS + 1, allow_partial=False)
+        self.complete = len(rows) <= ENTITY_INDEX_MAX_ROWS
+        for row in rows[:ENTITY_INDEX_MAX_ROWS]:
+            self._upsert(row)
+        self.refreshed_at = time.time()
+        logger.info(
+            "Built entity index for table %s: %d rows, %d keys%s",
+            self.table_id, len(self.rid_values), len(self.values), "" if self.complete else " (truncated)"
+        )
+
+    def refresh(self) -> None:
+        """Apply rows modified since the last sync (on-or-after, so same-second edits are not missed)."""
+        if not self.modified_fid or not self.last_modified:
+            return
+        body = build_body(cond(self.modified_fid, "OAF", self.last_modified), select=self._select())
+        rows = quickbase_query(self.table_id, body, max_records=ENTITY_INDEX_MAX_ROWS, allow_partial=False)
+        with self._lock:
+            for row in rows:
+                self._upsert(row)
+            if len(self.rid_values) > ENTITY_INDEX_MAX_ROWS:
+                self.complete = False
+            self.refreshed_at = time.time()
+        logger.debug("Entity index delta for table %s: %d row(s) since %s", self.table_id, len(rows), self.last_modified)
+
+    def stale(self) -> bool:
+        """True when a delta refresh was due but has not happened (no Date Modified, or it failed)."""
+        return time.time() - self.refreshed_at >= ENTITY_INDEX_REFRESH_SECONDS
+
+    def lookup(self, name: str) -> Tuple[Set[int], Optional[str], float]:
+        """
+        Resolve a name to record IDs: exact normalized match first, then the best
+        trigram (Dice) match at or above ENTITY_FUZZY_THRESHOLD among text-field
+        values. Names containing digits are never fuzzy-matched ("1234" must not
+        become "1235"). Returns (record_ids, matched_value, score); an empty set
+        when nothing matches or the index is truncated or stale.
+        """
+        if not self.complete or self.stale():
+            return set(), None, 0.0
+        with self._lock:
+            return self._lookup(normalize_entity(name))
+
+    def _lookup(self, key: str) -> Tuple[Set[int], Optional[str], float]:
+        if key in self.values:
+            return set(self.values[key]), key, 1.0
+        if not key or any(ch.isdigit() for ch in key):
+            return set(), None, 0.0
+        grams = _trigrams(key)
+        overlap: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self.trigrams.get(gram, ()):
+                if candidate in self.values:
+                    overlap[candidate] = overlap.get(candidate, 0) + 1
+        best, best_score = None, 0.0
+        for candidate, shared in overlap.items():
+            score = 2.0 * shared / (len(grams) + len(_trigrams(candidate)))
+            if score > best_score or (score == best_score and best is not None and candidate < best):
+                best, best_score = candidate, score
+        if best is None or best_score < ENTITY_FUZZY_THRESHOLD:
+            return set(), None, best_score
+        return set(self.values[best]), best, best_score
+
+def get_entity_index(table_id: str, field_map: Dict[str, Dict[str, Any]], key_fids: List[int]) -> Optional[EntityIndex]:
+    """
+    Cached index for a table's key fields, built lazily and delta-refreshed; None when
+    disabled or when the table was found to exceed ENTITY_INDEX_MAX_ROWS (a verdict
+    cached like an index, so oversized tables are not re-read every CACHE_TTL_SECONDS).
+    The HTTP work runs outside _index_lock, one caller per index; callers that find a
+    build or refresh in flight get what is cached (possibly nothing) and keep their
+    per-field EX clauses.
+    """
+    if not ENTITY_INDEX_ENABLED or not key_fids or "Record ID#" not in field_map:
+        return None
+    oversized_key = f"{table_id}:oversized"
+    cache_key = f"{table_id}:{','.join(str(f) for f in sorted(key_fids))}"
+    with _index_lock:
+        if _is_cache_valid(_entity_index_cache.get(oversized_key), CACHE_TTL_SECONDS):
+            _record_cache_lookup("entity_index", True)
+            return None
+        entry = _entity_index_cache.get(cache_key)
+        hit = _is_cache_valid(entry, CACHE_TTL_SECONDS)
+        _record_cache_lookup("entity_index", hit)
+        index = entry["data"] if hit else None
+        if index is not None and time.time() - index.refreshed_at < ENTITY_INDEX_REFRESH_SECONDS:
+            return index
+        if cache_key in _building:
+            return index
+        _building.add(cache_key)
+    try:
+        if index is None:
+            modified = field_map.get(DATE_MODIFIED_LABEL)
+            fuzzy_fids = [meta["id"] for meta in field_map.values() if meta["id"] in key_fids and meta.get("type") in FUZZY_FIELD_TYPES]
+            index = EntityIndex(table_id, field_map["Record ID#"]["id"], key_fids, modified["id"] if modified else None, fuzzy_fids)
+            index.build()
+        else:
+            index.refresh()
+        with _index_lock:
+            if not index.complete:
+                _entity_index_cache.pop(cache_key, None)
+                _entity_index_cache[oversized_key] = {"timestamp": time.time(), "data": None}
+                logger.info("Entity index skipped for table %s: more than %d rows", table_id, ENTITY_INDEX_MAX_ROWS)
+                return None
+            if not hit:
+                _entity_index_cache[cache_key] = {"timestamp": time.time(), "data": index}
+        return index
+    finally:
+        with _index_lock:
+            _building.discard(cache_key)
@@ -1,7 +1,10 @@
-import io, csv, logging
+import io, csv, json, logging, tempfile
 from typing import Any, Optional, Dict, List
+from urllib.parse import urlparse, unquote
 
-from src.config import s3, S3_BUCKET, PRESIGNED_URL_EXPIRATION
+from src.config import get_s3_client, S3_BUCKET, PRESIGNED_URL_EXPIRATION, SPILL_DIR
+from src.record_batch import FormattedBatch
+from src.circuit_breaker import get_breaker
 from datetime import datetime
 
 logger = logging.getLogger("quickbase-agent")
@@ -22,18 +25,133 @@ def save_to_s3(
     if not data or not isinstance(data, (list, tuple)) or not isinstance(data[0], dict):
         raise ValueError("CSV export expects a non-empty list of dictionaries")
     output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=data[0].keys())
+    # Rows may omit empty columns, so the header is the union of keys in first-seen order
+    fieldnames = list(dict.fromkeys(k for row in data for k in row))
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
     writer.writeheader()
     writer.writerows(data)
     body = output.getvalue()
-    logger.info(f"Uploading CSV: {len(body.encode('utf-8'))/1000:.1f}KB → s3://{S3_BUCKET}/{key}")
-    s3.put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType="text/csv")
-    return s3.generate_presigned_url(
+    logger.info("Uploading CSV: %.1fKB → s3://%s/%s", len(body.encode('utf-8'))/1000, S3_BUCKET, key)
+    with get_breaker("s3").guard():
+        get_s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType="text/csv")
+    return presign_s3_key(key, expires)
+
+class CsvSpool:
+    """
+    CSV rows appended one at a time to a temporary file under SPILL_DIR instead of a
+    list, for reports the memory governor says won't fit. The header is the union of
+    keys (as in save_to_s3), so rows are spooled as JSON lines and the CSV is written
+    from the spool, also on disk, when it is saved.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(mode="w+", encoding="utf-8", dir=SPILL_DIR)
+        self.fieldnames: Dict[str, None] = {}
+        self.count = 0
+
+    def append(self, row: Dict[str, Any]) -> None:
+        for key in row:
+            self.fieldnames.setdefault(key)
+        self.file.write(json.dumps(row, default=str, ensure_ascii=False))
+        self.file.write("\n")
+        self.count += 1
+
+    def extend(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def save_to_s3(self, prefix: str = "reports", record_name: Optional[str] = None, expires: Optional[int] = None) -> str:
+        """Same object and URL as save_to_s3() would produce for the spooled rows."""
+        if not self.count:
+            raise ValueError("CSV export expects a non-empty list of dictionaries")
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        key = f"{prefix}/{record_name or 'all'}_{timestamp}.csv"
+        with tempfile.TemporaryFile(dir=SPILL_DIR) as out:
+            text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+            writer = csv.DictWriter(text, fieldnames=list(self.fieldnames))
+            writer.writeheader()
+            self.file.seek(0)
+            for line in self.file:
+                writer.writerow(json.loads(line))
+            text.flush()
+            size = out.tell()
+            out.seek(0)
+            logger.info("Uploading spooled CSV: %d rows, %.1fKB → s3://%s/%s", self.count, size/1000, S3_BUCKET, key)
+            with get_breaker("s3").guard():
+                get_s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=out, ContentLength=size, ContentType="text/csv")
+            text.detach()
+        return presign_s3_key(key, expires)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> "CsvSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def save_batch_to_s3(
+    batch: FormattedBatch,
+    prefix: str = "reports",
+    record_name: Optional[str] = None,
+    expires: Optional[int] = None
+) -> str:
+    """save_to_s3() for a FormattedBatch: rows are written straight from its columns."""
+    if expires is None:
+        expires = PRESIGNED_URL_EXPIRATION
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    key = f"{prefix}/{record_name or 'all'}_{timestamp}.csv"
+    if not len(batch):
+        raise ValueError("CSV export expects a non-empty batch")
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(batch.labels)
+    writer.writerows(batch.iter_values())
+    body = output.getvalue()
+    logger.info("Uploading CSV: %.1fKB → s3://%s/%s", len(body.encode('utf-8'))/1000, S3_BUCKET, key)
+    with get_breaker("s3").guard():
+        get_s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType="text/csv")
+    return presign_s3_key(key, expires)
+
+def save_json_to_s3(
+    data: Any,
+    prefix: str = "reports",
+    record_name: Optional[str] = None,
+    expires: Optional[int] = None
+) -> str:
+    """Save a nested (non-tabular) report to S3 as JSON."""
+    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    key = f"{prefix}/{record_name or 'all'}_{timestamp}.json"
+    body = json.dumps(data, default=str, ensure_ascii=False)
+    logger.info("Uploading JSON: %.1fKB → s3://%s/%s", len(body.encode('utf-8'))/1000, S3_BUCKET, key)
+    with get_breaker("s3").guard():
+        get_s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=body, ContentType="application/json")
+    return presign_s3_key(key, expires)
+
+def presign_s3_key(key: str, expires: Optional[int] = None) -> str:
+    """Presigned GET URL for an object in the report bucket."""
+    return get_s3_client().generate_presigned_url(
         "get_object",
         Params={"Bucket": S3_BUCKET, "Key": key},
-        ExpiresIn=expires
+        ExpiresIn=expires if expires is not None else PRESIGNED_URL_EXPIRATION
     )
 
+def s3_key_from_url(url: str) -> Optional[str]:
+    """
+    Recover the object key from a presigned URL for the report bucket
+    (virtual-hosted or path-style). None if the URL is not for S3_BUCKET.
+    """
+    if not url or not S3_BUCKET:
+        return None
+    parsed = urlparse(url)
+    path = unquote(parsed.path).lstrip("/")
+    if parsed.netloc.startswith(f"{S3_BUCKET}."):
+        return path or None
+    if path.startswith(f"{S3_BUCKET}/"):
+        return path[len(S3_BUCKET) + 1:] or None
+    return None
+
 def save_all_formats(
     data: Any,
     rec_name: str,
@@ -47,14 +165,18 @@ def save_all_formats(
     """
     urls: Dict[str, str] = {}
     try:
+        if isinstance(data, FormattedBatch):
+            logger.info("Saving %d record(s) to CSV for '%s'...", len(data), rec_name)
+            urls["csv"] = save_batch_to_s3(data, prefix="reports", record_name=rec_name)
+            logger.info("Saved CSV for '%s'", rec_name)
+            return urls
         if isinstance(data, dict):
             data = [data]
         if not isinstance(data, list) or not data or not isinstance(data[0], dict):
             raise ValueError("CSV export expects list of dicts")
-        logger.info(f"Saving {len(data)} record(s) to CSV for '{rec_name}'...")
+        logger.info("Saving %d record(s) to CSV for '%s'...", len(data), rec_name)
         urls["csv"] = save_to_s3(data, prefix="reports", record_name=rec_name)
-        logger.info(f"SUCCESS: Saved CSV → {urls['csv']}")
+        logger.info("Saved CSV for '%s'", rec_name)
     except Exception as e:
-        logger.error(f"ERROR: Failed to save CSV for {rec_name}: {e}")
-        import traceback; logger.error(traceback.format_exc())
+        logger.exception("Failed to save CSV for %s: %s", rec_name, e)
     return urls
@@ -1,9 +1,11 @@
-import re
+import re, logging
 from typing import Dict, Any, Optional, List
 
 from src.config import ALLOW_LISTS
 from src.quickbase_api import load_field_map
 
+logger = logging.getLogger("quickbase-agent")
+
 def clean_field_name(label: str) -> str:
     """
     Strip markers like [KEY], [DATE], [UNIQUE], [RELATED KEY] from field labels.
@@ -17,17 +19,17 @@ def find_date_field_from_allowlist(table_name: str, field_map: Dict[str, Dict[st
     """Find date field using [DATE] marker only."""
     table_entry = ALLOW_LISTS.get(table_name, {})
     allow_list = table_entry.get("fields", [])
-    print(f"INFO: Searching for date field in table '{table_name}'")
+    logger.debug("Searching for date field in table '%s'", table_name)
     for field_name in allow_list:
         if "[DATE]" in field_name:
             clean_name = clean_field_name(field_name)
             if clean_name in field_map:
                 field_id = field_map[clean_name]["id"]
-                print(f"INFO: Date field '{clean_name}' (FID {field_id}) found in '{table_name}'")
+                logger.debug("Date field '%s' (FID %s) found in '%s'", clean_name, field_id, table_name)
                 return field_id
             else:
-                print(f"WARNING: Date field '{clean_name}' marked in ALLOW_LIST but not found in QuickBase")
-    print(f"WARNING: No [DATE] marker in ALLOW_LIST for '{table_name}'")
+                logger.warning("Date field '%s' marked in ALLOW_LIST but not found in QuickBase", clean_name)
+    logger.warning("No [DATE] marker in ALLOW_LIST for '%s'", table_name)
     return None
 
 def find_name_field_from_allowlist(table_name: str, field_map: Dict[str, Dict[str, Any]]) -> Optional[int]:
@@ -39,7 +41,7 @@ def find_name_field_from_allowlist(table_name: str, field_map: Dict[str, Dict[st
             clean_name = clean_field_name(field_name)
             if clean_name in field_map:
                 return field_map[clean_name]["id"]
-    print(f"WARNING: No [KEY] marker found in ALLOW_LIST for '{table_name}'")
+    logger.warning("No [KEY] marker found in ALLOW_LIST for '%s'", table_name)
     return None
 
 def find_related_key_fields_from_allowlist(table_name: str, field_map: Dict[str, Dict[str, Any]]) -> List[int]:
@@ -53,7 +55,7 @@ def find_related_key_fields_from_allowlist(table_name: str, field_map: Dict[str,
             if clean_name in field_map:
                 field_id = field_map[clean_name]["id"]
                 related_fids.append(field_id)
-                print(f"DEBUG: Found RELATED KEY field '{clean_name}' (FID {field_id})")
+                logger.debug("Found RELATED KEY field '%s' (FID %s)", clean_name, field_id)
     return related_fids
 
 def find_unique_fields_from_allowlist(query: str, table_name: str, field_map: Dict[str, Dict[str, Any]]) -> List[int]:
@@ -83,9 +85,9 @@ def get_relationship_operator(parent_table: str, child_table: str, ref_field_lab
         operator = ".TV."
     else:
         operator = ".EX."
-    print(
-        f"INFO: Operator decision → parent={parent_table}, child={child_table}, "
-        f"field='{ref_field_label}', operator={operator}"
+    logger.debug(
+        "Operator decision → parent=%s, child=%s, field='%s', operator=%s",
+        parent_table, child_table, ref_field_label, operator
     )
     return operator
 
@@ -93,7 +95,7 @@ def get_sort_field_id(sort_field_name: str, table_name: str, field_map: Dict[str
     """Get field ID for exact field name - Bedrock provides exact name."""
     if sort_field_name in field_map:
         field_id = field_map[sort_field_name]["id"]
-        print(f"DEBUG: Found sort field '{sort_field_name}' (FID {field_id})")
+        logger.debug("Found sort field '%s' (FID %s)", sort_field_name, field_id)
         return field_id
-    print(f"WARNING: Sort field '{sort_field_name}' not found in '{table_name}'")
+    logger.warning("Sort field '%s' not found in '%s'", sort_field_name, table_name)
     return None
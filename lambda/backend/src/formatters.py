@@ -1,10 +1,14 @@
-import json, re
+import json, re, logging
 from typing import Dict, Any, Optional, List
 
 from src.quickbase_api import load_field_map
 from src.config import ALLOW_LISTS
 from src.field_detection import clean_field_name
 from src.attachments import process_attachment
+from src.attachment_archive import current_archive
+from src.record_batch import RecordBatch, FormattedBatch
+
+logger = logging.getLogger("quickbase-agent")
 
 def format_record(
     record: Dict[str, Any],
@@ -14,6 +18,8 @@ def format_record(
     """
     Format a record and, for any Quickbase file fields, upload the file to S3
     and replace the value with a presigned S3 URL so the CSV has a direct link.
+    Inside attachment_archive() the file goes into the report's zip instead and
+    the value is its path within the archive.
     """
     field_map = load_field_map(table["id"])
     table_entry = ALLOW_LISTS.get(table["name"], {})
@@ -21,60 +27,101 @@ def format_record(
         field_labels = table_entry.get("fields", list(field_map.keys()))
     output: Dict[str, Any] = {}
     rid_meta = field_map.get("Record ID#")
-    record_id: Optional[int] = None
-    if rid_meta:
-        rid_fid = str(rid_meta["id"])
-        record_id = record.get(rid_fid, {}).get("value")
-        if isinstance(record_id, str) and record_id.isdigit():
-            record_id = int(record_id)
-        elif isinstance(record_id, (int, float)):
-            record_id = int(record_id)
-        else:
-            record_id = None
+    record_id = _record_id(record.get(str(rid_meta["id"]), {}).get("value")) if rid_meta else None
     for label in field_labels:
         clean_label = clean_field_name(label)
         if clean_label not in field_map:
             continue
         meta = field_map[clean_label]
         fid_str = str(meta["id"])
-        ftype = meta.get("type")
         raw = record.get(fid_str, {})
         val = raw.get("value")
-        if ftype == "file" and isinstance(val, dict):
-            qb_url = val.get("url") or ""
-            version = 1
-            versions = val.get("versions", [])
-            if isinstance(versions, list) and versions:
-                vnum = versions[0].get("versionNumber")
-                if isinstance(vnum, (int, float)) or (isinstance(vnum, str) and vnum.isdigit()):
-                    version = int(vnum)
-            rid = record_id
-            if not rid and qb_url:
-                m = re.match(r"^/files/[^/]+/(\d+)/(\d+)/(?:\d+)", qb_url)
-                if m:
-                    rid = int(m.group(1))
-                    m_ver = re.match(r"^/files/[^/]+/\d+/\d+/(\d+)", qb_url)
-                    if m_ver:
-                        version = int(m_ver.group(1))
-            if rid:
-                try:
-                    s3_url = process_attachment(
-                        table_id=table["id"],
-                        record_id=int(rid),
-                        field_id=int(fid_str),
-                        version=int(version),
-                        s3_name_prefix=table["name"].lower().replace(" ", "_")
-                    )
-                    output[clean_label] = s3_url or qb_url
-                except Exception as e:
-                    print(f"ERROR: Attachment handling failed for '{clean_label}' (record {rid}): {e}")
-                    output[clean_label] = qb_url
-            else:
-                output[clean_label] = qb_url
+        if meta.get("type") == "file" and isinstance(val, dict):
+            output[clean_label] = _format_file_value(val, table, clean_label, fid_str, record_id)
             continue
         output[clean_label] = val
     return output
 
+def format_batch(
+    batch: RecordBatch,
+    table: Dict[str, str],
+    field_labels: Optional[List[str]] = None
+) -> FormattedBatch:
+    """
+    format_record() for a whole RecordBatch at once: same columns and values, but
+    only file columns are rebuilt (row by row, for their attachments); every other
+    column is passed through without copying.
+    """
+    field_map = load_field_map(table["id"])
+    if not field_labels:
+        field_labels = ALLOW_LISTS.get(table["name"], {}).get("fields", list(field_map.keys()))
+    rid_meta = field_map.get("Record ID#")
+    record_ids: Optional[List[Optional[int]]] = None
+    columns: Dict[str, List[Any]] = {}
+    for label in field_labels:
+        clean_label = clean_field_name(label)
+        if clean_label not in field_map:
+            continue
+        meta = field_map[clean_label]
+        fid = int(meta["id"])
+        values = batch.columns.get(fid)
+        if values is None:
+            values = [None] * len(batch)
+        elif meta.get("type") == "file":
+            if record_ids is None:
+                rid_values = batch.columns.get(int(rid_meta["id"])) if rid_meta else None
+                record_ids = [_record_id(v) for v in rid_values] if rid_values is not None else [None] * len(batch)
+            values = [
+                _format_file_value(v, table, clean_label, str(fid), rid) if isinstance(v, dict) else v
+                for v, rid in zip(values, record_ids)
+            ]
+        columns[clean_label] = values
+    return FormattedBatch(list(columns), list(columns.values()), len(batch))
+
+def _record_id(value: Any) -> Optional[int]:
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if isinstance(value, (int, float)):
+        return int(value)
+    return None
+
+def _format_file_value(val: Dict[str, Any], table: Dict[str, str], clean_label: str, fid_str: str, record_id: Optional[int]) -> Any:
+    """Presigned S3 URL (or path inside the active archive) for one file field value."""
+    qb_url = val.get("url") or ""
+    version = 1
+    versions = val.get("versions", [])
+    if isinstance(versions, list) and versions:
+        vnum = versions[0].get("versionNumber")
+        if isinstance(vnum, (int, float)) or (isinstance(vnum, str) and vnum.isdigit()):
+            version = int(vnum)
+    rid = record_id
+    if not rid and qb_url:
+        m = re.match(r"^/files/[^/]+/(\d+)/(\d+)/(?:\d+)", qb_url)
+        if m:
+            rid = int(m.group(1))
+            m_ver = re.match(r"^/files/[^/]+/\d+/\d+/(\d+)", qb_url)
+            if m_ver:
+                version = int(m_ver.group(1))
+    archive = current_archive()
+    if rid and archive is not None:
+        file_name = versions[0].get("fileName") if isinstance(versions, list) and versions else None
+        path = archive.add(table, int(rid), int(fid_str), int(version), file_name or val.get("fileName"))
+        return path or qb_url
+    if rid:
+        try:
+            s3_url = process_attachment(
+                table_id=table["id"],
+                record_id=int(rid),
+                field_id=int(fid_str),
+                version=int(version),
+                s3_name_prefix=table["name"].lower().replace(" ", "_")
+            )
+            return s3_url or qb_url
+        except Exception as e:
+            logger.error("Attachment handling failed for '%s' (record %s): %s", clean_label, rid, e)
+            return qb_url
+    return qb_url
+
 def format_parent_with_children(
     parent_record: Dict[str, Any],
     parent_table: Dict[str, str],
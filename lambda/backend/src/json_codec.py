@@ -0,0 +1,32 @@
+import json, logging
+from typing import Any, Union
+
+from src.config import JSON_CODEC
+
+logger = logging.getLogger("quickbase-agent")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_fast = orjson is not None and JSON_CODEC != "stdlib"
+
+def codec_name() -> str:
+    return "orjson" if _fast else "stdlib"
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """Parse JSON from bytes (no separate decode step) or str."""
+    if _fast:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj: Any) -> str:
+    """Compact-enough JSON text; values json can't encode are stringified, as with default=str."""
+    if _fast:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib handles those
+            pass
+    return json.dumps(obj, default=str)
@@ -0,0 +1,94 @@
+import json, logging, threading, time
+from typing import Dict, Any, Optional
+
+from src.config import LOG_LEVEL, LOG_BUDGET_BYTES, LOG_BUDGET_LINES, LOG_SAMPLE_AFTER, LOG_SAMPLE_EVERY
+
+logger = logging.getLogger("quickbase-agent")
+
+class LazyJson:
+    """Defer json.dumps until a log record is actually emitted."""
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj: Any, indent: Optional[int] = None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.obj, default=str, indent=self.indent)
+
+class LogBudgetFilter(logging.Filter):
+    """
+    Per-invocation log budget for the 'quickbase-agent' logger.
+    - ERROR and above always pass (but still count against the budget).
+    - Each message template may log LOG_SAMPLE_AFTER times, then 1 in LOG_SAMPLE_EVERY.
+    - Once the line or byte budget is spent, lower-level records are dropped.
+    Records logged with extra={"budget_exempt": True} bypass all checks.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.lines = 0
+            self.bytes = 0
+            self.sampled_out = 0
+            self.over_budget = 0
+            self._template_counts: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "budget_exempt", False):
+            return True
+        with self._lock:
+            template = str(record.msg)
+            count = self._template_counts.get(template, 0) + 1
+            self._template_counts[template] = count
+            if record.levelno < logging.ERROR:
+                if count > LOG_SAMPLE_AFTER and (count - LOG_SAMPLE_AFTER) % max(LOG_SAMPLE_EVERY, 1) != 0:
+                    self.sampled_out += 1
+                    return False
+                if self.lines >= LOG_BUDGET_LINES or self.bytes >= LOG_BUDGET_BYTES:
+                    self.over_budget += 1
+                    return False
+            # Formatting happens here only for records that will actually be written
+            size = len(record.getMessage())
+            self.lines += 1
+            self.bytes += size
+            return True
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            top = sorted(self._template_counts.items(), key=lambda kv: -kv[1])[:3]
+            return {
+                "log_lines": self.lines,
+                "log_bytes": self.bytes,
+                "sampled_out": self.sampled_out,
+                "over_budget": self.over_budget,
+                "top_templates": [{"template": t[:80], "count": c} for t, c in top],
+                "elapsed": round(time.time() - self.started, 3),
+            }
+
+_budget_filter = LogBudgetFilter()
+
+def configure_logging() -> None:
+    """Apply LOG_LEVEL and attach the budget filter once per container."""
+    logger.setLevel(LOG_LEVEL)
+    if _budget_filter not in logger.filters:
+        logger.addFilter(_budget_filter)
+
+def reset_log_budget() -> None:
+    """Start a fresh budget for a new invocation."""
+    _budget_filter.reset()
+
+def log_budget_summary() -> None:
+    """
+    Emit the single end-of-invocation summary line (never suppressed by the budget).
+    Logged at WARNING when anything was dropped or sampled, so it still shows under
+    LOG_LEVEL=WARNING, where the logger's level check runs before the filter.
+    """
+    summary = _budget_filter.summary()
+    level = logging.WARNING if summary["sampled_out"] or summary["over_budget"] else logging.INFO
+    logger.log(level, "Log summary: %s", LazyJson(summary), extra={"budget_exempt": True})
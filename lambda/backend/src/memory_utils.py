@@ -0,0 +1,191 @@
+import os, sys, time, logging, resource, threading, tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+from src.config import MEMORY_GOVERNOR_ENABLED, MEMORY_LIMIT_MB, MEMORY_SPILL_FRACTION, MEMORY_TRACEMALLOC
+
+logger = logging.getLogger("quickbase-agent")
+
+MB = 1024 * 1024
+# How many rows the governor measures before extrapolating to the whole result
+SAMPLE_ROWS = 20
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+def max_rss_mb() -> float:
+    """Peak RSS over the life of the process (what Lambda reports as Max Memory Used)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+class MemoryTracker:
+    """
+    Per-invocation memory accounting. Each stage records RSS on entry and exit and
+    the highest RSS sampled while it ran; with MEMORY_TRACEMALLOC the stage's peak
+    Python allocation is recorded too (nested stages fold their peaks into the parent).
+    Stages nest per thread, so parallel parent workers each keep their own stack.
+    """
+
+    def __init__(self):
+        self.limit_mb = MEMORY_LIMIT_MB
+        self.stages: List[Dict[str, Any]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.spills = 0
+        self.started = time.time()
+
+    @property
+    def _stack(self) -> List[Dict[str, Any]]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def reset(self, limit_mb: Optional[int] = None) -> None:
+        self.limit_mb = limit_mb or MEMORY_LIMIT_MB
+        self.stages = []
+        self._local = threading.local()
+        self.spills = 0
+        self.started = time.time()
+        if MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def sample(self) -> float:
+        """Current RSS, folded into the peak of every open stage."""
+        current = rss_mb()
+        for stage in self._stack:
+            stage["rss_peak_mb"] = max(stage["rss_peak_mb"], current)
+        return current
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        # Keep the stack pushed to: reset() from another invocation swaps self._local
+        # while this stage is still open, and the exit must not touch the new stack.
+        stack = self._stack
+        record = {"stage": name}
+        started = time.time()
+        try:
+            current = self.sample()
+            record.update(rss_start_mb=current, rss_peak_mb=current)
+            if tracemalloc.is_tracing():
+                if stack:
+                    parent = stack[-1]
+                    parent["py_peak_mb"] = max(parent.get("py_peak_mb", 0.0), tracemalloc.get_traced_memory()[1] / MB)
+                tracemalloc.reset_peak()
+            stack.append(record)
+        except Exception as e:
+            logger.debug("Memory tracking failed entering stage %s: %s", name, e)
+        try:
+            yield
+        finally:
+            # Bookkeeping only: never let it replace the stage's own result or exception
+            try:
+                self._close_stage(stack, record, started)
+            except Exception as e:
+                logger.debug("Memory tracking failed leaving stage %s: %s", name, e)
+
+    def _close_stage(self, stack: List[Dict[str, Any]], record: Dict[str, Any], started: float) -> None:
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is record:
+                del stack[i]
+                break
+        if "rss_start_mb" not in record:
+            return
+        if tracemalloc.is_tracing():
+            record["py_peak_mb"] = max(record.get("py_peak_mb", 0.0), tracemalloc.get_traced_memory()[1] / MB)
+            if stack:
+                parent = stack[-1]
+                parent["py_peak_mb"] = max(parent.get("py_peak_mb", 0.0), record["py_peak_mb"])
+        record["rss_end_mb"] = rss_mb()
+        record["rss_peak_mb"] = max(record["rss_peak_mb"], record["rss_end_mb"])
+        for parent in stack:
+            parent["rss_peak_mb"] = max(parent["rss_peak_mb"], record["rss_peak_mb"])
+        record["elapsed"] = round(time.time() - started, 3)
+        with self._lock:
+            self.stages.append({k: round(v, 1) if isinstance(v, float) and k != "elapsed" else v for k, v in record.items()})
+
+    def headroom_mb(self) -> Optional[float]:
+        """Memory left before the configured limit, or None when the limit is unknown."""
+        if not self.limit_mb:
+            return None
+        return self.limit_mb - self.sample()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "limit_mb": self.limit_mb or None,
+            "max_rss_mb": round(max_rss_mb(), 1),
+            "spills": self.spills,
+            "stages": self.stages,
+        }
+
+_tracker = MemoryTracker()
+
+def reset_memory_tracking(context: Any = None) -> None:
+    """Start a new invocation; the limit comes from the Lambda context when available."""
+    limit = getattr(context, "memory_limit_in_mb", None)
+    try:
+        limit = int(limit) if limit else None
+    except (TypeError, ValueError):
+        limit = None
+    _tracker.reset(limit)
+
+def memory_stage(name: str):
+    """Context manager recording memory use for one stage of the invocation."""
+    return _tracker.stage(name)
+
+def memory_summary() -> Dict[str, Any]:
+    return _tracker.summary()
+
+def memory_metrics() -> List[Dict[str, Any]]:
+    """CloudWatch datapoints for this invocation (timestamps added by the caller's batch)."""
+    metrics = [{"MetricName": "PeakMemoryMB", "Value": round(max_rss_mb(), 1), "Unit": "Megabytes"}]
+    if _tracker.spills:
+        metrics.append({"MetricName": "MemorySpills", "Value": _tracker.spills, "Unit": "Count"})
+    return metrics
+
+def log_memory_summary() -> None:
+    logger.info("Memory summary: %s", _tracker.summary())
+
+def _deep_size(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_deep_size(v) for v in value)
+    return size
+
+def estimate_rows_bytes(sample: List[Dict[str, Any]], total_rows: int) -> int:
+    """Estimated in-memory size of `total_rows` rows shaped like `sample` (widths measured, not guessed)."""
+    sample = sample[:SAMPLE_ROWS]
+    if not sample or total_rows <= 0:
+        return 0
+    # Plus the list slot holding each row
+    per_row = sum(_deep_size(row) for row in sample) / len(sample) + 8
+    return int(per_row * total_rows)
+
+def should_spill(sample: List[Dict[str, Any]], total_rows: int, what: str) -> bool:
+    """
+    Governor: True when holding `total_rows` rows like `sample` would take more than
+    MEMORY_SPILL_FRACTION of the memory still available, so the caller should stream
+    them to disk instead. Never spills when the limit is unknown or the governor is off.
+    """
+    if not MEMORY_GOVERNOR_ENABLED:
+        return False
+    headroom = _tracker.headroom_mb()
+    if headroom is None:
+        return False
+    estimate_mb = estimate_rows_bytes(sample, total_rows) / MB
+    if estimate_mb <= max(headroom, 0.0) * MEMORY_SPILL_FRACTION:
+        return False
+    with _tracker._lock:
+        _tracker.spills += 1
+    logger.warning(
+        "Spilling %s to disk: %d rows ≈ %.1fMB vs %.1fMB headroom (limit %dMB)",
+        what, total_rows, estimate_mb, headroom, _tracker.limit_mb
+    )
+    return True
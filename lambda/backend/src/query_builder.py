@@ -0,0 +1,166 @@
+import json, logging
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Union
+
+from src.config import QB_MAX_WHERE_TERMS
+
+logger = logging.getLogger("quickbase-agent")
+
+# Where-clause AST: ("cond", fid, op, value) leaves under ("and", children) / ("or", children).
+# Every node built through cond()/all_of()/any_of() is already simplified, so equal filters
+# compile to identical strings regardless of the order they were assembled in.
+Node = Tuple[Any, ...]
+
+# Quickbase text comparisons are case-insensitive, so these literals are case-folded
+TEXT_OPERATORS = {"EX", "XEX", "TV", "CT", "XCT", "SW", "XSW", "HAS", "XHAS"}
+DATE_UNITS = {"d": "days", "w": "weeks", "m": "months", "y": "years"}
+
+def escape_literal(value: Any) -> str:
+    """Query literal: numbers stay bare, everything else is quoted with ' and \\ escaped."""
+    if isinstance(value, bool):
+        return "'true'" if value else "'false'"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    text = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{text}'"
+
+def absolute_date(value: int, unit: str) -> str:
+    """ISO date `value` days/weeks/months/years before today (calendar months, clamped day)."""
+    n = int(value)
+    unit = (unit or "d")[0].lower()
+    today = date.today()
+    if unit == "d":
+        return (today - timedelta(days=n)).isoformat()
+    if unit == "w":
+        return (today - timedelta(weeks=n)).isoformat()
+    months = n * (12 if unit == "y" else 1)
+    year, month = divmod(today.month - 1 - months, 12)
+    year += today.year
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    days_in_month = [31, 29 if leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month]
+    return date(year, month + 1, min(today.day, days_in_month)).isoformat()
+
+def cond(fid: int, op: str, value: Any) -> Node:
+    op = op.strip(".").upper()
+    if isinstance(value, str):
+        value = value.strip()
+        if op in TEXT_OPERATORS:
+            value = value.lower()
+    return ("cond", int(fid), op, value)
+
+def date_since(fid: int, value: int, unit: str) -> Node:
+    """On-or-after filter for the last `value` units, always emitted as an absolute date."""
+    return cond(fid, "OAF", absolute_date(value, unit))
+
+def _combine(kind: str, nodes: Iterable[Optional[Node]]) -> Optional[Node]:
+    children: Dict[str, Node] = {}
+    for node in nodes:
+        if node is None:
+            continue
+        for child in (node[1] if node[0] == kind else (node,)):
+            children.setdefault(compile_where(child), child)
+    if not children:
+        return None
+    if len(children) == 1:
+        return next(iter(children.values()))
+    return (kind, tuple(children[k] for k in sorted(children)))
+
+def all_of(*nodes: Optional[Node]) -> Optional[Node]:
+    """AND of the given filters; None entries are ignored, nested ANDs are flattened."""
+    return _combine("and", nodes)
+
+def any_of(*nodes: Optional[Node]) -> Optional[Node]:
+    """OR of the given filters; None entries are ignored, nested ORs are flattened."""
+    return _combine("or", nodes)
+
+def record_id_filter(rid_fid: int, record_ids: Iterable[int]) -> Optional[Node]:
+    """Compact filter for a set of record IDs: contiguous runs become GTE/LTE ranges."""
+    ids = sorted(set(int(r) for r in record_ids))
+    parts, start = [], 0
+    for i in range(1, len(ids) + 1):
+        if i == len(ids) or ids[i] != ids[i - 1] + 1:
+            lo, hi = ids[start], ids[i - 1]
+            if hi - lo >= 2:
+                parts.append(all_of(cond(rid_fid, "GTE", lo), cond(rid_fid, "LTE", hi)))
+            else:
+                parts.extend(cond(rid_fid, "EX", rid) for rid in range(lo, hi + 1))
+            start = i
+    return any_of(*parts)
+
+def compile_where(node: Optional[Node]) -> str:
+    if node is None:
+        return ""
+    if node[0] == "cond":
+        _, fid, op, value = node
+        return f"{{{fid}.{op}.{escape_literal(value)}}}"
+    joiner = "AND" if node[0] == "and" else "OR"
+    return "(" + joiner.join(compile_where(child) for child in node[1]) + ")"
+
+def term_count(node: Optional[Node]) -> int:
+    if node is None:
+        return 0
+    if node[0] == "cond":
+        return 1
+    return sum(term_count(child) for child in node[1])
+
+def split_where(node: Optional[Node], max_terms: int = QB_MAX_WHERE_TERMS) -> List[Optional[Node]]:
+    """
+    Break an oversized filter into several smaller ones whose union is the original:
+    the largest OR (top level, or inside a top-level AND) is chunked and each chunk
+    keeps the remaining AND terms. Filters that fit, or have no OR to split, pass through.
+    """
+    if max_terms <= 0 or term_count(node) <= max_terms:
+        return [node]
+    if node[0] == "or":
+        ors, rest = node, []
+    elif node[0] == "and":
+        candidates = [c for c in node[1] if c[0] == "or"]
+        if not candidates:
+            return [node]
+        ors = max(candidates, key=term_count)
+        rest = [c for c in node[1] if c is not ors]
+    else:
+        return [node]
+    budget = max(1, max_terms - sum(term_count(c) for c in rest))
+    chunks, current, size = [], [], 0
+    for child in ors[1]:
+        n = term_count(child)
+        if current and size + n > budget:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(child)
+        size += n
+    if current:
+        chunks.append(current)
+    logger.debug("Split %d-term where clause into %d chunks", term_count(node), len(chunks))
+    return [all_of(any_of(*chunk), *rest) for chunk in chunks]
+
+def build_body(
+    where: Optional[Node] = None,
+    select: Optional[List[int]] = None,
+    sort_by: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """records/query body with a compiled where clause and de-duplicated select list."""
+    body: Dict[str, Any] = {}
+    if where is not None:
+        body["where"] = compile_where(where)
+    if select:
+        body["select"] = list(dict.fromkeys(int(f) for f in select))
+    if sort_by:
+        body["sortBy"] = [{"fieldId": int(s["fieldId"]), "order": str(s.get("order", "ASC")).upper()} for s in sort_by]
+    return body
+
+def build_bodies(
+    where: Optional[Node] = None,
+    select: Optional[List[int]] = None,
+    sort_by: Optional[List[Dict[str, Any]]] = None,
+    max_terms: int = QB_MAX_WHERE_TERMS
+) -> List[Dict[str, Any]]:
+    """One body per where-clause chunk (a single body unless the filter is oversized)."""
+    return [build_body(chunk, select, sort_by) for chunk in split_where(where, max_terms)]
+
+def canonical_body(body: Union[Dict[str, Any], List[Any]]) -> bytes:
+    """Stable wire form: logically equal bodies serialize to identical bytes."""
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
@@ -1,22 +1,166 @@
-import json, logging
-from typing import Dict, Any, List
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from itertools import chain
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 from src.quickbase_api import quickbase_query, load_field_map
-from src.config import ALLOW_LISTS, SLACK_CHANNEL_ID, SLACK_BOT_TOKEN
+from src.config import ALLOW_LISTS, SLACK_CHANNEL_ID, SLACK_BOT_TOKEN, EXPORT_FLATTEN_MODE, RECORD_BATCH_ENABLED, PARENT_CHILD_WORKERS
 from src.field_detection import (
     clean_field_name, find_name_field_from_allowlist,
     find_related_key_fields_from_allowlist, find_unique_fields_from_allowlist,
     find_date_field_from_allowlist, get_sort_field_id
 )
-from src.formatters import format_record
+from src.formatters import format_record, format_batch
 from src.table_relationships import normalize_record_name
-from src.summary import generate_summary
-from src.exports import save_all_formats, save_to_s3
+from src.summary import generate_summary, SummaryBuilder
+from src.exports import save_all_formats, save_to_s3, save_json_to_s3, CsvSpool
 from src.slack_utils import send_batched_slack_messages
-from src.record_retrieval import get_child_records
+from src.record_retrieval import get_child_record_pages, get_children_for_parents, query_bodies, query_pages
+from src.record_batch import RecordBatch
+from src.entity_index import get_entity_index, normalize_entity
+from src.query_builder import Node, all_of, any_of, build_bodies, compile_where, cond, date_since, record_id_filter
+from src.table_traversal import plan_traversal, fetch_levels, flatten_tree, nest_tree, descendant_records, formatted_record, flat_columns
+from src.attachment_archive import attachment_archive
+from src.memory_utils import memory_stage, should_spill, SAMPLE_ROWS
+from src.deadline import current_deadline, DeadlineExceeded
 
 logger = logging.getLogger("quickbase-agent")
 
+# Set as a result's "error" when there was data but no export URL (S3 failing or unavailable)
+EXPORT_FAILED = "Export to S3 failed; only the summary is available"
+
+def build_entity_clause(
+    table: Dict[str, str],
+    field_map: Dict[str, Dict[str, Any]],
+    names: List[str],
+    prompt: str,
+    fuzzy_matches: Optional[List[Dict[str, Any]]] = None
+) -> Optional[Node]:
+    """
+    Filter matching any of `names` on the table's [KEY], [RELATED KEY] and [UNIQUE]
+    fields. Names the entity index resolves become one compact Record ID# filter;
+    anything it cannot resolve keeps the per-field EX conditions. Names resolved by
+    fuzzy match are appended to `fuzzy_matches` so the response can say so.
+    """
+    allow_list = ALLOW_LISTS.get(table["name"], {}).get("fields", [])
+    if not names or not allow_list:
+        return None
+    name_fid = find_name_field_from_allowlist(table["name"], field_map)
+    related_fids = find_related_key_fields_from_allowlist(table["name"], field_map)
+    unique_fids = find_unique_fields_from_allowlist(prompt, table["name"], field_map)
+    search_fids = ([name_fid] if name_fid else []) + related_fids + unique_fids
+    if not search_fids:
+        return None
+    try:
+        index = get_entity_index(table["id"], field_map, search_fids)
+    except Exception as e:
+        logger.warning("Entity index unavailable for '%s', using field clauses: %s", table["name"], e)
+        index = None
+    record_ids = set()
+    name_filters = []
+    for name in names:
+        rids, matched, score = index.lookup(name) if index is not None else (set(), None, 0.0)
+        if rids:
+            if matched != normalize_entity(name):
+                logger.info("Entity '%s' resolved to '%s' (score %.2f) in '%s'", name, matched, score, table["name"])
+                if fuzzy_matches is not None:
+                    fuzzy_matches.append({"requested": name, "matched": matched, "score": round(score, 2), "table": table["name"]})
+            record_ids |= rids
+        else:
+            name_filters.extend(cond(fid, "EX", name) for fid in search_fids)
+    if record_ids:
+        name_filters.append(record_id_filter(index.rid_fid, record_ids))
+    return any_of(*name_filters)
+
+def _note_entity_matches(results: List[Dict[str, Any]], fuzzy_matches: List[Dict[str, Any]]) -> None:
+    """Tell the agent which entity names were fuzzy-matched rather than found as written."""
+    if not fuzzy_matches:
+        return
+    for r in results:
+        r["entity_matches"] = fuzzy_matches
+
+def _save_spool(spool: CsvSpool, rec_name: str) -> Dict[str, str]:
+    """save_all_formats() for rows the memory governor spilled to disk."""
+    try:
+        return {"csv": spool.save_to_s3(prefix="reports", record_name=rec_name)}
+    except Exception as e:
+        logger.exception("Failed to save spooled CSV for %s: %s", rec_name, e)
+        return {}
+
+def _archive_report(url: str) -> Dict[str, str]:
+    return {"format": "ZIP", "label": "Download Attachments (ZIP)", "url": url}
+
+def _report_row(table: Dict[str, str], allow_list: List[str]) -> Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """_collect_rows() converter for a single-table report, which exports what it summarizes."""
+    def convert(raw: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        record = format_record(raw, table, field_labels=allow_list)
+        return record, record
+    return convert
+
+def _collect_rows(
+    pages: Iterable[List[Dict[str, Any]]],
+    convert: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[str, Any]]],
+    summary: SummaryBuilder,
+    what: str,
+    spool: Optional[CsvSpool] = None
+) -> Tuple[List[Dict[str, Any]], Optional[CsvSpool]]:
+    """
+    Format pages as they are fetched. `convert` turns a raw row into the record to
+    summarize and the row to export. The governor is asked once SAMPLE_ROWS rows are
+    held and again before every later page, so a report moves to a CsvSpool while it
+    is still being fetched; each raw page is dropped once it is formatted.
+    """
+    rows: List[Dict[str, Any]] = []
+    for page in pages:
+        expected = len(rows) + len(page)
+        if spool is None and len(rows) >= SAMPLE_ROWS and should_spill(rows[:SAMPLE_ROWS], expected, what):
+            spool = CsvSpool()
+            spool.extend(rows)
+            rows = []
+        for raw in page:
+            record, row = convert(raw)
+            summary.add(record)
+            if spool is not None:
+                spool.append(row)
+                continue
+            rows.append(row)
+            if len(rows) == SAMPLE_ROWS and should_spill(rows, expected, what):
+                spool = CsvSpool()
+                spool.extend(rows)
+                rows = []
+    return rows, spool
+
+def _collect_batch(
+    pages: Iterator[List[Dict[str, Any]]],
+    table: Dict[str, str],
+    fids: List[Any],
+    allow_list: List[str],
+    summary: SummaryBuilder,
+    what: str
+) -> Tuple[Any, Optional[CsvSpool]]:
+    """
+    Columnar counterpart of _collect_rows(): pages fill a RecordBatch that is formatted
+    in one pass at the end. The governor is asked before every page; if it says spill,
+    the rows batched so far are formatted into a CsvSpool and the remaining pages go
+    through _collect_rows().
+    """
+    batch = RecordBatch.for_table(table, fids)
+    for page in pages:
+        sample = [batch.row(i) for i in range(min(SAMPLE_ROWS, len(batch)))] or page[:SAMPLE_ROWS]
+        if should_spill(sample, len(batch) + len(page), what):
+            spool = CsvSpool()
+            if len(batch):
+                formatted = format_batch(batch, table, field_labels=allow_list)
+                summary.add_batch(formatted)
+                spool.extend([formatted.row(i) for i in range(len(formatted))])
+                batch = formatted = None
+            return _collect_rows(chain([page], pages), _report_row(table, allow_list), summary, what, spool=spool)
+        batch.append_page(page)
+    formatted = format_batch(batch, table, field_labels=allow_list)
+    summary.add_batch(formatted)
+    return formatted, None
+
 def handle_single_table(parsed: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
     """Process single table query."""
     results = []
@@ -26,73 +170,65 @@ def handle_single_table(parsed: Dict[str, Any], limit: int) -> List[Dict[str, An
     field_map = load_field_map(table["id"])
     table_entry = ALLOW_LISTS.get(table["name"], {})
     allow_list = table_entry.get("fields", [])
-    body = {}
-    where_clauses = []
-    if parsed["names"] and allow_list:
-        name_fid = find_name_field_from_allowlist(table["name"], field_map)
-        related_fids = find_related_key_fields_from_allowlist(table["name"], field_map)
-        unique_fids = find_unique_fields_from_allowlist(parsed.get("original_prompt", ""), table["name"], field_map)
-        if name_fid or related_fids or unique_fids:
-            search_fids = []
-            if name_fid:
-                search_fids.append(name_fid)
-            search_fids.extend(related_fids)
-            search_fids.extend(unique_fids)
-            name_clauses = []
-            for name in parsed["names"]:
-                field_clauses = [f"{{{fid}.EX.'{name}'}}" for fid in search_fids]
-                name_clauses.append("OR".join(field_clauses))
-            if len(name_clauses) > 1:
-                where_clauses.append("(" + "OR".join([f"({c})" for c in name_clauses]) + ")")
-            elif name_clauses:
-                where_clauses.append("(" + name_clauses[0] + ")")
+    date_filter = None
     if parsed.get("date_filter_value") and parsed.get("date_filter_unit"):
-        value = parsed["date_filter_value"]
-        unit = parsed["date_filter_unit"]
         date_fid = find_date_field_from_allowlist(table["name"], field_map)
         if date_fid:
-            date_clause = f"{{{date_fid}.OAF.'today-{value}{unit}'}}"
-            where_clauses.append(date_clause)
-            logger.debug(f"Added date filter: {date_clause}")
+            date_filter = date_since(date_fid, parsed["date_filter_value"], parsed["date_filter_unit"])
+            logger.debug("Added date filter: %s", compile_where(date_filter))
         else:
-            logger.warning(f"No date field in ALLOW_LIST for '{table['name']}'")
-    if where_clauses:
-        where_clause = "AND".join(where_clauses)
-        body["where"] = where_clause
-        logger.debug(f"Query WHERE: {where_clause}")
+            logger.warning("No date field in ALLOW_LIST for '%s'", table['name'])
+    fuzzy_matches: List[Dict[str, Any]] = []
+    where = all_of(build_entity_clause(table, field_map, parsed["names"], parsed.get("original_prompt", ""), fuzzy_matches), date_filter)
+    if where is not None:
+        logger.debug("Query WHERE: %s", compile_where(where))
+    sort_by = None
     if parsed.get("sort_by"):
         sort_field_id = get_sort_field_id(parsed["sort_by"], table["name"], field_map)
         if sort_field_id:
             sort_order = parsed.get("sort_order", "DESC")
-            body["sortBy"] = [{"fieldId": sort_field_id, "order": sort_order}]
-            logger.debug(f"Sort by FID {sort_field_id} ({sort_order})")
+            sort_by = [{"fieldId": sort_field_id, "order": sort_order}]
+            logger.debug("Sort by FID %s (%s)", sort_field_id, sort_order)
     select_fields = []
     for lbl in allow_list:
         clean_lbl = clean_field_name(lbl)
         if clean_lbl in field_map:
             select_fields.append(field_map[clean_lbl]["id"])
         else:
-            logger.warning(f"Field '{clean_lbl}' not found in field_map for table '{table['name']}'")
+            logger.warning("Field '%s' not found in field_map for table '%s'", clean_lbl, table['name'])
     if "Record ID#" in field_map:
         rid_field_id = field_map["Record ID#"]["id"]
         if rid_field_id not in select_fields:
             select_fields.insert(0, rid_field_id)
-    if select_fields:
-        body["select"] = select_fields
-    rows = quickbase_query(table["id"], body, max_records=limit)
-    all_records = []
-    for r in rows:
-        formatted = format_record(r, table, field_labels=allow_list)
-        all_records.append(formatted)
-    if all_records:
-        rec_name = normalize_record_name(table, record=rows[0], parsed_names=parsed["names"], field_map=field_map)
-        summary_data = generate_summary(all_records, table["name"], rec_name)
-        urls = save_all_formats(
-            all_records,
-            rec_name,
-            parsed["formats"],
-            summary=summary_data["insights"]
-        )
+    bodies = build_bodies(where, select_fields, sort_by)
+    summary = SummaryBuilder()
+    what = f"'{table['name']}' report"
+    all_records, spool = [], None
+    pages = query_pages(table, bodies, max_records=limit)
+    with memory_stage("fetch"):
+        first = next((page for page in pages if page), [])
+    if first:
+        rec_name = normalize_record_name(table, record=first[0], parsed_names=parsed["names"], field_map=field_map)
+        # Later pages are fetched while earlier ones are formatted, so the governor can spill mid-fetch
+        with memory_stage("format"), attachment_archive(rec_name) as archive:
+            if RECORD_BATCH_ENABLED:
+                # Columnar path: no per-row dicts between the Quickbase page and the CSV
+                all_records, spool = _collect_batch(chain([first], pages), table, bodies[0].get("select", []), allow_list, summary, what)
+            else:
+                all_records, spool = _collect_rows(chain([first], pages), _report_row(table, allow_list), summary, what)
+    if summary.total:
+        summary_data = summary.build(table["name"], rec_name)
+        with memory_stage("export"):
+            if spool is not None:
+                with spool:
+                    urls = _save_spool(spool, rec_name)
+            else:
+                urls = save_all_formats(
+                    all_records,
+                    rec_name,
+                    parsed["formats"],
+                    summary=summary_data["insights"]
+                )
         reports = []
         for fmt in ["csv", "json"]:
             if fmt in urls and urls[fmt]:
@@ -101,51 +237,127 @@ def handle_single_table(parsed: Dict[str, Any], limit: int) -> List[Dict[str, An
                     "label": f"Download {fmt.upper()} Report",
                     "url": urls[fmt]
                 })
+        if archive["url"]:
+            reports.append(_archive_report(archive["url"]))
         results.append({
             "record_name": rec_name,
             "summary": summary_data,
             "reports": reports
         })
+        if not urls.get("csv"):
+            results[-1]["error"] = EXPORT_FAILED
+    _note_entity_matches(results, fuzzy_matches)
     send_batched_slack_messages(results, SLACK_CHANNEL_ID, SLACK_BOT_TOKEN)
     return results
 
+def _build_parent_report(
+    p: Dict[str, Any],
+    rec_name: str,
+    parsed: Dict[str, Any],
+    parent: Dict[str, str],
+    child: Dict[str, str],
+    parent_map: Dict[str, Dict[str, Any]],
+    prefetched: Optional[Dict[Any, List[Dict[str, Any]]]]
+) -> Dict[str, Any]:
+    """One parent's report for handle_parent_child(): children, flat CSV, attachment archive and summary."""
+    if current_deadline().expired():
+        raise DeadlineExceeded(f"Request deadline reached before '{rec_name}'")
+    allow_list = ALLOW_LISTS.get(parent["name"], {}).get("fields", [])
+    child_fields = ALLOW_LISTS.get(child["name"], {}).get("fields", [])
+    pid = p[str(parent_map["Record ID#"]["id"])]["value"]
+    if prefetched is not None:
+        child_pages = [prefetched.pop(pid, [])]
+    else:
+        child_pages = get_child_record_pages(
+            parent,
+            child,
+            pid,
+            date_filter_value=parsed.get("date_filter_value"),
+            date_filter_unit=parsed.get("date_filter_unit")
+        )
+    child_summary = SummaryBuilder()
+    logger.debug("Building flat rows for '%s' + '%s' (parent ID %s)", parent['name'], child['name'], pid)
+    with memory_stage("format"), attachment_archive(rec_name) as archive:
+        parent_columns = flat_columns(parent, format_record(p, parent, field_labels=allow_list))
+
+        def convert(c: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+            child_formatted = format_record(c, child, field_labels=child_fields)
+            return child_formatted, {**parent_columns, **flat_columns(child, child_formatted)}
+
+        all_flat_rows, spool = _collect_rows(child_pages, convert, child_summary, f"'{rec_name}' report")
+        if not child_summary.total and parent_columns:
+            all_flat_rows.append(parent_columns)
+    if all_flat_rows:
+        logger.debug("First flat row has %d columns: %s", len(all_flat_rows[0]), list(all_flat_rows[0].keys())[:5])
+    logger.debug(
+        "Built %d flat rows for CSV (%d spooled), %d child records for summary",
+        len(all_flat_rows), spool.count if spool else 0, child_summary.total
+    )
+    summary_data = child_summary.build(child["name"], rec_name)
+    csv_url = None
+    try:
+        with memory_stage("export"):
+            if spool is not None:
+                with spool:
+                    csv_url = spool.save_to_s3(record_name=rec_name)
+                logger.info("Saved CSV with %d spooled rows", spool.count)
+            elif all_flat_rows:
+                csv_url = save_to_s3(all_flat_rows, record_name=rec_name)
+                logger.info("Saved CSV with %d rows", len(all_flat_rows))
+            else:
+                logger.warning("No data to save for CSV")
+    except Exception as e:
+        logger.exception("CSV save failed: %s", e)
+    reports = []
+    if csv_url:
+        reports.append({
+            "format": "CSV",
+            "label": "Download CSV Report",
+            "url": csv_url
+        })
+    if archive["url"]:
+        reports.append(_archive_report(archive["url"]))
+    if csv_url:
+        exports_md = "\n".join(["", "", "**Data Exports:**", f"- [CSV Format]({csv_url})"])
+        if isinstance(summary_data, dict):
+            for key in ("markdown", "text", "body", "summary"):
+                if key in summary_data and isinstance(summary_data[key], str):
+                    summary_data[key] += exports_md
+                    break
+            else:
+                summary_data["text"] = exports_md.lstrip("\n")
+            summary_data.setdefault("exports", {})
+            summary_data["exports"]["csv"] = csv_url
+        elif isinstance(summary_data, str) or summary_data is None:
+            summary_data = (summary_data or "") + exports_md
+        else:
+            logger.warning("summary_data is type %s; coercing to string", type(summary_data))
+            summary_data = str(summary_data) + exports_md
+        logger.debug("Embedded CSV presigned URL in summary output")
+    result = {
+        "record_name": rec_name,
+        "summary": summary_data,
+        "reports": reports
+    }
+    if not csv_url and (spool is not None or all_flat_rows):
+        result["error"] = EXPORT_FAILED
+    return result
+
 def handle_parent_child(parsed: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
     """Process parent+child query with S3 presigned URLs for attachments (CSV-only)."""
     results = []
     parent, child = parsed["tables"][:2]
     parent_map = load_field_map(parent["id"])
-    body = {}
-    where_clauses = []
-    if parsed["names"]:
-        parent_entry = ALLOW_LISTS.get(parent["name"], {})
-        allow_list = parent_entry.get("fields", [])
-        if allow_list:
-            name_fid = find_name_field_from_allowlist(parent["name"], parent_map)
-            related_fids = find_related_key_fields_from_allowlist(parent["name"], parent_map)
-            unique_fids = find_unique_fields_from_allowlist(parsed.get("original_prompt", ""), parent["name"], parent_map)
-            if name_fid or related_fids or unique_fids:
-                search_fids = []
-                if name_fid:
-                    search_fids.append(name_fid)
-                search_fids.extend(related_fids)
-                search_fids.extend(unique_fids)
-                name_clauses = []
-                for name in parsed["names"]:
-                    field_clauses = [f"{{{fid}.EX.'{name}'}}" for fid in search_fids]
-                    name_clauses.append("OR".join(field_clauses))
-                if len(name_clauses) > 1:
-                    where_clauses.append("(" + "OR".join([f"({c})" for c in name_clauses]) + ")")
-                elif name_clauses:
-                    where_clauses.append("(" + name_clauses[0] + ")")
-    if where_clauses:
-        body["where"] = "AND".join(where_clauses)
+    fuzzy_matches: List[Dict[str, Any]] = []
+    where = build_entity_clause(parent, parent_map, parsed["names"], parsed.get("original_prompt", ""), fuzzy_matches)
+    sort_by = None
     if parsed.get("sort_by"):
         sort_field_id = get_sort_field_id(parsed["sort_by"], parent["name"], parent_map)
         if sort_field_id:
             sort_order = parsed.get("sort_order", "DESC")
-            body["sortBy"] = [{"fieldId": sort_field_id, "order": sort_order}]
-            print(f"DEBUG: Parent sort by FID {sort_field_id} ({sort_order})")
-    allow_list = ALLOW_LISTS.get(parent["name"], [])
+            sort_by = [{"fieldId": sort_field_id, "order": sort_order}]
+            logger.debug("Parent sort by FID %s (%s)", sort_field_id, sort_order)
+    allow_list = ALLOW_LISTS.get(parent["name"], {}).get("fields", [])
     select_fields = []
     for lbl in allow_list:
         clean_lbl = clean_field_name(lbl)
@@ -154,143 +366,127 @@ def handle_parent_child(parsed: Dict[str, Any], limit: int) -> List[Dict[str, An
     rid_field_id = parent_map["Record ID#"]["id"]
     if rid_field_id not in select_fields:
         select_fields.insert(0, rid_field_id)
-    if select_fields:
-        body["select"] = select_fields
-    parents = quickbase_query(parent["id"], body, max_records=limit)
-    child_map = load_field_map(child["id"])
-    from src.summary import generate_summary
-    for p in parents:
-        pid = p[str(parent_map["Record ID#"]["id"])]["value"]
-        children = get_child_records(
+    with memory_stage("fetch"):
+        parents = query_bodies(parent, build_bodies(where, select_fields, sort_by), max_records=limit)
+        # One joined lookup for every parent when the mirror can serve it; otherwise per parent
+        prefetched = get_children_for_parents(
             parent,
             child,
-            pid,
+            [p[str(parent_map["Record ID#"]["id"])]["value"] for p in parents],
             date_filter_value=parsed.get("date_filter_value"),
             date_filter_unit=parsed.get("date_filter_unit")
         )
-        print(f"DEBUG: get_child_records() returned {len(children)} rows for parent ID {pid}")
-        parent_formatted = format_record(p, parent, field_labels=ALLOW_LISTS.get(parent["name"], []))
-        rec_name = normalize_record_name(parent, record=p, parsed_names=parsed["names"], field_map=parent_map)
-        all_flat_rows = []
-        child_records = []
-        child_entry = ALLOW_LISTS.get(child["name"], {})
-        child_fields = child_entry.get("fields", [])
-        print(f"DEBUG: Building flat rows for '{parent['name']}' + '{child['name']}' ({len(children)} children)")
-        if children:
-            for idx, c in enumerate(children, start=1):
-                child_formatted = format_record(c, child, field_labels=child_fields)
-                child_records.append(child_formatted)
-                flat_row = {}
-                for key, value in parent_formatted.items():
-                    if value is not None and value != "":
-                        col_name = f"{parent['name']}_{key}"
-                        if isinstance(value, dict) and "url" in value and "/files/" in value["url"]:
-                            try:
-                                version = 1
-                                if "versions" in value and value["versions"]:
-                                    version = value["versions"][0].get("versionNumber", 1)
-                                from src.attachments import process_attachment
-                                presigned_url = process_attachment(
-                                    table_id=parent["id"],
-                                    record_id=int(p.get(str(parent_map["Record ID#"]["id"]))["value"]),
-                                    field_id=int(parent_map[key]["id"]),
-                                    version=version,
-                                    s3_name_prefix=parent["name"].lower().replace(" ", "_")
-                                )
-                                flat_row[col_name] = presigned_url or value["url"]
-                                continue
-                            except Exception as e:
-                                print(f"ERROR: Failed to upload parent attachment {key}: {e}")
-                                flat_row[col_name] = str(value)
-                                continue
-                        if isinstance(value, (dict, list)):
-                            flat_row[col_name] = json.dumps(value)
-                        else:
-                            flat_row[col_name] = value
-                for key, value in child_formatted.items():
-                    if value is not None and value != "":
-                        col_name = f"{child['name']}_{key}"
-                        if isinstance(value, dict) and "url" in value and "/files/" in value["url"]:
-                            try:
-                                version = 1
-                                if "versions" in value and value["versions"]:
-                                    version = value["versions"][0].get("versionNumber", 1)
-                                from src.attachments import process_attachment
-                                presigned_url = process_attachment(
-                                    table_id=child["id"],
-                                    record_id=int(c.get(str(child_map["Record ID#"]["id"]))["value"]),
-                                    field_id=int(child_map[key]["id"]),
-                                    version=version,
-                                    s3_name_prefix=child["name"].lower().replace(" ", "_")
-                                )
-                                flat_row[col_name] = presigned_url or value["url"]
-                                continue
-                            except Exception as e:
-                                print(f"ERROR: Failed to upload child attachment {key}: {e}")
-                                flat_row[col_name] = str(value)
-                                continue
-                        if isinstance(value, (dict, list)):
-                            flat_row[col_name] = json.dumps(value)
-                        else:
-                            flat_row[col_name] = value
-                if flat_row:
-                    all_flat_rows.append(flat_row)
-                    if idx == 1:
-                        print(f"DEBUG: First flat row has {len(flat_row)} columns: {list(flat_row.keys())[:5]}")
-        else:
-            flat_row = {}
-            for key, value in parent_formatted.items():
-                if value is not None and value != "":
-                    col_name = f"{parent['name']}_{key}"
-                    if isinstance(value, (dict, list)):
-                        flat_row[col_name] = json.dumps(value)
-                    else:
-                        flat_row[col_name] = value
-            if flat_row:
-                all_flat_rows.append(flat_row)
-        print(f"DEBUG: Built {len(all_flat_rows)} total flat rows for CSV")
-        print(f"DEBUG: Built {len(child_records)} child records for summary")
-        summary_data = generate_summary(child_records, child["name"], rec_name)
-        csv_url = None
+    names = [
+        normalize_record_name(parent, record=p, parsed_names=parsed["names"], field_map=parent_map)
+        for p in parents
+    ]
+    # Parents are independent I/O-bound pipelines; run a bounded number at once and
+    # keep results in parent order. The Quickbase rate limiter and caches are shared.
+    # copy_context() carries per-request context (cache lookup sinks) into the workers.
+    workers = max(1, min(PARENT_CHILD_WORKERS, len(parents)))
+    skipped = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="qb-parent") as executor:
+        futures = [
+            executor.submit(copy_context().run, _build_parent_report, p, rec_name, parsed, parent, child, parent_map, prefetched)
+            for p, rec_name in zip(parents, names)
+        ]
+        for p, rec_name, future in zip(parents, names, futures):
+            try:
+                results.append(future.result())
+            except DeadlineExceeded:
+                skipped.append(p)
+            except Exception as e:
+                logger.exception("Report for '%s' failed: %s", rec_name, e)
+                results.append({
+                    "record_name": rec_name,
+                    "summary": {
+                        "title": f"{rec_name} Summary",
+                        "statistics": {},
+                        "insights": f"The {child['name']} report for {rec_name} could not be built: {e}",
+                        "bedrock_context": f"Report failed: {e}"
+                    },
+                    "reports": [],
+                    "error": str(e)
+                })
+    if skipped:
+        # Out of time: report what finished and name the parents to ask for next
+        name_fid = find_name_field_from_allowlist(parent["name"], parent_map)
+        remaining = [(p.get(str(name_fid)) or {}).get("value") for p in skipped] if name_fid else []
+        current_deadline().mark_partial(
+            f"{len(skipped)} of {len(parents)} {parent['name']} record(s) not processed",
+            remaining_entities=[str(v) for v in remaining if v not in (None, "")]
+        )
+    from src.config import SLACK_CHANNEL_ID, SLACK_BOT_TOKEN
+    from src.slack_utils import send_batched_slack_messages
+    _note_entity_matches(results, fuzzy_matches)
+    send_batched_slack_messages(results, SLACK_CHANNEL_ID, SLACK_BOT_TOKEN)
+    return results
+
+def handle_multi_table(parsed: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """
+    Process a 3+ table query (e.g. Customers → Tickets → Ticket Notes): the root table is
+    filtered like a parent, then each level below is fetched in parallel with batched
+    foreign-key filters. One report per root record; flattened CSV rows (one per
+    root-to-leaf path) when EXPORT_FLATTEN_MODE is on, otherwise a nested JSON document.
+    """
+    results = []
+    steps = plan_traversal(parsed["tables"])
+    root = steps[0]["table"]
+    root_map = load_field_map(root["id"])
+    fuzzy_matches: List[Dict[str, Any]] = []
+    where = build_entity_clause(root, root_map, parsed["names"], parsed.get("original_prompt", ""), fuzzy_matches)
+    sort_by = None
+    if parsed.get("sort_by"):
+        sort_field_id = get_sort_field_id(parsed["sort_by"], root["name"], root_map)
+        if sort_field_id:
+            sort_by = [{"fieldId": sort_field_id, "order": parsed.get("sort_order", "DESC")}]
+    select_fields = [root_map["Record ID#"]["id"]]
+    for lbl in ALLOW_LISTS.get(root["name"], {}).get("fields", []):
+        clean_lbl = clean_field_name(lbl)
+        if clean_lbl in root_map:
+            select_fields.append(root_map[clean_lbl]["id"])
+    roots = query_bodies(root, build_bodies(where, select_fields, sort_by), max_records=limit)
+    levels = fetch_levels(
+        steps,
+        roots,
+        date_filter_value=parsed.get("date_filter_value"),
+        date_filter_unit=parsed.get("date_filter_unit")
+    )
+    truncated = [s["table"]["name"] for s in steps if levels.get(s["table"]["id"], {}).get("truncated")]
+    if truncated:
+        logger.warning("Multi-table report truncated at: %s", truncated)
+    deepest = max(steps, key=lambda s: s["depth"])
+    for r in roots:
+        rec_name = normalize_record_name(root, record=r, parsed_names=parsed["names"], field_map=root_map)
+        descendants = descendant_records(steps[0], r, steps, levels)
+        leaf_rows = descendants.get(deepest["table"]["id"], [])
+        with attachment_archive(rec_name) as archive:
+            leaf_records = [formatted_record(deepest["table"], row, levels) for row in leaf_rows]
+            export = (flatten_tree if EXPORT_FLATTEN_MODE else nest_tree)(steps[0], r, steps, levels)
+        summary_data = generate_summary(leaf_records, deepest["table"]["name"], rec_name)
+        for s in steps[1:]:
+            summary_data["statistics"][f"{s['table']['name']} records"] = len(descendants.get(s["table"]["id"], []))
+        if truncated:
+            summary_data["statistics"]["truncated_tables"] = ", ".join(truncated)
+        reports = []
         try:
-            if all_flat_rows:
-                csv_url = save_to_s3(all_flat_rows, record_name=rec_name)
-                print(f"SUCCESS: Saved CSV with {len(all_flat_rows)} rows")
+            if EXPORT_FLATTEN_MODE:
+                url = save_to_s3(export, record_name=rec_name)
+                reports.append({"format": "CSV", "label": "Download CSV Report", "url": url})
             else:
-                print("WARNING: No data to save for CSV")
+                url = save_json_to_s3(export, record_name=rec_name)
+                reports.append({"format": "JSON", "label": "Download JSON Report", "url": url})
         except Exception as e:
-            print(f"ERROR: CSV save failed: {e}")
-            import traceback; traceback.print_exc()
-        reports = []
-        if csv_url:
-            reports.append({
-                "format": "CSV",
-                "label": "Download CSV Report",
-                "url": csv_url
-            })
-        if csv_url:
-            exports_md = "\n".join(["", "", "**Data Exports:**", f"- [CSV Format]({csv_url})"])
-            if isinstance(summary_data, dict):
-                for key in ("markdown", "text", "body", "summary"):
-                    if key in summary_data and isinstance(summary_data[key], str):
-                        summary_data[key] += exports_md
-                        break
-                else:
-                    summary_data["text"] = exports_md.lstrip("\n")
-                summary_data.setdefault("exports", {})
-                summary_data["exports"]["csv"] = csv_url
-            elif isinstance(summary_data, str) or summary_data is None:
-                summary_data = (summary_data or "") + exports_md
-            else:
-                print(f"WARNING: summary_data is type {type(summary_data)}; coercing to string")
-                summary_data = str(summary_data) + exports_md
-            print("DEBUG: Embedded CSV presigned URL in summary output")
+            logger.exception("Multi-table export failed for '%s': %s", rec_name, e)
+        if archive["url"]:
+            reports.append(_archive_report(archive["url"]))
         results.append({
             "record_name": rec_name,
             "summary": summary_data,
             "reports": reports
         })
-    from src.config import SLACK_CHANNEL_ID, SLACK_BOT_TOKEN
-    from src.slack_utils import send_batched_slack_messages
+        if not any(r["format"] in ("CSV", "JSON") for r in reports):
+            results[-1]["error"] = EXPORT_FAILED
+    _note_entity_matches(results, fuzzy_matches)
     send_batched_slack_messages(results, SLACK_CHANNEL_ID, SLACK_BOT_TOKEN)
     return results
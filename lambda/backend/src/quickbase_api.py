@@ -1,9 +1,108 @@
-import json, urllib.request, ssl, time
-from typing import Dict, Any, Optional, List
+import urllib.request, ssl, time, logging, threading
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, Optional, List, Iterator
 
-from src.config import QB_REALM, QB_USER_TOKEN
-from src.cache_utils import _field_map_cache, _is_cache_valid
+from src.config import QB_REALM, QB_USER_TOKEN, QB_API_BASE, QB_RATE_LIMIT_PER_SEC, QB_RATE_LIMIT_BURST, QB_TABLE_BREAKERS
+from src.cache_utils import _field_map_cache, _is_cache_valid, _record_cache_lookup
 from src.config import CACHE_TTL_SECONDS
+from src.query_builder import canonical_body
+from src import json_codec
+from src.deadline import current_deadline, DeadlineExceeded
+from src.circuit_breaker import get_breaker, CircuitOpen, CircuitBreaker
+
+logger = logging.getLogger("quickbase-agent")
+
+_ssl_context: Optional[ssl.SSLContext] = None
+
+def get_ssl_context() -> ssl.SSLContext:
+    """Shared SSL context; loading the CA bundle on every request is measurable overhead."""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread in the container, so parallel parents and
+    levels together stay under Quickbase's per-token request rate instead of each
+    one running into 429s on its own.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, fetch: bool = True) -> None:
+        """
+        Take a token, sleeping until one is due. Raises DeadlineExceeded, handing the
+        token back, when the wait would run past the request deadline (the fetch cutoff,
+        or the end of the request for export-side calls when `fetch` is False).
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait and not current_deadline().can_retry(wait, fetch):
+                self.tokens += 1
+                raise DeadlineExceeded(f"Request deadline reached waiting {wait:.1f}s for the Quickbase rate limit")
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+
+qb_rate_limiter = RateLimiter(QB_RATE_LIMIT_PER_SEC, QB_RATE_LIMIT_BURST)
+
+# Socket timeout for Quickbase API calls when the request deadline is not close
+QB_TIMEOUT_SECONDS = 30
+
+def _qb_breakers(table_id: Optional[str] = None) -> List[CircuitBreaker]:
+    """The realm-wide Quickbase breaker, plus the table's own for queries (QB_TABLE_BREAKERS)."""
+    breakers = [get_breaker("quickbase")]
+    if table_id and QB_TABLE_BREAKERS:
+        breakers.append(get_breaker(f"quickbase:{table_id}"))
+    return breakers
+
+def _is_timeout(e: BaseException) -> bool:
+    return isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError)
+
+def _qb_failure(e: BaseException, cut_short: bool = False) -> Optional[bool]:
+    """
+    Whether an exception says Quickbase is unhealthy (throttling, 5xx, network), not that
+    the request was bad. None for a timeout we imposed: a socket timeout shortened by the
+    request deadline, or one hit with the deadline nearly spent, says nothing about Quickbase.
+    """
+    if isinstance(e, DeadlineExceeded):
+        return False
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in (429, 500, 502, 503, 504)
+    if _is_timeout(e) and (cut_short or current_deadline().expired()):
+        return None
+    return isinstance(e, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+@contextmanager
+def qb_call(table_id: Optional[str] = None, timeout: Optional[float] = None,
+            default_timeout: float = QB_TIMEOUT_SECONDS) -> Iterator[None]:
+    """
+    One Quickbase request under its circuit breakers; raises CircuitOpen instead of calling
+    while open. Pass the socket `timeout` used, so timeouts shorter than `default_timeout`
+    (cut by the request deadline) are not held against Quickbase.
+    """
+    cut_short = timeout is not None and timeout < default_timeout
+    with ExitStack() as stack:
+        for breaker in _qb_breakers(table_id):
+            stack.enter_context(breaker.guard(lambda e: _qb_failure(e, cut_short)))
+        yield
+
+def _can_retry(wait: float, table_id: Optional[str] = None) -> bool:
+    """Retry only if the backoff fits the request deadline and no breaker would reject the retry."""
+    return current_deadline().can_retry(wait) and not any(b.rejecting() for b in _qb_breakers(table_id))
 
 def qb_headers() -> Dict[str, str]:
     return {
@@ -13,13 +112,15 @@ def qb_headers() -> Dict[str, str]:
     }
 
 def quickbase_get(url: str, retries: int = 3) -> Dict[str, Any]:
-    """GET request to QuickBase with retry logic."""
+    """GET request to QuickBase with retry logic (timeouts and retries bounded by the request deadline)."""
     req = urllib.request.Request(url, headers=qb_headers(), method="GET")
-    context = ssl.create_default_context()
+    deadline = current_deadline()
     for attempt in range(retries):
         try:
-            with urllib.request.urlopen(req, timeout=30, context=context) as resp:
-                response = json.loads(resp.read().decode("utf-8"))
+            qb_rate_limiter.acquire()
+            timeout = deadline.fetch_timeout(QB_TIMEOUT_SECONDS)
+            with qb_call(timeout=timeout), urllib.request.urlopen(req, timeout=timeout, context=get_ssl_context()) as resp:
+                response = json_codec.loads(resp.read())
                 if not isinstance(response, (dict, list)):
                     raise ValueError(f"Invalid QuickBase API response type: {type(response).__name__}")
                 if isinstance(response, dict):
@@ -29,26 +130,52 @@ def quickbase_get(url: str, retries: int = 3) -> Dict[str, Any]:
                         raise ValueError(f"QuickBase error: {response.get('message', 'Unknown error')}")
                 return response
         except urllib.error.HTTPError as e:
-            if e.code in (429, 500, 502, 503, 504) and attempt < retries - 1:
+            if e.code in (429, 500, 502, 503, 504) and attempt < retries - 1 and _can_retry(2 ** attempt):
                 wait_time = 2 ** attempt
-                print(f"WARNING: API error {e.code}, retrying in {wait_time}s...")
+                logger.warning("API error %s, retrying in %ss...", e.code, wait_time)
                 time.sleep(wait_time)
             else:
                 raise
+        except (DeadlineExceeded, CircuitOpen):
+            raise
         except (urllib.error.URLError, TimeoutError, ConnectionError):
-            if attempt < retries - 1:
+            if attempt < retries - 1 and _can_retry(2 ** attempt):
                 wait_time = 2 ** attempt
-                print(f"WARNING: Network error, retrying in {wait_time}s...")
+                logger.warning("Network error, retrying in %ss...", wait_time)
                 time.sleep(wait_time)
             else:
                 raise
     raise Exception("Max retries exceeded")
 
-def quickbase_query(table_id: str, body: Dict[str, Any], max_records: Optional[int] = None, retries: int = 3) -> List[Dict[str, Any]]:
+def quickbase_query(
+    table_id: str,
+    body: Dict[str, Any],
+    max_records: Optional[int] = None,
+    retries: int = 3,
+    allow_partial: bool = True
+) -> List[Dict[str, Any]]:
     """Query QuickBase records with pagination."""
-    url = "https://api.quickbase.com/v1/records/query"
+    all_data: List[Dict[str, Any]] = []
+    for page_data in quickbase_query_pages(table_id, body, max_records=max_records, retries=retries, allow_partial=allow_partial):
+        all_data.extend(page_data)
+    return all_data
+
+def quickbase_query_pages(
+    table_id: str,
+    body: Dict[str, Any],
+    max_records: Optional[int] = None,
+    retries: int = 3,
+    allow_partial: bool = True
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    quickbase_query() one page at a time, so callers can convert and drop each page as it arrives.
+    When the request deadline passes part way through, paging stops and the result is marked
+    partial; callers that cache what they fetch pass allow_partial=False to get DeadlineExceeded.
+    """
+    url = f"{QB_API_BASE}/records/query"
     headers = {**qb_headers(), "Content-Type": "application/json"}
-    all_data, skip = [], 0
+    deadline = current_deadline()
+    returned, skip = 0, 0
     page_size = body.get("options", {}).get("top", 1000)
     if max_records:
         page_size = min(page_size, max_records)
@@ -56,46 +183,77 @@ def quickbase_query(table_id: str, body: Dict[str, Any], max_records: Optional[i
         body["from"] = table_id
         body.setdefault("options", {})
         body["options"]["skip"], body["options"]["top"] = skip, page_size
-        for attempt in range(retries):
-            try:
-                req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers=headers, method="POST")
-                context = ssl.create_default_context()
-                with urllib.request.urlopen(req, timeout=30, context=context) as resp:
-                    result = json.loads(resp.read().decode("utf-8"))
-                    break
-            except urllib.error.HTTPError as e:
-                if e.code in (429, 500, 502, 503, 504) and attempt < retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"Query error {e.code}, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    raise
-            except (urllib.error.URLError, TimeoutError, ConnectionError):
-                if attempt < retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"Network error, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    raise
+        try:
+            result = _query_page(url, headers, body, retries)
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            # Out of time part way through: keep the pages already yielded
+            out_of_time = isinstance(e, DeadlineExceeded) or deadline.expired()
+            if not allow_partial or not returned or not out_of_time:
+                raise
+            deadline.mark_partial(f"table {table_id} stopped after {returned} records ({e})")
+            return
         page_data = result.get("data", [])
-        all_data.extend(page_data)
-        if not page_data or len(page_data) < page_size:
+        if max_records and returned + len(page_data) >= max_records:
+            yield page_data[:max_records - returned]
+            return
+        returned += len(page_data)
+        if not page_data:
             break
-        skip += page_size
-        if max_records and len(all_data) >= max_records:
-            return all_data[:max_records]
-    return all_data
+        yield page_data
+        # Quickbase may cap a page below "top" for wide records; advance by what was
+        # actually returned and use totalRecords when present to decide when to stop.
+        skip += len(page_data)
+        total = result.get("metadata", {}).get("totalRecords")
+        if total is not None:
+            if skip >= total:
+                break
+        elif len(page_data) < page_size:
+            break
+
+def _query_page(url: str, headers: Dict[str, str], body: Dict[str, Any], retries: int) -> Dict[str, Any]:
+    """
+    One records/query POST with retries; timeouts and backoff shrink as the request deadline
+    nears, and retries stop as soon as a circuit breaker for the realm or table opens.
+    """
+    deadline = current_deadline()
+    table_id = body.get("from")
+    for attempt in range(retries):
+        try:
+            req = urllib.request.Request(url, data=canonical_body(body), headers=headers, method="POST")
+            qb_rate_limiter.acquire()
+            timeout = deadline.fetch_timeout(QB_TIMEOUT_SECONDS)
+            with qb_call(table_id, timeout), urllib.request.urlopen(req, timeout=timeout, context=get_ssl_context()) as resp:
+                return json_codec.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code in (429, 500, 502, 503, 504) and attempt < retries - 1 and _can_retry(2 ** attempt, table_id):
+                wait_time = 2 ** attempt
+                logger.warning("Query error %s, retrying in %ss...", e.code, wait_time)
+                time.sleep(wait_time)
+            else:
+                raise
+        except (DeadlineExceeded, CircuitOpen):
+            raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if attempt < retries - 1 and _can_retry(2 ** attempt, table_id):
+                wait_time = 2 ** attempt
+                logger.warning("Network error, retrying in %ss...", wait_time)
+                time.sleep(wait_time)
+            else:
+                raise
+    raise Exception("Max retries exceeded")
 
 def load_field_map(table_id: str) -> Dict[str, Dict[str, Any]]:
     """Load field metadata with TTL-based caching. Returns {label: {"id": int, "type": str}}."""
     entry = _field_map_cache.get(table_id)
-    if _is_cache_valid(entry):
-        print(f"INFO: Using cached field map for table {table_id}")
+    hit = _is_cache_valid(entry)
+    _record_cache_lookup("fields", hit)
+    if hit:
+        logger.debug("Using cached field map for table %s", table_id)
         return entry["data"]
     elif entry:
-        print(f"INFO: Field map cache expired for table {table_id}, refreshing...")
-    print(f"INFO: Fetching field map for table {table_id}")
-    fields = quickbase_get(f"https://api.quickbase.com/v1/fields?tableId={table_id}")
+        logger.info("Field map cache expired for table %s, refreshing...", table_id)
+    logger.info("Fetching field map for table %s", table_id)
+    fields = quickbase_get(f"{QB_API_BASE}/fields?tableId={table_id}")
     if not isinstance(fields, list):
         raise ValueError(f"Expected list of fields, got {type(fields).__name__}")
     for field in fields:
@@ -105,5 +263,5 @@ def load_field_map(table_id: str) -> Dict[str, Dict[str, Any]]:
             raise ValueError(f"Field missing required keys: {field}")
     result = {f["label"]: {"id": f["id"], "type": f.get("fieldType")} for f in fields}
     _field_map_cache[table_id] = {"timestamp": time.time(), "data": result}
-    print(f"INFO: Cached field map for table {table_id} ({len(result)} fields)")
+    logger.info("Cached field map for table %s (%d fields)", table_id, len(result))
     return result
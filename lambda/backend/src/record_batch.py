@@ -0,0 +1,60 @@
+import logging
+from typing import Dict, Any, List, Iterator, Iterable, Optional
+
+from src.quickbase_api import load_field_map
+
+logger = logging.getLogger("quickbase-agent")
+
+class RecordBatch:
+    """
+    Quickbase rows held column-wise: one list per field ID instead of one
+    {fid: {"value": ...}} dict per row. Filled page by page (append_page), so each
+    page's row dicts can be dropped as soon as it is converted. Field types come
+    from the table's field map.
+    """
+
+    def __init__(self, fids: Iterable[Any], types: Optional[Dict[int, str]] = None):
+        self.fids = list(dict.fromkeys(int(f) for f in fids))
+        self.types = types or {}
+        self.columns: Dict[int, List[Any]] = {fid: [] for fid in self.fids}
+        self.length = 0
+
+    @classmethod
+    def for_table(cls, table: Dict[str, str], fids: Iterable[Any]) -> "RecordBatch":
+        types = {int(meta["id"]): meta.get("type") for meta in load_field_map(table["id"]).values()}
+        return cls(fids, types)
+
+    def append_page(self, page: List[Dict[str, Any]]) -> None:
+        for fid in self.fids:
+            key = str(fid)
+            self.columns[fid].extend((row.get(key) or {}).get("value") for row in page)
+        self.length += len(page)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """One row back in Quickbase's shape, for code that expects raw records."""
+        return {str(fid): {"value": values[index]} for fid, values in self.columns.items()}
+
+class FormattedBatch:
+    """
+    format_batch() output: one list per report column, in label order. Columns that
+    need no formatting share their list with the RecordBatch rather than copying it.
+    Consumed directly by SummaryBuilder.add_batch() and save_batch_to_s3().
+    """
+
+    def __init__(self, labels: List[str], columns: List[List[Any]], length: int):
+        self.labels = labels
+        self.columns = columns
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """One row as format_record() would have returned it."""
+        return {label: values[index] for label, values in zip(self.labels, self.columns)}
+
+    def iter_values(self) -> Iterator[tuple]:
+        return zip(*self.columns)
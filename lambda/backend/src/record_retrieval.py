@@ -1,16 +1,21 @@
-import json, time
-from typing import Dict, Any, Optional, List
+import json, time, logging, sqlite3
+from typing import Dict, Any, Iterator, Optional, List
 
-from src.quickbase_api import load_field_map, quickbase_query
-from src.config import ALLOW_LISTS, QB_LARGE_QUERY_THRESHOLD
+from src.quickbase_api import load_field_map
+from src.config import ALLOW_LISTS, QB_LARGE_QUERY_THRESHOLD, MIRROR_ENABLED
 from src.field_detection import (
     find_date_field_from_allowlist, find_name_field_from_allowlist,
     find_related_key_fields_from_allowlist, find_unique_fields_from_allowlist,
     get_relationship_operator, get_sort_field_id, clean_field_name
 )
-from src.table_relationships import list_relationships
+from src.relationship_graph import get_relationship_graph
 from src.formatters import format_record
 from src.attachments import process_attachment
+from src.log_utils import LazyJson
+from src.table_mirror import query_records, query_record_pages, mirror_children, MirrorUnavailable
+from src.query_builder import Node, all_of, build_body, compile_where, cond, date_since
+
+logger = logging.getLogger("quickbase-agent")
 
 def get_records(table: Dict[str, str], limit: Optional[int] = None) -> List[Dict[str, Any]]:
     field_map = load_field_map(table["id"])
@@ -21,66 +26,122 @@ def get_records(table: Dict[str, str], limit: Optional[int] = None) -> List[Dict
         rid = field_map["Record ID#"]["id"]
         if rid not in select_fields:
             select_fields.insert(0, rid)
-    body = {"select": select_fields} if select_fields else {}
-    return quickbase_query(table["id"], body, max_records=limit or QB_LARGE_QUERY_THRESHOLD)
+    return query_records(table, build_body(select=select_fields), max_records=limit or QB_LARGE_QUERY_THRESHOLD)
+
+def _sort_value(row: Dict[str, Any], fid: str) -> tuple:
+    value = (row.get(fid) or {}).get("value")
+    if value is None or value == "":
+        return (1, 0, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, 0, value)
+    return (0, 1, str(value).lower())
+
+def query_bodies(table: Dict[str, str], bodies: List[Dict[str, Any]], max_records: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Run the chunked bodies from build_bodies() and merge them as if they were one query:
+    rows matched by several chunks appear once, and the merged rows are re-sorted by the
+    bodies' sortBy before max_records is applied.
+    """
+    if len(bodies) == 1:
+        return query_records(table, bodies[0], max_records=max_records)
+    rid = str(load_field_map(table["id"])["Record ID#"]["id"])
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for body in bodies:
+        for row in query_records(table, dict(body), max_records=max_records):
+            merged.setdefault((row.get(rid) or {}).get("value", id(row)), row)
+    rows = list(merged.values())
+    for sort in reversed(bodies[0].get("sortBy", [])):
+        fid = str(sort["fieldId"])
+        rows.sort(key=lambda r: _sort_value(r, fid), reverse=sort.get("order") == "DESC")
+    logger.debug("Merged %d chunked queries on '%s' into %d rows", len(bodies), table["name"], len(rows))
+    return rows[:max_records] if max_records else rows
+
+def query_pages(table: Dict[str, str], bodies: List[Dict[str, Any]], max_records: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    query_bodies() one page at a time, so callers can format and spill rows while they
+    are still being fetched. A single body yields Quickbase's pages as they arrive;
+    chunked bodies have to be merged and re-sorted first and come back as one page.
+    """
+    if len(bodies) == 1:
+        yield from query_record_pages(table, bodies[0], max_records=max_records)
+    else:
+        yield query_bodies(table, bodies, max_records=max_records)
+
+def find_child_relationship(parent_table: Dict[str, str], child_table: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Foreign key field id/label and operator linking child_table to parent_table, if any."""
+    rel = get_relationship_graph().edge(parent_table["id"], child_table["id"])
+    if rel is None:
+        logger.warning("No matching relationship found between '%s' and '%s'", parent_table['name'], child_table['name'])
+    return rel
+
+def child_date_filter(child_table: Dict[str, str], date_filter_value: Optional[int], date_filter_unit: Optional[str]) -> Optional[Node]:
+    if not (date_filter_value and date_filter_unit):
+        return None
+    child_map = load_field_map(child_table["id"])
+    date_fid = find_date_field_from_allowlist(child_table["name"], child_map)
+    if not date_fid:
+        logger.warning("No date field in ALLOW_LIST for '%s'", child_table['name'])
+        return None
+    return date_since(date_fid, date_filter_value, date_filter_unit)
 
-def get_child_records(
+def get_child_record_pages(
     parent_table: Dict[str, str],
     child_table: Dict[str, str],
     parent_record_id: int,
     date_filter_value: Optional[int] = None,
     date_filter_unit: Optional[str] = None
-) -> List[Dict[str, Any]]:
-    """Fetch child records with optional date filtering."""
-    print(f"DEBUG: get_child_records() called")
-    print(f"DEBUG: parent = '{parent_table['name']}', child = '{child_table['name']}'")
-    print(f"DEBUG: parent_record_id = {parent_record_id}")
-    print(f"DEBUG: parent_table['id'] = '{parent_table['id']}'")
-    print(f"DEBUG: child_table['id'] = '{child_table['id']}'")
-    print(f"DEBUG: date_filter_value = {date_filter_value}, date_filter_unit = {date_filter_unit}")
-    rels = list_relationships(child_table["id"])
-    print(f"DEBUG: Found {len(rels)} relationships for child table")
-    print(f"DEBUG: Raw relationships data: {json.dumps(rels, default=str, indent=2)}")
-    for r in rels:
-        print(f"DEBUG: Processing relationship: {json.dumps(r, default=str, indent=2)}")
-        foreign_id = r.get("parentTableId")
-        print(f"DEBUG: Checking relationship - parentTableId = '{foreign_id}' vs parent id = '{parent_table['id']}'")
-        if foreign_id == parent_table["id"]:
-            print(f"DEBUG: ✓ Relationship matched!")
-            ref_field_id = r.get("foreignKeyField", {}).get("id")
-            ref_field_label = r.get("foreignKeyField", {}).get("label", "")
-            if not ref_field_id:
-                print(f"ERROR: No foreign key field ID found in relationship")
-                continue
-            operator = get_relationship_operator(parent_table["name"], child_table["name"], ref_field_label)
-            print(f"DEBUG: Using foreign key field ID: {ref_field_id} with operator {operator}")
-            where_clauses = [f"{{{ref_field_id}{operator}{parent_record_id}}}"]
-            if date_filter_value and date_filter_unit:
-                print(f"DEBUG: Date filtering requested - loading child field map")
-                child_map = load_field_map(child_table["id"])
-                print(f"DEBUG: Calling find_date_field_from_allowlist for '{child_table['name']}'")
-                date_fid = find_date_field_from_allowlist(child_table["name"], child_map)
-                print(f"DEBUG: find_date_field_from_allowlist returned: {date_fid}")
-                if date_fid:
-                    unit_map = {'d': 'days','w': 'weeks','m': 'months','y': 'years'}
-                    unit_text = unit_map.get(date_filter_unit, 'days')
-                    date_clause = f"{{{date_fid}.OAF.'{date_filter_value} {unit_text} ago'}}"
-                    where_clauses.append(date_clause)
-                    print(f"DEBUG: Added date filter: {date_clause}")
-                else:
-                    print(f"WARNING: No date field in ALLOW_LIST for '{child_table['name']}'")
-            else:
-                print(f"DEBUG: No date filtering - date_filter_value={date_filter_value}, date_filter_unit={date_filter_unit}")
-            where_clause = " AND ".join(where_clauses)
-            body = {"where": where_clause}
-            print(f"DEBUG: Child query WHERE: {where_clause}")
-            print(f"DEBUG: Executing Quickbase child query → table={child_table['id']}")
-            children_result = quickbase_query(child_table["id"], body, max_records=QB_LARGE_QUERY_THRESHOLD)
-            print(f"DEBUG: Child query returned {len(children_result)} records")
-            if children_result:
-                print(f"DEBUG: First child record sample:\n{json.dumps(children_result[0], indent=2)}")
-            else:
-                print(f"WARNING: Query executed successfully but returned no child records.")
-            return children_result
-    print(f"WARNING: No matching relationship found between '{parent_table['name']}' and '{child_table['name']}'")
-    return []
+) -> Iterator[List[Dict[str, Any]]]:
+    """Fetch child records with optional date filtering, one page at a time."""
+    logger.debug(
+        "get_child_record_pages(): parent='%s' (%s), child='%s' (%s), parent_record_id=%s, date_filter=%s%s",
+        parent_table['name'], parent_table['id'], child_table['name'], child_table['id'],
+        parent_record_id, date_filter_value, date_filter_unit
+    )
+    rel = find_child_relationship(parent_table, child_table)
+    if rel is None:
+        return
+    where = all_of(
+        cond(rel["field_id"], rel["operator"], parent_record_id),
+        child_date_filter(child_table, date_filter_value, date_filter_unit)
+    )
+    body = build_body(where)
+    logger.debug("Child query → table=%s WHERE: %s", child_table['id'], body["where"])
+    fetched = 0
+    for page in query_record_pages(child_table, body, max_records=QB_LARGE_QUERY_THRESHOLD):
+        if page and not fetched:
+            logger.debug("First child record sample: %s", LazyJson(page[0]))
+        fetched += len(page)
+        yield page
+    logger.debug("Child query returned %d records", fetched)
+
+def get_children_for_parents(
+    parent_table: Dict[str, str],
+    child_table: Dict[str, str],
+    parent_record_ids: List[Any],
+    date_filter_value: Optional[int] = None,
+    date_filter_unit: Optional[str] = None
+) -> Optional[Dict[Any, List[Dict[str, Any]]]]:
+    """
+    Children of every parent from one SQL join on the table mirror, keyed by parent
+    Record ID#. None when mirror mode is off or the mirror cannot answer, in which
+    case callers fall back to get_child_record_pages() per parent.
+    """
+    if not MIRROR_ENABLED or not parent_record_ids:
+        return None
+    rel = find_child_relationship(parent_table, child_table)
+    if rel is None:
+        return None
+    try:
+        grouped = mirror_children(
+            parent_table, child_table, rel["field_id"], parent_record_ids,
+            child_where=compile_where(child_date_filter(child_table, date_filter_value, date_filter_unit)),
+            max_records=QB_LARGE_QUERY_THRESHOLD
+        )
+    except MirrorUnavailable as e:
+        logger.info("Mirror join skipped for '%s' → '%s': %s", parent_table['name'], child_table['name'], e)
+        return None
+    except sqlite3.Error as e:
+        logger.warning("Mirror join failed for '%s' → '%s', using live API: %s", parent_table['name'], child_table['name'], e)
+        return None
+    logger.debug("Mirror join returned %d children for %d parents", sum(len(v) for v in grouped.values()), len(grouped))
+    return grouped
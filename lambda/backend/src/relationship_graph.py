@@ -0,0 +1,103 @@
+import time, logging, threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.config import ALLOW_LISTS, CACHE_TTL_SECONDS
+from src.cache_utils import _relationship_graph_cache, _is_cache_valid, _record_cache_lookup
+from src.field_detection import get_relationship_operator
+from src.table_relationships import list_relationships
+
+logger = logging.getLogger("quickbase-agent")
+
+_graph_lock = threading.Lock()
+
+class RelationshipGraph:
+    """
+    Parent → child edges between tables, keyed by (parent_id, child_id), with the
+    foreign key field and the where-clause operator resolved once per edge.
+    Built from list_relationships() (itself TTL-cached) for every allowlisted table;
+    tables outside the allowlist are scanned the first time they are asked about.
+    """
+
+    def __init__(self):
+        self.edges: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.parents: Dict[str, List[str]] = {}
+        self.names: Dict[str, str] = {e["id"]: name for name, e in ALLOW_LISTS.items() if isinstance(e, dict) and "id" in e}
+        self._scanned: set = set()
+        self.built_at = time.time()
+
+    def add_table(self, table_id: str) -> None:
+        """Record every relationship in which table_id is the child."""
+        if table_id in self._scanned:
+            return
+        self._scanned.add(table_id)
+        for rel in list_relationships(table_id):
+            parent_id = rel.get("parentTableId")
+            fk = rel.get("foreignKeyField", {})
+            if not parent_id or not fk.get("id"):
+                continue
+            child_id = rel.get("childTableId") or table_id
+            parent_name, child_name = self.names.get(parent_id), self.names.get(child_id)
+            operator = get_relationship_operator(parent_name, child_name, fk.get("label", "")) if parent_name and child_name else ".EX."
+            if (parent_id, child_id) in self.edges:
+                continue
+            self.edges[(parent_id, child_id)] = {
+                "field_id": fk["id"],
+                "label": fk.get("label", ""),
+                "operator": operator,
+                "parent_id": parent_id,
+                "child_id": child_id,
+            }
+            self.children.setdefault(parent_id, []).append(child_id)
+            self.parents.setdefault(child_id, []).append(parent_id)
+
+    def build(self) -> "RelationshipGraph":
+        for table_id in self.names:
+            self.add_table(table_id)
+        logger.info("Built relationship graph: %d table(s), %d edge(s)", len(self._scanned), len(self.edges))
+        return self
+
+    def edge(self, parent_id: str, child_id: str) -> Optional[Dict[str, Any]]:
+        """Foreign key details for parent → child, or None when they are not related."""
+        if child_id not in self._scanned:
+            with _graph_lock:
+                self.add_table(child_id)
+        return self.edges.get((parent_id, child_id))
+
+    def parent_edges(self, child_id: str) -> List[Dict[str, Any]]:
+        if child_id not in self._scanned:
+            with _graph_lock:
+                self.add_table(child_id)
+        return [self.edges[(p, child_id)] for p in self.parents.get(child_id, [])]
+
+    def dump(self) -> Dict[str, Any]:
+        """JSON-friendly view for diagnostics."""
+        label = lambda table_id: self.names.get(table_id, table_id)
+        return {
+            "age_sec": round(time.time() - self.built_at, 1),
+            "tables": len(self._scanned),
+            "edges": [
+                {
+                    "parent": label(p), "child": label(c), "foreign_key": e["field_id"],
+                    "label": e["label"], "operator": e["operator"].strip(".")
+                }
+                for (p, c), e in sorted(self.edges.items())
+            ],
+        }
+
+def get_relationship_graph() -> RelationshipGraph:
+    """Shared graph for all handlers, rebuilt when the metadata caches expire or are cleared."""
+    with _graph_lock:
+        entry = _relationship_graph_cache.get("graph")
+        hit = _is_cache_valid(entry, CACHE_TTL_SECONDS)
+        _record_cache_lookup("relationship_graph", hit)
+        if hit:
+            return entry["data"]
+        graph = RelationshipGraph().build()
+        _relationship_graph_cache["graph"] = {"timestamp": time.time(), "data": graph}
+        return graph
+
+def dump_relationship_graph() -> Dict[str, Any]:
+    """Diagnostic dump of the cached graph ({} when it has not been built yet)."""
+    entry = _relationship_graph_cache.get("graph")
+    return entry["data"].dump() if entry else {}
@@ -0,0 +1,82 @@
+import copy, json, time, logging
+from typing import Dict, Any, List, Optional
+
+from src.config import REPORT_CACHE_TTL_SECONDS, REPORT_CACHE_MAX_ENTRIES, PRESIGNED_URL_EXPIRATION
+from src.cache_utils import _report_cache, _is_cache_valid, _record_cache_lookup
+from src.exports import presign_s3_key, s3_key_from_url
+
+logger = logging.getLogger("quickbase-agent")
+
+def _report_ttl() -> int:
+    return min(REPORT_CACHE_TTL_SECONDS, PRESIGNED_URL_EXPIRATION)
+
+def report_cache_key(function_name: str, parsed: Dict[str, Any], limit: int) -> str:
+    """
+    Canonical key for a parsed request: equivalent parameter sets (entity order/case,
+    sort order case, numeric strings) map to the same key.
+    """
+    names = sorted({str(n).strip().lower() for n in parsed.get("names") or [] if str(n).strip()})
+    canonical = {
+        "function": function_name,
+        "mode": parsed.get("mode"),
+        "tables": [t["id"] for t in parsed.get("tables", [])],
+        "names": names,
+        "date_filter_value": str(parsed["date_filter_value"]) if parsed.get("date_filter_value") else None,
+        "date_filter_unit": (parsed.get("date_filter_unit") or "").lower() or None,
+        "sort_by": (parsed.get("sort_by") or "").strip().lower() or None,
+        "sort_order": (parsed.get("sort_order") or "DESC").upper(),
+        "limit": int(limit),
+        "formats": sorted(parsed.get("formats") or []),
+    }
+    if names:
+        # Unique-field matching for entity names reads the prompt, so it affects the query
+        canonical["prompt"] = " ".join(str(parsed.get("original_prompt", "")).lower().split())
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+def _replace_urls(obj: Any, replacements: Dict[str, str]) -> Any:
+    """Swap URLs anywhere in the result, including inside markdown summary text."""
+    if isinstance(obj, dict):
+        return {k: _replace_urls(v, replacements) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_replace_urls(v, replacements) for v in obj]
+    if isinstance(obj, str):
+        for old, new in replacements.items():
+            if old in obj:
+                obj = obj.replace(old, new)
+        return obj
+    return obj
+
+def store_report(key: str, results: List[Dict[str, Any]]) -> None:
+    """Memoize a completed report along with the S3 keys behind its download links."""
+    if _report_ttl() <= 0 or not results:
+        return
+    urls: Dict[str, str] = {}
+    for report in (r for result in results for r in result.get("reports", [])):
+        s3_key = s3_key_from_url(report.get("url", ""))
+        if not s3_key:
+            logger.debug("Not memoizing report: URL is not in the report bucket")
+            return
+        urls[report["url"]] = s3_key
+    if len(_report_cache) >= REPORT_CACHE_MAX_ENTRIES:
+        oldest = min(_report_cache, key=lambda k: _report_cache[k]["timestamp"])
+        _report_cache.pop(oldest, None)
+    _report_cache[key] = {"timestamp": time.time(), "data": {"results": copy.deepcopy(results), "urls": urls}}
+
+def get_cached_report(key: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Previous results for an identical request, with fresh presigned URLs for the
+    existing S3 objects, or None on a miss.
+    """
+    ttl = _report_ttl()
+    if ttl <= 0:
+        return None
+    entry = _report_cache.get(key)
+    if not _is_cache_valid(entry, ttl):
+        _report_cache.pop(key, None)
+        _record_cache_lookup("reports", False)
+        return None
+    _record_cache_lookup("reports", True)
+    stored = entry["data"]
+    replacements = {old: presign_s3_key(s3_key) for old, s3_key in stored["urls"].items()}
+    logger.info("Report memo hit (age %.0fs); re-presigned %d URL(s)", time.time() - entry["timestamp"], len(replacements))
+    return _replace_urls(stored["results"], replacements)
@@ -0,0 +1,136 @@
+import json, logging
+from typing import Dict, Any, List, Callable
+
+from src.config import RESPONSE_MAX_BYTES, RESPONSE_MAX_TOKENS
+from src.exports import save_json_to_s3
+
+logger = logging.getLogger("quickbase-agent")
+
+# Rough bytes per model token for JSON-heavy text
+BYTES_PER_TOKEN = 4
+# Statistics kept per report once they are trimmed, and the longest value kept
+STAT_LIMIT = 6
+STAT_VALUE_CHARS = 120
+# Always kept first when statistics are trimmed
+PRIORITY_STATS = ("total_records", "date_range", "truncated_tables")
+
+def response_budget() -> int:
+    """Byte budget for the response body (0 = unlimited)."""
+    budgets = [b for b in (RESPONSE_MAX_BYTES, RESPONSE_MAX_TOKENS * BYTES_PER_TOKEN) if b > 0]
+    return min(budgets) if budgets else 0
+
+def _size(data: Dict[str, Any]) -> int:
+    return len(json.dumps(data, default=str).encode("utf-8"))
+
+def _summaries(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [r["summary"] for r in data.get("reports", []) if isinstance(r.get("summary"), dict)]
+
+def _drop_samples(data: Dict[str, Any]) -> None:
+    """raw_data_sample rows are already in the CSV."""
+    for summary in _summaries(data):
+        summary.pop("raw_data_sample", None)
+
+def _hoist_context(data: Dict[str, Any]) -> None:
+    """Per-report bedrock_context is near-identical; keep each distinct prompt once, at the top."""
+    contexts = []
+    for summary in _summaries(data):
+        context = summary.pop("bedrock_context", None)
+        if context and context not in contexts:
+            contexts.append(context)
+    if contexts:
+        data["bedrock_context"] = contexts[0] if len(contexts) == 1 else contexts
+
+# Appended to a parent+child summary's text by _build_parent_report()
+EXPORTS_MARKDOWN = "**Data Exports:**"
+
+def _drop_duplicate_links(data: Dict[str, Any]) -> None:
+    """Parent+child summaries repeat the report URLs as markdown and under "exports"."""
+    for summary in _summaries(data):
+        summary.pop("exports", None)
+        for key in ("markdown", "text", "body", "summary"):
+            text = summary.get(key)
+            if not isinstance(text, str) or EXPORTS_MARKDOWN not in text:
+                continue
+            # Only the appended export block; any text before it is real content
+            kept = text[:text.rindex(EXPORTS_MARKDOWN)].rstrip()
+            if kept:
+                summary[key] = kept
+            else:
+                summary.pop(key)
+            break
+
+def _rank_statistics(stats: Dict[str, Any]) -> List[str]:
+    keys = list(stats)
+    first = [k for k in PRIORITY_STATS if k in stats] + [k for k in keys if k.endswith(" records") and k not in PRIORITY_STATS]
+    return first + [k for k in keys if k not in first]
+
+def _trim_statistics(data: Dict[str, Any]) -> None:
+    for summary in _summaries(data):
+        stats = summary.get("statistics")
+        if not isinstance(stats, dict):
+            continue
+        trimmed = {}
+        for key in _rank_statistics(stats)[:STAT_LIMIT]:
+            value = stats[key]
+            if isinstance(value, str) and len(value) > STAT_VALUE_CHARS:
+                value = value[:STAT_VALUE_CHARS - 1] + "…"
+            trimmed[key] = value
+        summary["statistics"] = trimmed
+
+def _collapse_reports(data: Dict[str, Any]) -> None:
+    """
+    One row per report (name, record count, error, every URL) in place of the per-report
+    summaries. Failed reports keep their error and insights in the "reports" list instead.
+    """
+    reports = data.pop("reports", [])
+    failed = [r for r in reports if r.get("error")]
+    reports = [r for r in reports if not r.get("error")]
+    formats = list(dict.fromkeys(link.get("format", "URL") for r in reports for link in r.get("reports", [])))
+    rows = []
+    for r in reports:
+        stats = (r.get("summary") or {}).get("statistics", {}) if isinstance(r.get("summary"), dict) else {}
+        urls = {link.get("format", "URL"): link.get("url") for link in r.get("reports", [])}
+        rows.append([r.get("record_name"), stats.get("total_records")] + [urls.get(f) for f in formats])
+    data["report_table"] = {"columns": ["record_name", "total_records"] + [f.lower() for f in formats], "rows": rows}
+    if failed:
+        data["reports"] = failed
+
+# Cheapest and least lossy first; the full response goes to S3 once anything beyond
+# what the CSV already holds is removed.
+STEPS: List[Callable[[Dict[str, Any]], None]] = [_drop_samples, _hoist_context, _drop_duplicate_links, _trim_statistics, _collapse_reports]
+LOSSLESS_STEPS = {_drop_samples, _hoist_context, _drop_duplicate_links}
+
+def govern_response(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fit a successful response into response_budget() before it is handed to the agent.
+    Steps run in order until the body fits: drop sample rows, hoist the shared
+    bedrock_context, drop the export links appended to summaries, keep only the
+    top-ranked statistics, then collapse successful reports into one compact table
+    (failed reports keep their error and summary). Report URLs are never removed.
+    When a lossy step runs, the untrimmed response is saved to S3 and linked as
+    "full_response_url". Returns `data` unchanged when it already fits.
+    """
+    budget = response_budget()
+    if not budget or not data.get("reports"):
+        return data
+    original_size = _size(data)
+    if original_size <= budget:
+        return data
+    governed = json.loads(json.dumps(data, default=str))
+    applied = []
+    size = original_size
+    for step in STEPS:
+        if step not in LOSSLESS_STEPS and "full_response_url" not in governed:
+            try:
+                governed["full_response_url"] = save_json_to_s3(data, prefix="responses", record_name="full_response")
+            except Exception as e:
+                logger.warning("Could not store full response in S3: %s", e)
+        step(governed)
+        applied.append(step.__name__.lstrip("_"))
+        size = _size(governed)
+        if size <= budget:
+            break
+    else:
+        logger.warning("Response still %d bytes after governing (budget %d); URLs are never dropped", size, budget)
+    logger.info("Governed response: %d → %d bytes (budget %d) via %s", original_size, size, budget, applied)
+    return governed
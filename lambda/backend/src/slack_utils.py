@@ -1,8 +1,14 @@
-import json, urllib.request, ssl, time
+import json, urllib.request, ssl, time, logging
 from typing import Dict, Any, Optional, List
 
 from src.config import SLACK_BOT_TOKEN, SLACK_BATCH_SEPARATOR, SLACK_MAX_MESSAGE_SIZE
 
+from src.quickbase_api import get_ssl_context
+from src.deadline import current_deadline
+from src.circuit_breaker import get_breaker, CircuitOpen
+
+logger = logging.getLogger("quickbase-agent")
+
 def send_slack_message(channel: str, text: str) -> Optional[Dict[str, Any]]:
     """Send Slack message."""
     url = "https://slack.com/api/chat.postMessage"
@@ -16,15 +22,18 @@ def send_slack_message(channel: str, text: str) -> Optional[Dict[str, Any]]:
         "mrkdwn": True
     }).encode("utf-8")
     req = urllib.request.Request(url, data=payload, headers=headers, method="POST")
-    context = ssl.create_default_context()
     try:
-        with urllib.request.urlopen(req, timeout=10, context=context) as resp:
+        timeout = current_deadline().io_timeout(10)
+        with get_breaker("slack").guard(), urllib.request.urlopen(req, timeout=timeout, context=get_ssl_context()) as resp:
             result = json.loads(resp.read().decode("utf-8"))
             if not result.get("ok"):
-                print("Slack error:", result)
+                logger.warning("Slack error: %s", result)
             return result
+    except CircuitOpen as e:
+        logger.warning("Slack post skipped: %s", e)
+        return None
     except Exception as e:
-        print(f"Slack post failed: {e}")
+        logger.error("Slack post failed: %s", e)
         return None
 
 def send_batched_slack_messages(
@@ -59,5 +68,11 @@ def send_batched_slack_messages(
         message = header + SLACK_BATCH_SEPARATOR.join(batch)
         send_slack_message(channel_id, message)
         if i < len(batches) - 1:
+            if get_breaker("slack").rejecting():
+                logger.warning("Slack unavailable; skipping %d remaining Slack batch(es)", len(batches) - i - 1)
+                break
+            if not current_deadline().can_retry(1, fetch=False):
+                logger.warning("Out of time; skipping %d remaining Slack batch(es)", len(batches) - i - 1)
+                break
             time.sleep(1)
-    print(f"✓ Sent {len(results)} reports in {len(batches)} Slack message(s)")
+    logger.info("Sent %d reports in %d Slack message(s)", len(results), len(batches))
@@ -1,64 +1,134 @@
 from typing import Dict, List, Any
 
-def generate_summary(records: List[Dict[str, Any]], table_name: str, rec_name: str) -> Dict[str, Any]:
-    """Generate analytical summary for any table."""
-    if not records:
-        return {
-            "title": f"{rec_name} Summary",
-            "statistics": {"total_records": 0},
-            "insights": f"No {table_name} records found matching your criteria.",
-            "bedrock_context": "No matching records found."
-        }
-    total = len(records)
-    stats = {"total_records": total}
-    field_analysis = {}
-    date_fields = []
-    for record in records:
+# A field is broken down by value only when it has at most this many distinct values
+MAX_BREAKDOWN_VALUES = 10
+
+class SummaryBuilder:
+    """
+    Accumulates the statistics behind generate_summary() one record at a time, so
+    reports spilled to disk (see memory_utils) can be summarized without keeping
+    every record in memory. State stays bounded: a field's value counts are dropped
+    once it has more than MAX_BREAKDOWN_VALUES distinct values, and dates are kept
+    only as the running min and max.
+    """
+
+    def __init__(self):
+        self.total = 0
+        # "values" becomes None once the field has too many distinct values to break down
+        self.field_analysis: Dict[str, Dict[str, Any]] = {}
+        self.date_min: Any = None
+        self.date_max: Any = None
+        self.dates_ordered = True
+        self.sample: List[Dict[str, Any]] = []
+
+    def _count(self, analysis: Dict[str, Any], str_val: str) -> None:
+        counts = analysis["values"]
+        if counts is None:
+            return
+        counts[str_val] = counts.get(str_val, 0) + 1
+        if len(counts) > MAX_BREAKDOWN_VALUES:
+            analysis["values"] = None
+
+    def _add_date(self, value: Any) -> None:
+        if not value or not self.dates_ordered:
+            return
+        try:
+            if self.date_min is None or value < self.date_min:
+                self.date_min = value
+            if self.date_max is None or value > self.date_max:
+                self.date_max = value
+        except TypeError:
+            # Mixed types cannot be ordered: no date range, as before
+            self.dates_ordered = False
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.total += 1
+        if len(self.sample) < 3:
+            self.sample.append(record)
         for field_name, value in record.items():
             if value is None or value == "":
                 continue
-            if field_name not in field_analysis:
-                field_analysis[field_name] = {"values": {}, "type": None}
-            str_val = str(value)
-            field_analysis[field_name]["values"][str_val] = field_analysis[field_name]["values"].get(str_val, 0) + 1
+            if field_name not in self.field_analysis:
+                self.field_analysis[field_name] = {"values": {}, "type": None}
+            self._count(self.field_analysis[field_name], str(value))
             if isinstance(value, (int, float)) and not isinstance(value, bool):
-                field_analysis[field_name]["type"] = "numeric"
+                self.field_analysis[field_name]["type"] = "numeric"
             elif "date" in field_name.lower() or "created" in field_name.lower():
-                field_analysis[field_name]["type"] = "date"
-                date_fields.append(value)
-    key_fields = []
-    for field, data in field_analysis.items():
-        value_count = len(data["values"])
-        if 2 <= value_count <= 10 and len(records) > value_count:
-            breakdown = ", ".join([
-                f"{count} {val}"
-                for val, count in sorted(data["values"].items(), key=lambda x: -x[1])[:5]
-            ])
-            stats[field] = breakdown
-            key_fields.append(field)
-    if date_fields:
-        try:
-            sorted_dates = sorted([d for d in date_fields if d])
-            if sorted_dates:
-                stats["date_range"] = f"{sorted_dates[0]} to {sorted_dates[-1]}"
-        except:
-            pass
-    insights = []
-    insights.append(f"*{rec_name} Overview:*")
-    insights.append(f"• Total {table_name.lower()}: {total}")
-    for field in key_fields[:3]:
-        insights.append(f"• {field}: {stats[field]}")
-    if "date_range" in stats:
-        insights.append(f"• Date range: {stats['date_range']}")
-    insights.append("\nReview the attached report for complete details.")
-    bedrock_context = (
-        f"Analyze this {table_name} data and provide 1-2 sentences about patterns, "
-        f"trends, or notable observations. Consider {', '.join(key_fields[:2]) if key_fields else 'all fields'}."
-    )
-    return {
-        "title": f"{rec_name} {table_name} Summary",
-        "statistics": stats,
-        "insights": "\n".join(insights),
-        "bedrock_context": bedrock_context,
-        "raw_data_sample": records[:3] if len(records) > 3 else records
-    }
+                self.field_analysis[field_name]["type"] = "date"
+                self._add_date(value)
+
+    def add_batch(self, batch: Any) -> None:
+        """add() for every row of a FormattedBatch, walking it column by column."""
+        for index in range(min(3 - len(self.sample), len(batch))):
+            self.sample.append(batch.row(index))
+        # Fields are first seen in the same order a row-by-row walk would see them
+        seen = []
+        for position, (field_name, values) in enumerate(zip(batch.labels, batch.columns)):
+            first = next((i for i, value in enumerate(values) if value is not None and value != ""), None)
+            if first is not None:
+                seen.append((first, position, field_name, values))
+        for _, _, field_name, values in sorted(seen, key=lambda item: item[:2]):
+            analysis = self.field_analysis.setdefault(field_name, {"values": {}, "type": None})
+            is_date = "date" in field_name.lower() or "created" in field_name.lower()
+            for value in values:
+                if value is None or value == "":
+                    continue
+                self._count(analysis, str(value))
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    analysis["type"] = "numeric"
+                elif is_date:
+                    analysis["type"] = "date"
+                    self._add_date(value)
+        self.total += len(batch)
+
+    def build(self, table_name: str, rec_name: str) -> Dict[str, Any]:
+        if not self.total:
+            return {
+                "title": f"{rec_name} Summary",
+                "statistics": {"total_records": 0},
+                "insights": f"No {table_name} records found matching your criteria.",
+                "bedrock_context": "No matching records found."
+            }
+        total = self.total
+        stats = {"total_records": total}
+        field_analysis = self.field_analysis
+        key_fields = []
+        for field, data in field_analysis.items():
+            if data["values"] is None:
+                continue
+            value_count = len(data["values"])
+            if 2 <= value_count <= MAX_BREAKDOWN_VALUES and total > value_count:
+                breakdown = ", ".join([
+                    f"{count} {val}"
+                    for val, count in sorted(data["values"].items(), key=lambda x: -x[1])[:5]
+                ])
+                stats[field] = breakdown
+                key_fields.append(field)
+        if self.dates_ordered and self.date_min is not None:
+            stats["date_range"] = f"{self.date_min} to {self.date_max}"
+        insights = []
+        insights.append(f"*{rec_name} Overview:*")
+        insights.append(f"• Total {table_name.lower()}: {total}")
+        for field in key_fields[:3]:
+            insights.append(f"• {field}: {stats[field]}")
+        if "date_range" in stats:
+            insights.append(f"• Date range: {stats['date_range']}")
+        insights.append("\nReview the attached report for complete details.")
+        bedrock_context = (
+            f"Analyze this {table_name} data and provide 1-2 sentences about patterns, "
+            f"trends, or notable observations. Consider {', '.join(key_fields[:2]) if key_fields else 'all fields'}."
+        )
+        return {
+            "title": f"{rec_name} {table_name} Summary",
+            "statistics": stats,
+            "insights": "\n".join(insights),
+            "bedrock_context": bedrock_context,
+            "raw_data_sample": self.sample
+        }
+
+def generate_summary(records: List[Dict[str, Any]], table_name: str, rec_name: str) -> Dict[str, Any]:
+    """Generate analytical summary for any table."""
+    builder = SummaryBuilder()
+    for record in records:
+        builder.add(record)
+    return builder.build(table_name, rec_name)
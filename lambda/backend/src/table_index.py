@@ -0,0 +1,94 @@
+import re, logging, threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.config import ALLOW_LISTS, TABLE_FUZZY_THRESHOLD, TABLE_SUGGESTION_LIMIT
+from src.entity_index import similarity
+
+logger = logging.getLogger("quickbase-agent")
+
+# A fuzzy match must beat the runner-up by this much to resolve without asking
+FUZZY_MARGIN = 0.1
+
+_index_lock = threading.Lock()
+_index: Optional["TableIndex"] = None
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def normalize_table_name(name: str) -> str:
+    """Lowercase, punctuation to spaces, singular tokens: 'Customer-Support Tickets' → 'customer support ticket'."""
+    tokens = re.sub(r"[^a-z0-9#]+", " ", str(name).lower()).split()
+    return " ".join(_singular(t) for t in tokens)
+
+class TableIndex:
+    """
+    Allowlisted table names and their optional "aliases" (see field_allowlist.py),
+    normalized once, so table resolution needs no Quickbase metadata call.
+    """
+
+    def __init__(self, allow_lists: Dict[str, Any]):
+        self.signature = self._signature(allow_lists)
+        self.keys: Dict[str, str] = {}
+        for name, entry in allow_lists.items():
+            aliases = entry.get("aliases", []) if isinstance(entry, dict) else []
+            for label in [name] + list(aliases):
+                key = normalize_table_name(label)
+                if key and self.keys.setdefault(key, name) != name:
+                    logger.warning("Table alias '%s' is ambiguous between '%s' and '%s'", label, self.keys[key], name)
+
+    @staticmethod
+    def _signature(allow_lists: Dict[str, Any]) -> Tuple:
+        return tuple(
+            (name, entry.get("id"), tuple(entry.get("aliases", []))) if isinstance(entry, dict) else (name,)
+            for name, entry in allow_lists.items()
+        )
+
+    def _score(self, query: str, key: str) -> float:
+        score = similarity(query, key)
+        query_tokens, key_tokens = set(query.split()), set(key.split())
+        if query_tokens and query_tokens <= key_tokens:
+            # "support ticket" names part of "customer support ticket"
+            score = max(score, 0.5 + 0.5 * len(query_tokens) / len(key_tokens))
+        return score
+
+    def rank(self, name: str) -> List[Tuple[str, float]]:
+        """Tables ranked by their best name/alias score for `name`, best first."""
+        query = normalize_table_name(name)
+        best: Dict[str, float] = {}
+        for key, table in self.keys.items():
+            score = 1.0 if key == query else self._score(query, key)
+            if score > best.get(table, 0.0):
+                best[table] = score
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))
+
+    def resolve(self, name: str) -> Tuple[Optional[str], List[Tuple[str, float]]]:
+        """
+        (allowlist table name or None, ranked suggestions). Exact name/alias matches
+        resolve directly; a fuzzy match resolves only when it clears TABLE_FUZZY_THRESHOLD
+        and leads the runner-up by FUZZY_MARGIN, otherwise the caller should ask.
+        """
+        exact = self.keys.get(normalize_table_name(name))
+        if exact:
+            return exact, [(exact, 1.0)]
+        ranked = self.rank(name)
+        suggestions = [(table, round(score, 2)) for table, score in ranked[:TABLE_SUGGESTION_LIMIT] if score > 0]
+        if ranked and ranked[0][1] >= TABLE_FUZZY_THRESHOLD:
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            if ranked[0][1] - runner_up >= FUZZY_MARGIN:
+                logger.info("Table '%s' resolved to '%s' (score %.2f)", name, ranked[0][0], ranked[0][1])
+                return ranked[0][0], suggestions
+        return None, suggestions
+
+def get_table_index() -> TableIndex:
+    """Index over the current ALLOW_LISTS, rebuilt only when its tables, ids or aliases change."""
+    global _index
+    signature = TableIndex._signature(ALLOW_LISTS)
+    with _index_lock:
+        if _index is None or _index.signature != signature:
+            _index = TableIndex(ALLOW_LISTS)
+            logger.debug("Built table index: %d name(s)/alias(es)", len(_index.keys))
+        return _index
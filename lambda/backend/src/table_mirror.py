@@ -0,0 +1,394 @@
+import json, re, time, sqlite3, logging, threading
+from datetime import date
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterator
+
+from src.config import (
+    ALLOW_LISTS, MIRROR_ENABLED, MIRROR_PATH, MIRROR_SYNC_INTERVAL_SECONDS,
+    MIRROR_MAX_STALENESS_SECONDS, MIRROR_FULL_RESYNC_SECONDS, MIRROR_MAX_ROWS
+)
+from src.quickbase_api import quickbase_query, quickbase_query_pages, load_field_map
+from src.field_detection import clean_field_name
+from src.relationship_graph import get_relationship_graph
+from src.query_builder import absolute_date, build_body, cond
+
+logger = logging.getLogger("quickbase-agent")
+
+DATE_MODIFIED_LABEL = "Date Modified"
+# Field types stored as numbers; where-clause literals for these are compared numerically
+NUMERIC_FIELD_TYPES = {"recordid", "numeric", "currency", "percent", "rating", "duration", "checkbox"}
+
+class MirrorUnavailable(Exception):
+    """The mirror cannot answer this query (unsupported syntax, unmirrored field, stale)."""
+
+_lock = threading.RLock()
+_conn: Optional[sqlite3.Connection] = None
+# Tables found to exceed MIRROR_MAX_ROWS → when; not retried until the next full-resync window
+_oversized: Dict[str, float] = {}
+# Tables with a sync in flight → set when it finishes; concurrent callers wait instead of reloading
+_syncing: Dict[str, threading.Event] = {}
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(MIRROR_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_meta ("
+            "table_id TEXT PRIMARY KEY, fids TEXT, json_fids TEXT, field_types TEXT, "
+            "last_modified TEXT, synced_at REAL, full_synced_at REAL, row_count INTEGER)"
+        )
+    return _conn
+
+def _table_sql(table_id: str) -> str:
+    return "t_" + re.sub(r"[^A-Za-z0-9_]", "_", table_id)
+
+def _col(fid: int) -> str:
+    return f"f_{int(fid)}"
+
+def _mirrored_fids(table: Dict[str, str], field_map: Dict[str, Dict[str, Any]]) -> List[int]:
+    """Record ID#, Date Modified, allowlisted fields, and foreign keys into parent tables."""
+    fids = [field_map["Record ID#"]["id"]]
+    if DATE_MODIFIED_LABEL in field_map:
+        fids.append(field_map[DATE_MODIFIED_LABEL]["id"])
+    for label in ALLOW_LISTS.get(table["name"], {}).get("fields", []):
+        clean = clean_field_name(label)
+        if clean in field_map:
+            fids.append(field_map[clean]["id"])
+    for rel in get_relationship_graph().parent_edges(table["id"]):
+        fids.append(rel["field_id"])
+    return list(dict.fromkeys(int(f) for f in fids))
+
+def _meta(table_id: str) -> Optional[Dict[str, Any]]:
+    row = _connection().execute(
+        "SELECT fids, json_fids, field_types, last_modified, synced_at, full_synced_at, row_count "
+        "FROM _mirror_meta WHERE table_id = ?", (table_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "fids": json.loads(row[0]), "json_fids": set(json.loads(row[1])), "field_types": json.loads(row[2]),
+        "last_modified": row[3], "synced_at": row[4], "full_synced_at": row[5], "row_count": row[6],
+    }
+
+def _write_rows(table_id: str, fids: List[int], modified_fid: Optional[int],
+                rows: List[Dict[str, Any]], json_fids: Set[int]) -> Optional[str]:
+    """Upsert Quickbase rows; returns the newest Date Modified seen."""
+    newest = None
+    records = []
+    for row in rows:
+        values = []
+        for fid in fids:
+            value = (row.get(str(fid)) or {}).get("value")
+            if isinstance(value, (dict, list)):
+                json_fids.add(fid)
+                value = json.dumps(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            values.append(value)
+        records.append(values)
+        if modified_fid:
+            modified = (row.get(str(modified_fid)) or {}).get("value")
+            if modified and (newest is None or str(modified) > newest):
+                newest = str(modified)
+    columns = ",".join(_col(f) for f in fids)
+    marks = ",".join("?" for _ in fids)
+    _connection().executemany(f"INSERT OR REPLACE INTO {_table_sql(table_id)} ({columns}) VALUES ({marks})", records)
+    return newest
+
+def sync_table(table: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Bring the mirror of one table up to date: a full load the first time (or every
+    MIRROR_FULL_RESYNC_SECONDS, which also drops deleted records), otherwise only
+    rows whose Date Modified is on or after the newest one already mirrored.
+    Rows are fetched without holding the mirror lock, so reads carry on meanwhile;
+    a caller that finds the table already syncing waits for that sync instead.
+    """
+    field_map = load_field_map(table["id"])
+    fids = _mirrored_fids(table, field_map)
+    rid_fid = field_map["Record ID#"]["id"]
+    modified_fid = field_map.get(DATE_MODIFIED_LABEL, {}).get("id")
+    field_types = {str(f["id"]): f.get("type") for f in field_map.values()}
+    conn = _connection()
+    with _lock:
+        running = _syncing.get(table["id"])
+        if running is None:
+            _syncing[table["id"]] = threading.Event()
+    if running is not None:
+        running.wait()
+        with _lock:
+            meta = _meta(table["id"])
+        if meta is None:
+            raise MirrorUnavailable(f"concurrent sync of '{table['name']}' did not complete")
+        return meta
+    try:
+        with _lock:
+            meta = _meta(table["id"])
+        now = time.time()
+        full = (
+            meta is None or meta["fids"] != fids or not modified_fid or not meta["last_modified"]
+            or now - (meta["full_synced_at"] or 0) >= MIRROR_FULL_RESYNC_SECONDS
+        )
+        json_fids = set() if full else meta["json_fids"]
+        started = time.time()
+        # Fetch outside the lock and before the write transaction: neither is held across HTTP calls
+        if full:
+            rows = quickbase_query(table["id"], build_body(select=fids), max_records=MIRROR_MAX_ROWS + 1, allow_partial=False)
+            if len(rows) > MIRROR_MAX_ROWS:
+                _oversized[table["id"]] = now
+                raise MirrorUnavailable(f"table {table['id']} exceeds MIRROR_MAX_ROWS ({MIRROR_MAX_ROWS})")
+            last_modified = None
+        else:
+            body = build_body(cond(modified_fid, "OAF", meta["last_modified"]), select=fids)
+            rows = quickbase_query(table["id"], body, max_records=MIRROR_MAX_ROWS, allow_partial=False)
+            last_modified = meta["last_modified"]
+        with _lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if full:
+                    conn.execute(f"DROP TABLE IF EXISTS {_table_sql(table['id'])}")
+                    columns = ", ".join(
+                        f"{_col(f)} INTEGER PRIMARY KEY" if f == rid_fid else _col(f) for f in fids
+                    )
+                    conn.execute(f"CREATE TABLE {_table_sql(table['id'])} ({columns})")
+                newest = _write_rows(table["id"], fids, modified_fid, rows, json_fids)
+                if newest and (last_modified is None or newest > last_modified):
+                    last_modified = newest
+                row_count = conn.execute(f"SELECT COUNT(*) FROM {_table_sql(table['id'])}").fetchone()[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO _mirror_meta VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (table["id"], json.dumps(fids), json.dumps(sorted(json_fids)), json.dumps(field_types),
+                     last_modified, now, now if full else meta["full_synced_at"], row_count)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            meta = _meta(table["id"])
+    finally:
+        with _lock:
+            _syncing.pop(table["id"]).set()
+    logger.info(
+        "Mirror %s sync of '%s': %d row(s) fetched, %d mirrored in %.2fs",
+        "full" if full else "delta", table["name"], len(rows), row_count, time.time() - started
+    )
+    return meta
+
+def _fresh_meta(table: Dict[str, str]) -> Dict[str, Any]:
+    """Metadata for a usable mirror, syncing first when due; raises MirrorUnavailable when stale."""
+    if time.time() - _oversized.get(table["id"], float("-inf")) < MIRROR_FULL_RESYNC_SECONDS:
+        raise MirrorUnavailable(f"table {table['id']} exceeds MIRROR_MAX_ROWS ({MIRROR_MAX_ROWS})")
+    with _lock:
+        meta = _meta(table["id"])
+        syncing = table["id"] in _syncing
+    if meta is not None:
+        age = time.time() - meta["synced_at"]
+        # Fresh, or another caller is already refreshing a replica that is still servable
+        if age < MIRROR_SYNC_INTERVAL_SECONDS or (syncing and age < MIRROR_MAX_STALENESS_SECONDS):
+            return meta
+    try:
+        return sync_table(table)
+    except MirrorUnavailable:
+        raise
+    except Exception as e:
+        if meta is not None and time.time() - meta["synced_at"] < MIRROR_MAX_STALENESS_SECONDS:
+            logger.warning("Mirror sync failed for '%s'; serving %.0fs-old replica: %s",
+                           table["name"], time.time() - meta["synced_at"], e)
+            return meta
+        raise MirrorUnavailable(f"mirror of '{table['name']}' is stale and sync failed: {e}")
+
+# ============================================================================
+# WHERE CLAUSE → SQL
+# ============================================================================
+_TOKEN_RE = re.compile(r"\{(\d+)\.([A-Z]+)\.('(?:[^'\\]|\\.)*'|[^}]*)\}|\(|\)|AND|OR", re.IGNORECASE)
+_RELATIVE_RE = re.compile(r"^(?:today-(\d+)([dwmy])|(\d+) (day|week|month|year)s? ago|today)$")
+
+def _literal(raw: str) -> str:
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] == raw[-1] == "'":
+        raw = re.sub(r"\\(.)", r"\1", raw[1:-1])
+    return raw
+
+def _absolute_date(text: str) -> str:
+    """Quickbase relative dates ('today-7d', '7 days ago', 'today') → ISO date; ISO passes through."""
+    m = _RELATIVE_RE.match(text.strip().lower())
+    if not m:
+        return text
+    if text.strip().lower() == "today":
+        return date.today().isoformat()
+    return absolute_date(int(m.group(1) or m.group(3)), m.group(2) or m.group(4))
+
+def _condition(fid: int, op: str, raw: str, meta: Dict[str, Any], alias: str) -> Tuple[str, List[Any]]:
+    if fid not in meta["fids"]:
+        raise MirrorUnavailable(f"field {fid} is not mirrored")
+    col = f"{alias}{_col(fid)}"
+    value = _literal(raw)
+    numeric = meta["field_types"].get(str(fid)) in NUMERIC_FIELD_TYPES
+    if op in ("EX", "TV", "XEX"):
+        if numeric:
+            try:
+                param: Any = float(value)
+            except ValueError:
+                return ("0" if op != "XEX" else "1"), []
+            clause = f"{col} = ?"
+        else:
+            param, clause = value, f"{col} = ? COLLATE NOCASE"
+        return (clause if op != "XEX" else f"({col} IS NULL OR NOT ({clause}))"), [param]
+    if op in ("CT", "XCT"):
+        escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clause = f"{col} LIKE ? ESCAPE '\\'"
+        return (clause if op == "CT" else f"({col} IS NULL OR NOT ({clause}))"), [f"%{escaped}%"]
+    if op == "SW":
+        escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"{col} LIKE ? ESCAPE '\\'", [f"{escaped}%"]
+    if op in ("GT", "GTE", "LT", "LTE"):
+        sym = {"GT": ">", "GTE": ">=", "LT": "<", "LTE": "<="}[op]
+        try:
+            return f"{col} {sym} ?", [float(value)]
+        except ValueError:
+            raise MirrorUnavailable(f"non-numeric literal for {op}: {value!r}")
+    if op in ("OAF", "AF", "OBF", "BF"):
+        sym = {"OAF": ">=", "AF": ">", "OBF": "<=", "BF": "<"}[op]
+        target = _absolute_date(value)
+        if "T" in target:
+            return f"{col} {sym} ?", [target]
+        # Date granularity, matching Quickbase for date fields and date literals
+        return f"substr({col}, 1, 10) {sym} ?", [target[:10]]
+    raise MirrorUnavailable(f"operator {op} not supported by the mirror")
+
+def where_to_sql(where: str, meta: Dict[str, Any], alias: str = "") -> Tuple[str, List[Any]]:
+    """Translate a Quickbase where clause (the subset this backend generates) into SQL."""
+    sql, params, pos = [], [], 0
+    for m in _TOKEN_RE.finditer(where):
+        if where[pos:m.start()].strip():
+            raise MirrorUnavailable(f"unparsed where fragment: {where[pos:m.start()]!r}")
+        pos = m.end()
+        token = m.group(0)
+        if m.group(1):
+            clause, p = _condition(int(m.group(1)), m.group(2).upper(), m.group(3), meta, alias)
+            sql.append(clause)
+            params.extend(p)
+        elif token in ("(", ")"):
+            sql.append(token)
+        else:
+            sql.append(f" {token.upper()} ")
+    if where[pos:].strip():
+        raise MirrorUnavailable(f"unparsed where fragment: {where[pos:]!r}")
+    return "".join(sql) or "1", params
+
+def _to_rows(cursor_rows: List[tuple], fids: List[int], json_fids: Set[int], offset: int = 0) -> List[Dict[str, Any]]:
+    rows = []
+    for record in cursor_rows:
+        row = {}
+        for i, fid in enumerate(fids):
+            value = record[offset + i]
+            if value is not None and fid in json_fids:
+                value = json.loads(value)
+            row[str(fid)] = {"value": value}
+        rows.append(row)
+    return rows
+
+def _select_fids(body: Dict[str, Any], meta: Dict[str, Any]) -> List[int]:
+    fids = [int(f) for f in body.get("select") or meta["fids"]]
+    missing = [f for f in fids if f not in meta["fids"]]
+    if missing:
+        raise MirrorUnavailable(f"fields {missing} are not mirrored")
+    return fids
+
+def _order_by(body: Dict[str, Any], meta: Dict[str, Any], alias: str = "") -> str:
+    terms = []
+    for sort in body.get("sortBy") or []:
+        fid = int(sort["fieldId"])
+        if fid not in meta["fids"]:
+            raise MirrorUnavailable(f"sort field {fid} is not mirrored")
+        terms.append(f"{alias}{_col(fid)} {'DESC' if str(sort.get('order', 'ASC')).upper() == 'DESC' else 'ASC'}")
+    return f" ORDER BY {', '.join(terms)}" if terms else ""
+
+def mirror_query(table: Dict[str, str], body: Dict[str, Any], max_records: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Answer a Quickbase records/query body from the replica (raises MirrorUnavailable)."""
+    meta = _fresh_meta(table)
+    fids = _select_fids(body, meta)
+    where_sql, params = where_to_sql(body.get("where", ""), meta)
+    options = body.get("options", {})
+    limit = max_records or -1
+    if options.get("top"):
+        limit = min(limit, options["top"]) if limit > 0 else options["top"]
+    sql = (
+        f"SELECT {', '.join(_col(f) for f in fids)} FROM {_table_sql(table['id'])} "
+        f"WHERE {where_sql}{_order_by(body, meta)} LIMIT ? OFFSET ?"
+    )
+    with _lock:
+        records = _connection().execute(sql, params + [limit, options.get("skip", 0)]).fetchall()
+    return _to_rows(records, fids, meta["json_fids"])
+
+def mirror_children(
+    parent: Dict[str, str],
+    child: Dict[str, str],
+    fk_fid: int,
+    parent_ids: List[Any],
+    child_where: str = "",
+    max_records: Optional[int] = None
+) -> Dict[Any, List[Dict[str, Any]]]:
+    """Children of many parents in one SQL join, grouped by parent Record ID#."""
+    parent_meta = _fresh_meta(parent)
+    child_meta = _fresh_meta(child)
+    parent_rid = load_field_map(parent["id"])["Record ID#"]["id"]
+    if int(fk_fid) not in child_meta["fids"]:
+        raise MirrorUnavailable(f"foreign key {fk_fid} is not mirrored")
+    where_sql, params = where_to_sql(child_where, child_meta, alias="c.")
+    fids = child_meta["fids"]
+    marks = ",".join("?" for _ in parent_ids)
+    sql = (
+        f"SELECT p.{_col(parent_rid)}, {', '.join('c.' + _col(f) for f in fids)} "
+        f"FROM {_table_sql(child['id'])} c JOIN {_table_sql(parent['id'])} p "
+        f"ON c.{_col(fk_fid)} = p.{_col(parent_rid)} "
+        f"WHERE p.{_col(parent_rid)} IN ({marks}) AND ({where_sql})"
+    )
+    with _lock:
+        records = _connection().execute(sql, [int(p) for p in parent_ids] + params).fetchall()
+    grouped: Dict[Any, List[Dict[str, Any]]] = {pid: [] for pid in parent_ids}
+    by_int = {int(pid): pid for pid in parent_ids}
+    for record, row in zip(records, _to_rows(records, fids, child_meta["json_fids"], offset=1)):
+        bucket = grouped[by_int[int(record[0])]]
+        if max_records is None or len(bucket) < max_records:
+            bucket.append(row)
+    return grouped
+
+def query_records(table: Dict[str, str], body: Dict[str, Any], max_records: Optional[int] = None) -> List[Dict[str, Any]]:
+    """quickbase_query() for allowlisted tables, served from the mirror when enabled and fresh."""
+    if MIRROR_ENABLED and table.get("name") in ALLOW_LISTS:
+        try:
+            rows = mirror_query(table, body, max_records=max_records)
+            logger.debug("Mirror answered query on '%s' (%d rows)", table["name"], len(rows))
+            return rows
+        except MirrorUnavailable as e:
+            logger.info("Mirror skipped for '%s': %s", table["name"], e)
+        except sqlite3.Error as e:
+            logger.warning("Mirror query failed for '%s', using live API: %s", table["name"], e)
+    return quickbase_query(table["id"], body, max_records=max_records)
+
+def query_record_pages(table: Dict[str, str], body: Dict[str, Any], max_records: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """query_records() page by page; a mirror answer arrives as a single page."""
+    if MIRROR_ENABLED and table.get("name") in ALLOW_LISTS:
+        try:
+            yield mirror_query(table, body, max_records=max_records)
+            return
+        except MirrorUnavailable as e:
+            logger.info("Mirror skipped for '%s': %s", table["name"], e)
+        except sqlite3.Error as e:
+            logger.warning("Mirror query failed for '%s', using live API: %s", table["name"], e)
+    yield from quickbase_query_pages(table["id"], body, max_records=max_records)
+
+def get_mirror_stats() -> Dict[str, Any]:
+    if not MIRROR_ENABLED or _conn is None:
+        return {}
+    now = time.time()
+    with _lock:
+        rows = _connection().execute("SELECT table_id, row_count, synced_at FROM _mirror_meta").fetchall()
+    return {table_id: {"rows": count, "age_sec": round(now - synced, 1)} for table_id, count, synced in rows}
+
+def clear_mirror() -> None:
+    """Forget sync state so the next query reloads each table in full."""
+    if _conn is None:
+        return
+    with _lock:
+        _conn.execute("DELETE FROM _mirror_meta")
+        _oversized.clear()
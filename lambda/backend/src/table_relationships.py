@@ -1,41 +1,43 @@
 import json, time, logging
 from typing import Dict, Any, List, Optional
 
-from src.config import cloudwatch
+from src.config import get_cloudwatch_client
 from src.quickbase_api import quickbase_get, load_field_map
-from src.cache_utils import _relationship_cache, _is_cache_valid, _table_metadata_cache
-from src.config import ALLOW_LISTS
+from src.cache_utils import _relationship_cache, _is_cache_valid, _table_metadata_cache, _record_cache_lookup
+from src.config import ALLOW_LISTS, QB_API_BASE
 
 logger = logging.getLogger("quickbase-agent")
 
 def send_cloudwatch_metrics(metric_data: List[Dict[str, Any]]) -> None:
     """Send metrics to CloudWatch."""
     try:
-        cloudwatch.put_metric_data(
+        get_cloudwatch_client().put_metric_data(
             Namespace='QuickBaseAgent',
             MetricData=metric_data
         )
     except Exception as e:
-        logger.warning(f"Failed to send CloudWatch metrics: {e}")
+        logger.warning("Failed to send CloudWatch metrics: %s", e)
 
 def get_table_metadata(table_id: str, app_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Fetch metadata for a single Quickbase table with TTL-based caching.
     """
     entry = _table_metadata_cache.get(table_id)
-    if _is_cache_valid(entry):
-        logger.info(f"Using cached metadata for table {table_id}")
+    hit = _is_cache_valid(entry)
+    _record_cache_lookup("metadata", hit)
+    if hit:
+        logger.debug("Using cached metadata for table %s", table_id)
         return entry["data"]
     elif entry:
-        logger.info(f"Cache expired for table {table_id}, refreshing...")
-    url = f"https://api.quickbase.com/v1/tables/{table_id}"
+        logger.info("Cache expired for table %s, refreshing...", table_id)
+    url = f"{QB_API_BASE}/tables/{table_id}"
     if app_id:
         url += f"?appId={app_id}"
     table_info = quickbase_get(url)
     if not isinstance(table_info, dict):
         raise ValueError(f"Unexpected response type for table {table_id}: {type(table_info).__name__}")
     _table_metadata_cache[table_id] = {"timestamp": time.time(), "data": table_info}
-    logger.info(f"Cached table metadata for '{table_info.get('name')}' ({table_info.get('id')})")
+    logger.info("Cached table metadata for '%s' (%s)", table_info.get('name'), table_info.get('id'))
     return table_info
 
 def list_relationships(table_id: str) -> List[Dict[str, Any]]:
@@ -44,28 +46,28 @@ def list_relationships(table_id: str) -> List[Dict[str, Any]]:
     TTL-cached to reduce API calls and includes detailed debug logs.
     """
     entry = _relationship_cache.get(table_id)
-    if _is_cache_valid(entry):
-        logger.info(f"Using cached relationships for table {table_id}")
+    hit = _is_cache_valid(entry)
+    _record_cache_lookup("relationships", hit)
+    if hit:
+        logger.debug("Using cached relationships for table %s", table_id)
         return entry["data"]
     elif entry:
-        logger.info(f"Relationship cache expired for table {table_id}, refreshing...")
-    url = f"https://api.quickbase.com/v1/tables/{table_id}/relationships"
+        logger.info("Relationship cache expired for table %s, refreshing...", table_id)
+    url = f"{QB_API_BASE}/tables/{table_id}/relationships"
     rels_data = quickbase_get(url)
     rels = rels_data.get("relationships", []) if isinstance(rels_data, dict) else []
     if not rels:
-        logger.warning(f"No relationships found for table {table_id}")
+        logger.warning("No relationships found for table %s", table_id)
         _relationship_cache[table_id] = {"timestamp": time.time(), "data": []}
         return []
-    logger.info(f"Found {len(rels)} relationship(s) for table {table_id}")
-    for r in rels:
-        parent_id = r.get("parentTableId")
-        child_id = r.get("childTableId")
-        fk_field = r.get("foreignKeyField", {}).get("id")
-        fk_label = r.get("foreignKeyField", {}).get("label")
-        print(
-            f"INFO: Relationship — Parent: {parent_id}, "
-            f"Child: {child_id}, Foreign Key FID: {fk_field} ({fk_label})"
-        )
+    logger.info("Found %d relationship(s) for table %s", len(rels), table_id)
+    if logger.isEnabledFor(logging.DEBUG):
+        for r in rels:
+            logger.debug(
+                "Relationship — Parent: %s, Child: %s, Foreign Key FID: %s (%s)",
+                r.get("parentTableId"), r.get("childTableId"),
+                r.get("foreignKeyField", {}).get("id"), r.get("foreignKeyField", {}).get("label")
+            )
     _relationship_cache[table_id] = {"timestamp": time.time(), "data": rels}
     return rels
 
@@ -0,0 +1,241 @@
+import json, time, logging, threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.config import ALLOW_LISTS, MULTI_LEVEL_MAX_ROWS, MULTI_LEVEL_TIMEOUT_SECONDS, MULTI_TABLE_WORKERS
+from src.quickbase_api import load_field_map
+from src.field_detection import clean_field_name
+from src.formatters import format_record
+from src.query_builder import all_of, any_of, build_bodies, cond
+from src.record_retrieval import find_child_relationship, child_date_filter
+from src.table_mirror import query_record_pages
+from src.deadline import current_deadline
+
+logger = logging.getLogger("quickbase-agent")
+
+def plan_traversal(tables: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    """
+    Arrange the requested tables into a tree: the first table is the root, and each
+    later table hangs off the nearest earlier table that is its parent in Quickbase.
+    Returns one step per table in request order (depth 0 for the root).
+    Raises ValueError when a table has no parent among the tables before it.
+    """
+    steps = [{"table": tables[0], "parent": None, "depth": 0}]
+    for table in tables[1:]:
+        for parent_step in reversed(steps):
+            rel = find_child_relationship(parent_step["table"], table)
+            if rel is not None:
+                steps.append({"table": table, "parent": parent_step, "depth": parent_step["depth"] + 1, "rel": rel})
+                break
+        else:
+            raise ValueError(
+                f"No relationship links '{table['name']}' to any of "
+                f"{[s['table']['name'] for s in steps]}; list parent tables before their children"
+            )
+    logger.debug("Traversal plan: %s", [(s["table"]["name"], s["depth"]) for s in steps])
+    return steps
+
+def _select_fids(table: Dict[str, str], extra: List[int]) -> List[int]:
+    field_map = load_field_map(table["id"])
+    fids = [field_map["Record ID#"]["id"]]
+    for label in ALLOW_LISTS.get(table["name"], {}).get("fields", []):
+        clean = clean_field_name(label)
+        if clean in field_map:
+            fids.append(field_map[clean]["id"])
+    return list(dict.fromkeys(fids + extra))
+
+def _rid(table: Dict[str, str], row: Dict[str, Any]) -> Any:
+    return (row.get(str(load_field_map(table["id"])["Record ID#"]["id"])) or {}).get("value")
+
+def _key(value: Any) -> str:
+    """Foreign key values may come back as numbers or numeric strings."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _fetch_chunk(table: Dict[str, str], body: Dict[str, Any], stop: threading.Event) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    One chunked level query, page by page. Checks `stop` and the request deadline before
+    each page, so a worker abandoned by fetch_levels() sends no further Quickbase queries.
+    Returns (rows, stopped).
+    """
+    deadline = current_deadline()
+    rows: List[Dict[str, Any]] = []
+    pages = query_record_pages(table, body, max_records=MULTI_LEVEL_MAX_ROWS)
+    try:
+        while True:
+            if stop.is_set() or deadline.expired():
+                return rows, True
+            page = next(pages, None)
+            if page is None:
+                return rows, False
+            rows.extend(page)
+    finally:
+        pages.close()
+
+def fetch_levels(
+    steps: List[Dict[str, Any]],
+    root_rows: List[Dict[str, Any]],
+    date_filter_value: Optional[int] = None,
+    date_filter_unit: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Fetch every non-root table level by level. All tables at one depth are queried
+    together, in parallel, with one batched foreign-key filter per parent set
+    (chunked by QB_MAX_WHERE_TERMS) instead of a query per parent row. The date filter
+    applies to the first level below the root, as it does for parent+child reports.
+    Each level keeps at most MULTI_LEVEL_MAX_ROWS rows per table and gets
+    MULTI_LEVEL_TIMEOUT_SECONDS (less when the request deadline is nearer); a level that
+    hits either limit is marked truncated, as is every level left when the deadline passes.
+    A query that fails marks its table truncated with the "error" and stops the traversal
+    there, keeping the levels already fetched. Abandoned workers stop before their next page.
+    Returns {table_id: {"rows", "by_parent", "truncated"}} for every step.
+    """
+    root = steps[0]["table"]
+    levels: Dict[str, Any] = {root["id"]: {"rows": root_rows, "by_parent": {}, "truncated": False}}
+    max_depth = max(s["depth"] for s in steps)
+    deadline = current_deadline()
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, MULTI_TABLE_WORKERS), thread_name_prefix="qb-level")
+    try:
+        for depth in range(1, max_depth + 1):
+            if deadline.expired():
+                cut = [s["table"] for s in steps if s["depth"] >= depth]
+                for table in cut:
+                    levels[table["id"]] = {"rows": [], "by_parent": {}, "truncated": True}
+                deadline.mark_partial(f"not fetched: {', '.join(t['name'] for t in cut)}")
+                break
+            started = time.time()
+            futures = {}
+            for step in (s for s in steps if s["depth"] == depth):
+                table, parent, rel = step["table"], step["parent"]["table"], step["rel"]
+                levels[table["id"]] = {"rows": [], "by_parent": {}, "truncated": False}
+                parent_ids = [pid for pid in (_rid(parent, r) for r in levels[parent["id"]]["rows"]) if pid is not None]
+                if not parent_ids:
+                    continue
+                where = all_of(
+                    any_of(*[cond(rel["field_id"], rel["operator"], pid) for pid in parent_ids]),
+                    child_date_filter(table, date_filter_value, date_filter_unit) if depth == 1 else None
+                )
+                for body in build_bodies(where, _select_fids(table, [rel["field_id"]])):
+                    futures[executor.submit(copy_context().run, _fetch_chunk, table, body, stop)] = step
+            if not futures:
+                continue
+            remaining = deadline.remaining()
+            timeout = MULTI_LEVEL_TIMEOUT_SECONDS if remaining is None else max(0.0, min(MULTI_LEVEL_TIMEOUT_SECONDS, remaining))
+            done, pending = wait(futures, timeout=timeout)
+            if pending:
+                stop.set()
+            failed = []
+            for future in pending:
+                future.cancel()
+                levels[futures[future]["table"]["id"]]["truncated"] = True
+            if pending and deadline.expired():
+                deadline.mark_partial(f"level {depth} fetch stopped at the request deadline")
+            for future in done:
+                step = futures[future]
+                table, rel = step["table"], step["rel"]
+                level = levels[table["id"]]
+                try:
+                    fetched, stopped = future.result()
+                except Exception as e:
+                    level["truncated"] = True
+                    if deadline.expired():
+                        deadline.mark_partial(f"{table['name']} fetch stopped at the request deadline ({e})")
+                    else:
+                        logger.exception("Level %d fetch of '%s' failed: %s", depth, table["name"], e)
+                        level["error"] = str(e)
+                        failed.append(table["name"])
+                        deadline.mark_partial(f"{table['name']} fetch failed ({e})")
+                    continue
+                if stopped:
+                    level["truncated"] = True
+                    if deadline.expired():
+                        deadline.mark_partial(f"{table['name']} fetch stopped at the request deadline")
+                seen = {_rid(table, r) for r in level["rows"]}
+                for row in fetched:
+                    rid = _rid(table, row)
+                    if rid in seen:
+                        continue
+                    if len(level["rows"]) >= MULTI_LEVEL_MAX_ROWS:
+                        level["truncated"] = True
+                        break
+                    seen.add(rid)
+                    level["rows"].append(row)
+                    fk = (row.get(str(rel["field_id"])) or {}).get("value")
+                    level["by_parent"].setdefault(_key(fk), []).append(row)
+                if len(level["rows"]) >= MULTI_LEVEL_MAX_ROWS:
+                    level["truncated"] = True
+            logger.info(
+                "Fetched level %d (%s) in %.2fs with %d queries%s",
+                depth,
+                ", ".join(f"{s['table']['name']}: {len(levels[s['table']['id']]['rows'])}" for s in steps if s["depth"] == depth),
+                time.time() - started, len(futures), " (timed out)" if pending else (" (failed)" if failed else "")
+            )
+            if failed:
+                # Deeper levels would hang off an incomplete parent set; stop with what is fetched
+                stop.set()
+                for s in steps:
+                    if s["depth"] > depth:
+                        levels[s["table"]["id"]] = {"rows": [], "by_parent": {}, "truncated": True}
+            if pending or failed:
+                break
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return levels
+
+def formatted_record(table: Dict[str, str], row: Dict[str, Any], levels: Dict[str, Any]) -> Dict[str, Any]:
+    """format_record() once per row, so attachments are not re-uploaded for each path through it."""
+    cache = levels.setdefault(table["id"], {}).setdefault("formatted", {})
+    rid = _rid(table, row)
+    if rid not in cache:
+        cache[rid] = format_record(row, table)
+    return cache[rid]
+
+def _children_of(step: Dict[str, Any], steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [s for s in steps if s.get("parent") is step]
+
+def flat_columns(table: Dict[str, str], formatted: Dict[str, Any]) -> Dict[str, Any]:
+    columns = {}
+    for key, value in formatted.items():
+        if value is None or value == "":
+            continue
+        columns[f"{table['name']}_{key}"] = json.dumps(value) if isinstance(value, (dict, list)) else value
+    return columns
+
+def flatten_tree(step: Dict[str, Any], row: Dict[str, Any], steps: List[Dict[str, Any]], levels: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    One CSV row per root-to-leaf path under `row`, columns prefixed with the table name.
+    Sibling child tables contribute separate rows rather than a cross product.
+    """
+    table = step["table"]
+    base = flat_columns(table, formatted_record(table, row, levels))
+    paths = []
+    for child_step in _children_of(step, steps):
+        level = levels.get(child_step["table"]["id"], {})
+        for child in level.get("by_parent", {}).get(_key(_rid(table, row)), []):
+            paths.extend({**base, **sub} for sub in flatten_tree(child_step, child, steps, levels))
+    return paths or [base]
+
+def nest_tree(step: Dict[str, Any], row: Dict[str, Any], steps: List[Dict[str, Any]], levels: Dict[str, Any]) -> Dict[str, Any]:
+    """Formatted record with its child tables' records nested under their table names."""
+    table = step["table"]
+    node = dict(formatted_record(table, row, levels))
+    for child_step in _children_of(step, steps):
+        level = levels.get(child_step["table"]["id"], {})
+        children = level.get("by_parent", {}).get(_key(_rid(table, row)), [])
+        node[child_step["table"]["name"]] = [nest_tree(child_step, c, steps, levels) for c in children]
+    return node
+
+def descendant_records(step: Dict[str, Any], row: Dict[str, Any], steps: List[Dict[str, Any]], levels: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Raw descendant rows of `row`, grouped by table id."""
+    found: Dict[str, List[Dict[str, Any]]] = {}
+    for child_step in _children_of(step, steps):
+        table_id = child_step["table"]["id"]
+        for child in levels.get(table_id, {}).get("by_parent", {}).get(_key(_rid(step["table"], row)), []):
+            found.setdefault(table_id, []).append(child)
+            for sub_id, sub_rows in descendant_records(child_step, child, steps, levels).items():
+                found.setdefault(sub_id, []).extend(sub_rows)
+    return found
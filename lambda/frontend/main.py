@@ -1,12 +1,9 @@
 import json
-import boto3
 import os
 import sys
 import traceback
 import base64
-import asyncio
-from amazon_transcribe.client import TranscribeStreamingClient
-from amazon_transcribe.handlers import TranscriptResultStreamHandler
+import time
 
 
 # ---------- Logging ----------
@@ -22,34 +19,296 @@ AGENT_ID = os.getenv("AGENT_ID")
 ALIAS_ID = os.getenv("ALIAS_ID")
 REGION = os.getenv("REGION", "us-east-1")
 
-# AWS clients (only initialized in non-demo mode)
-bedrock = boto3.client("bedrock-agent-runtime", region_name=REGION)
+# Audio preprocessing (WAV → 16 kHz mono PCM with silence trimmed) before Transcribe
+AUDIO_PREPROCESSING = os.getenv("AUDIO_PREPROCESSING", "true").lower() == "true"
+TARGET_SAMPLE_RATE = int(os.getenv("TARGET_SAMPLE_RATE", "16000"))
+VAD_FRAME_MS = 20
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "250"))
+VAD_MIN_RMS = int(os.getenv("VAD_MIN_RMS", "300"))
+VAD_NOISE_RATIO = float(os.getenv("VAD_NOISE_RATIO", "3.0"))
+
+# Live voice over WebSocket (see serve_voice_websocket)
+VOICE_WS_PORT = os.getenv("VOICE_WS_PORT")
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", str(1024 * 1024)))
+
+# Prompt-level response cache (opt-in)
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+# "session" or "global"; global scope only caches the first turn of each session, since later
+# turns may depend on the conversation so far. Follow-ups ("show more", "what about closed
+# ones") are not cached in either scope.
+PROMPT_CACHE_SCOPE = os.getenv("PROMPT_CACHE_SCOPE", "session").lower()
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "300"))
+# TTL for prompts with relative dates ("today", "last 7 days"); 0 skips caching them
+PROMPT_CACHE_RELATIVE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_RELATIVE_TTL_SECONDS", "0"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "256"))
+# Directory shared between containers (e.g. an EFS mount); stands in for a shared cache service
+PROMPT_CACHE_SHARED_DIR = os.getenv("PROMPT_CACHE_SHARED_DIR")
+# Replies carry presigned S3 links; entries never outlive them. Same setting as the backend,
+# used when a link's own expiry cannot be read from its query string.
+PRESIGNED_URL_EXPIRATION = int(os.getenv("PRESIGNED_URL_EXPIRATION", "3600"))
+# How long a session's turn count is remembered (Bedrock agent sessions idle out within an hour)
+PROMPT_CACHE_SESSION_TTL_SECONDS = 3600
+
+# JSON codec: orjson when installed ("stdlib" forces the json module), as in the backend's src/json_codec.py
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+_fast_json = orjson is not None and JSON_CODEC != "stdlib"
+
+
+def json_loads(data):
+    """Parse JSON from bytes or str without a separate decode step when orjson is available."""
+    return orjson.loads(data) if _fast_json else json.loads(data)
+
+
+def json_dumps_bytes(obj):
+    """UTF-8 JSON bytes, ready to write to a socket."""
+    if _fast_json:
+        try:
+            return orjson.dumps(obj, default=str)
+        except TypeError:
+            pass
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+# AWS clients (created on first use; demo mode and cold starts never pay for boto3)
+_bedrock = None
+
+
+def get_bedrock_client():
+    global _bedrock
+    if _bedrock is None:
+        import boto3
+        _bedrock = boto3.client("bedrock-agent-runtime", region_name=REGION)
+    return _bedrock
 
 
 # ---------- Transcribe Event Handler ----------
-class MyEventHandler(TranscriptResultStreamHandler):
-    def __init__(self, transcript_result_stream):
-        super().__init__(transcript_result_stream)
-        self.full_text = ""
+_event_handler_cls = None
+
+
+def get_event_handler_class():
+    """Build the Transcribe handler class lazily so amazon_transcribe loads only for voice requests."""
+    global _event_handler_cls
+    if _event_handler_cls is None:
+        from amazon_transcribe.handlers import TranscriptResultStreamHandler
+
+        class MyEventHandler(TranscriptResultStreamHandler):
+            def __init__(self, transcript_result_stream, on_result=None):
+                super().__init__(transcript_result_stream)
+                self.full_text = ""
+                # Optional async callback(text_so_far, is_final) for live partial transcripts
+                self.on_result = on_result
+
+            async def handle_transcript_event(self, transcript_event):
+                results = transcript_event.transcript.results
+                for result in results:
+                    if not result.alternatives:
+                        continue
+                    text = result.alternatives[0].transcript.strip()
+                    if not result.is_partial:
+                        self.full_text += text + " "
+                    if self.on_result:
+                        if result.is_partial:
+                            await self.on_result((self.full_text + text).strip(), False)
+                        else:
+                            await self.on_result(self.full_text.strip(), True)
+
+        _event_handler_cls = MyEventHandler
+    return _event_handler_cls
+
+
+# ---------- Audio Preprocessing ----------
+def parse_wav(audio_bytes):
+    """Return (pcm_bytes, sample_rate, channels, sample_width) for a PCM WAV file."""
+    import io
+    import wave
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        return (
+            wav.readframes(wav.getnframes()),
+            wav.getframerate(),
+            wav.getnchannels(),
+            wav.getsampwidth(),
+        )
+
+
+def to_int16_samples(pcm, sample_width):
+    """Convert little-endian PCM of any common width to an array of signed 16-bit samples."""
+    from array import array
+    if sample_width == 2:
+        samples = array("h")
+        samples.frombytes(pcm[: len(pcm) - len(pcm) % 2])
+    elif sample_width == 1:
+        # 8-bit WAV is unsigned
+        samples = array("h", ((b - 128) << 8 for b in pcm))
+    elif sample_width in (3, 4):
+        # Keep the two most significant bytes of each little-endian sample
+        usable = len(pcm) - len(pcm) % sample_width
+        high = bytearray(usable // sample_width * 2)
+        high[0::2] = pcm[sample_width - 2:usable:sample_width]
+        high[1::2] = pcm[sample_width - 1:usable:sample_width]
+        samples = array("h")
+        samples.frombytes(bytes(high))
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width}")
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def _sum_lanes(lanes):
+    """Element-wise sum of equal-length sample sequences (C-level map, no per-sample bytecode)."""
+    from functools import reduce
+    from operator import add
+    return reduce(lambda acc, lane: list(map(add, acc, lane)), lanes[1:], list(lanes[0]))
+
+
+def _scale(values, divisor):
+    from array import array
+    from itertools import repeat
+    from operator import floordiv
+    return array("h", map(floordiv, values, repeat(divisor)) if divisor > 1 else values)
+
+
+def downmix_to_mono(samples, channels):
+    if channels == 1:
+        return samples
+    frames = len(samples) // channels
+    lanes = [samples[c:frames * channels:channels] for c in range(channels)]
+    return _scale(_sum_lanes(lanes), channels)
+
+
+def resample(samples, src_rate, dst_rate, channels=1):
+    """
+    Box-filter decimation to mono: each output sample is the mean of the `step` input
+    frames starting at its position, across all channels (nearest, not interpolated).
+    Enough anti-aliasing for speech recognition, and every pass is a slice, an
+    itemgetter or a C-level map rather than per-sample bytecode.
+    """
+    from array import array
+    from itertools import repeat
+    from operator import add, itemgetter, mul
+    if src_rate == dst_rate or not samples:
+        return downmix_to_mono(samples, channels)
+    step = src_rate / dst_rate
+    width = max(1, int(step))
+    out_len = int(len(samples) // channels / step)
+    if out_len < 2:
+        return downmix_to_mono(samples, channels)[:out_len]
+    if step.is_integer():
+        stride = int(step) * channels
+        lanes = [
+            samples[k * channels + c:out_len * stride:stride]
+            for k in range(width) for c in range(channels)
+        ]
+    else:
+        # Pad with the last frame so start + k never runs off the end
+        padded = samples + samples[-channels:] * width
+        starts = list(map(mul, map(int, map(mul, range(out_len), repeat(step))), repeat(channels)))
+        lanes = [
+            itemgetter(*map(add, starts, repeat(k * channels + c)))(padded)
+            for k in range(width) for c in range(channels)
+        ]
+    return _scale(_sum_lanes(lanes), width * channels)
+
+
+# RMS is estimated from every Nth sample of a frame; plenty for speech/silence decisions
+VAD_RMS_STRIDE = 4
+
+
+def trim_silence(samples, sample_rate):
+    """
+    Energy-based voice activity detection: drop leading/trailing frames whose RMS stays
+    below max(VAD_MIN_RMS, noise floor * VAD_NOISE_RATIO), keeping VAD_PADDING_MS around speech.
+    Returns the input unchanged when no speech is detected.
+    """
+    from operator import mul
+    frame = max(1, sample_rate * VAD_FRAME_MS // 1000)
+    energies = []
+    for start in range(0, len(samples), frame):
+        chunk = samples[start:start + frame:VAD_RMS_STRIDE]
+        energies.append((sum(map(mul, chunk, chunk)) / len(chunk)) ** 0.5)
+    if not energies:
+        return samples
+    noise_floor = sorted(energies)[len(energies) // 10]
+    threshold = max(VAD_MIN_RMS, noise_floor * VAD_NOISE_RATIO)
+    voiced = [i for i, e in enumerate(energies) if e >= threshold]
+    if not voiced:
+        return samples
+    pad = VAD_PADDING_MS // VAD_FRAME_MS
+    first = max(0, voiced[0] - pad) * frame
+    last = min(len(energies), voiced[-1] + 1 + pad) * frame
+    return samples[first:last]
+
+
+def _flac_sample_rate(audio_bytes):
+    # "fLaC" + metadata block header (4 bytes) + STREAMINFO; sample rate is 20 bits at offset 10
+    if len(audio_bytes) < 22 or audio_bytes[:4] != b"fLaC":
+        raise ValueError("Not a FLAC stream")
+    b = audio_bytes
+    return (b[18] << 12) | (b[19] << 4) | (b[20] >> 4)
 
-    async def handle_transcript_event(self, transcript_event):
-        results = transcript_event.transcript.results
-        for result in results:
-            if result.alternatives and not result.is_partial:
-                self.full_text += result.alternatives[0].transcript.strip() + " "
+
+def _opus_sample_rate(audio_bytes):
+    # First Ogg page carries "OpusHead": version, channels, pre-skip, input sample rate (LE)
+    idx = audio_bytes.find(b"OpusHead", 0, 512)
+    if not audio_bytes.startswith(b"OggS") or idx < 0:
+        raise ValueError("Not an Ogg Opus stream")
+    rate = int.from_bytes(audio_bytes[idx + 12:idx + 16], "little")
+    return rate or 48000
+
+
+def prepare_audio(audio_bytes, audio_format="wav"):
+    """
+    Turn client audio into what Transcribe streaming expects.
+    Returns (payload_bytes, sample_rate_hz, media_encoding).
+    - wav: parsed, downmixed to mono, resampled to TARGET_SAMPLE_RATE, silence trimmed
+    - flac / ogg-opus: passed through compressed (Transcribe decodes them natively)
+    - pcm (or unparseable WAV): raw 16-bit PCM at 44.1 kHz, the recorder's legacy format
+    """
+    started = time.time()
+    audio_format = (audio_format or "wav").lower()
+    if audio_format == "flac":
+        return audio_bytes, _flac_sample_rate(audio_bytes), "flac"
+    if audio_format in ("ogg-opus", "opus", "ogg"):
+        return audio_bytes, _opus_sample_rate(audio_bytes), "ogg-opus"
+    if audio_format != "wav" or not AUDIO_PREPROCESSING:
+        return audio_bytes, 44100, "pcm"
+    try:
+        pcm, rate, channels, width = parse_wav(audio_bytes)
+    except Exception as e:
+        log(f"WAV parse failed ({e}); sending raw bytes as 44.1 kHz PCM")
+        return audio_bytes, 44100, "pcm"
+    # Recorders that already send TARGET_SAMPLE_RATE mono skip straight to trimming
+    samples = resample(to_int16_samples(pcm, width), rate, TARGET_SAMPLE_RATE, channels)
+    voiced = trim_silence(samples, TARGET_SAMPLE_RATE)
+    if sys.byteorder == "big":
+        voiced.byteswap()
+    payload = voiced.tobytes()
+    log(
+        f"Audio preprocessed: {len(audio_bytes)} → {len(payload)} bytes, "
+        f"{rate} Hz x{channels} → {TARGET_SAMPLE_RATE} Hz mono, "
+        f"{len(samples) / TARGET_SAMPLE_RATE:.2f}s → {len(voiced) / TARGET_SAMPLE_RATE:.2f}s voiced "
+        f"in {round((time.time() - started) * 1000)} ms"
+    )
+    return payload, TARGET_SAMPLE_RATE, "pcm"
 
 
 # ---------- Async Transcribe ----------
-async def transcribe_audio(audio_bytes: bytes) -> str:
+async def transcribe_audio(audio_bytes: bytes, sample_rate: int = 44100, media_encoding: str = "pcm") -> str:
     """Stream audio bytes to Amazon Transcribe and return transcript."""
+    import asyncio
+    from amazon_transcribe.client import TranscribeStreamingClient
     client = TranscribeStreamingClient(region=REGION)
     stream = await client.start_stream_transcription(
         language_code="en-US",
-        media_sample_rate_hz=44100,
-        media_encoding="pcm"
+        media_sample_rate_hz=sample_rate,
+        media_encoding=media_encoding
     )
 
-    handler = MyEventHandler(stream.output_stream)
+    handler = get_event_handler_class()(stream.output_stream)
 
     async def send_audio():
         chunk_size = 1024 * 16
@@ -61,6 +320,361 @@ async def transcribe_audio(audio_bytes: bytes) -> str:
     return handler.full_text.strip()
 
 
+# ---------- Prompt Cache ----------
+_RELATIVE_DATE_WORDS = (
+    "today", "yesterday", "tomorrow", "tonight", "now", "current", "currently", "latest",
+    "recent", "recently", "this week", "this month", "this quarter", "this year",
+    "last week", "last month", "last quarter", "last year", "past", "ago", "so far",
+)
+
+
+def normalize_prompt(prompt):
+    """Lower-case, collapse whitespace and drop trailing punctuation so trivial rewordings share a key."""
+    return " ".join(prompt.lower().split()).rstrip(" ?!.")
+
+
+def has_relative_date(normalized):
+    import re
+    if re.search(r"\b(last|past|next)\s+\d+\s+(day|week|month|year)s?\b", normalized):
+        return True
+    padded = f" {normalized} "
+    return any(f" {word} " in padded for word in _RELATIVE_DATE_WORDS)
+
+
+# Prompts using these words or openers lean on earlier turns ("show more", "what about
+# closed ones"); over-matching only costs a cache miss
+_FOLLOW_UP_WORDS = (
+    "more", "next", "continue", "again", "same", "rest", "previous", "above", "instead",
+    "else", "other", "others", "those", "these", "them", "they", "it", "that one",
+)
+_FOLLOW_UP_OPENERS = ("and", "also", "but", "then", "ok", "okay", "what about", "how about")
+
+
+def is_follow_up(normalized):
+    import re
+    words = " ".join(re.findall(r"[a-z0-9']+", normalized))
+    if any(words == opener or words.startswith(f"{opener} ") for opener in _FOLLOW_UP_OPENERS):
+        return True
+    padded = f" {words} "
+    return any(f" {word} " in padded for word in _FOLLOW_UP_WORDS)
+
+
+class _SharedFileStore:
+    """
+    Shared-store stand-in: one JSON file per key in a directory visible to every
+    container. Same get/set surface a DynamoDB or ElastiCache tier would provide.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        import hashlib
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("expires_at", 0) > time.time() else None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)  # atomic, so readers never see a partial file
+
+
+def presigned_link_ttl(text):
+    """
+    Seconds until the first presigned S3 link in `text` expires (SigV4 X-Amz-Date +
+    X-Amz-Expires, or SigV2 Expires), PRESIGNED_URL_EXPIRATION for a link whose expiry
+    can't be read, or None when there are no links.
+    """
+    import calendar
+    import re
+    from urllib.parse import parse_qs, urlsplit
+    ttls = []
+    for url in re.findall(r"https?://[^\s)\]>\"']+", text or ""):
+        query = {k.lower(): v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+        if "x-amz-signature" not in query and "signature" not in query:
+            continue
+        try:
+            if "x-amz-expires" in query:
+                signed = calendar.timegm(time.strptime(query["x-amz-date"], "%Y%m%dT%H%M%SZ"))
+                ttls.append(signed + int(query["x-amz-expires"]) - time.time())
+            else:
+                ttls.append(int(query["expires"]) - time.time())
+        except (KeyError, ValueError):
+            ttls.append(PRESIGNED_URL_EXPIRATION)
+    return min(ttls) if ttls else None
+
+
+class PromptCache:
+    """In-memory LRU with per-entry TTL, backed by an optional shared store."""
+
+    def __init__(self, max_entries, shared_store=None):
+        import threading
+        from collections import OrderedDict
+        self.max_entries = max_entries
+        self.shared_store = shared_store
+        self._entries = OrderedDict()
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.shared_store is not None:
+            entry = self.shared_store.get(key)
+            if entry is not None:
+                self._put_local(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def start_turn(self, session_id):
+        """Count a turn for `session_id`; returns how many turns the session had before it."""
+        now = time.time()
+        key = f"session-turns:{session_id}"
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if (entry is None or entry["expires_at"] <= now) and self.shared_store is not None:
+            entry = self.shared_store.get(key)
+        turns = entry["turns"] if entry is not None and entry["expires_at"] > now else 0
+        entry = {"turns": turns + 1, "expires_at": now + PROMPT_CACHE_SESSION_TTL_SECONDS}
+        with self._lock:
+            self._sessions[session_id] = entry
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        if self.shared_store is not None:
+            try:
+                self.shared_store.set(key, entry)
+            except OSError as e:
+                log(f"Shared prompt cache write failed: {e}")
+        return turns
+
+    def set(self, key, value, ttl):
+        # Never serve a reply after the download links in it have expired
+        link_ttl = presigned_link_ttl(" ".join(str(v) for v in value.values() if v))
+        if link_ttl is not None:
+            ttl = min(ttl, link_ttl)
+        if ttl <= 0:
+            return
+        entry = dict(value, expires_at=time.time() + ttl)
+        self._put_local(key, entry)
+        if self.shared_store is not None:
+            try:
+                self.shared_store.set(key, entry)
+            except OSError as e:
+                log(f"Shared prompt cache write failed: {e}")
+
+    def _put_local(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_prompt_cache = None
+
+
+def get_prompt_cache():
+    global _prompt_cache
+    if _prompt_cache is None:
+        shared = _SharedFileStore(PROMPT_CACHE_SHARED_DIR) if PROMPT_CACHE_SHARED_DIR else None
+        _prompt_cache = PromptCache(PROMPT_CACHE_MAX_ENTRIES, shared)
+    return _prompt_cache
+
+
+def prompt_cache_policy(prompt, session_id, turn=0):
+    """
+    Return (cache_key, ttl_seconds) for a prompt, or (None, 0) when it must not be cached.
+    `turn` is how many turns the session had before this one; in global scope only the
+    first turn is shared, as later ones may depend on the conversation. Follow-ups
+    ("show more") are never cached in either scope: the same words mean a different
+    request each time they are sent.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return None, 0
+    if PROMPT_CACHE_SCOPE != "session" and turn > 0:
+        return None, 0
+    normalized = normalize_prompt(prompt)
+    if is_follow_up(normalized):
+        return None, 0
+    ttl = PROMPT_CACHE_TTL_SECONDS
+    if has_relative_date(normalized):
+        ttl = min(ttl, PROMPT_CACHE_RELATIVE_TTL_SECONDS)
+    if ttl <= 0 or not normalized:
+        return None, 0
+    scope = session_id if PROMPT_CACHE_SCOPE == "session" else "global"
+    return f"{AGENT_ID}:{ALIAS_ID}:{scope}:{normalized}", ttl
+
+
+# ---------- Agent Output ----------
+def _parse_chunk(chunk_bytes):
+    """Return (text, url) from one agent chunk; chunks are either JSON or plain text."""
+    # Streamed text chunks are the common case; only try to parse what could be a JSON object
+    if chunk_bytes.lstrip()[:1] != b"{":
+        return chunk_bytes.decode("utf-8"), None
+    try:
+        chunk_json = json_loads(chunk_bytes)
+    except ValueError:
+        return chunk_bytes.decode("utf-8"), None
+    if not isinstance(chunk_json, dict):
+        return chunk_bytes.decode("utf-8"), None
+    return chunk_json.get("text", ""), chunk_json.get("url")
+
+
+def iter_agent_events(prompt, session_id, stream=False):
+    """
+    Invoke the Bedrock agent and yield output events as they arrive:
+    {"type": "text", "text": ...} and {"type": "url", "url": ...}.
+    Time-to-first-token is logged once the first text chunk lands.
+    """
+    started = time.time()
+    kwargs = {
+        "agentId": AGENT_ID,
+        "agentAliasId": ALIAS_ID,
+        "sessionId": session_id,
+        "inputText": prompt,
+    }
+    if stream:
+        # Ask Bedrock to stream the final response instead of returning it in one chunk
+        kwargs["streamingConfigurations"] = {"streamFinalResponse": True}
+    log("Invoking Bedrock Agent...")
+    response = get_bedrock_client().invoke_agent(**kwargs)
+    first_token_ms = None
+    for event_item in response["completion"]:
+        if "chunk" in event_item:
+            text, url = _parse_chunk(event_item["chunk"]["bytes"])
+            if text:
+                if first_token_ms is None:
+                    first_token_ms = round((time.time() - started) * 1000)
+                    log(f"Time to first token: {first_token_ms} ms")
+                yield {"type": "text", "text": text}
+            if url:
+                yield {"type": "url", "url": url}
+        elif "completion" in event_item:
+            break
+    log(f"Agent turn complete in {round((time.time() - started) * 1000)} ms (ttft={first_token_ms} ms)")
+
+
+def _json_response(status_code, payload):
+    headers = {"Access-Control-Allow-Origin": "*"}
+    if status_code == 200:
+        headers["Content-Type"] = "application/json"
+    return {"statusCode": status_code, "headers": headers, "body": json.dumps(payload)}
+
+
+def authorize(headers):
+    """Return an error response if the demo key check fails, otherwise None."""
+    if DEMO_MODE:
+        return None
+    if not DEMO_KEY:
+        log("Missing DEMO_KEY in environment")
+        return _json_response(500, {"error": "Server misconfiguration: DEMO_KEY not set"})
+    if headers.get("x-demo-key") != DEMO_KEY:
+        log("Unauthorized request: invalid or missing DEMO_KEY")
+        return _json_response(403, {"error": "Unauthorized: Invalid or missing DEMO_KEY"})
+    return None
+
+
+def resolve_prompt(body):
+    """Prompt text for a request body, transcribing audio when present."""
+    prompt = body.get("prompt")
+    audio_base64 = body.get("audio_base64")
+    if audio_base64:
+        log("Decoding audio and starting transcription...")
+        audio_bytes = base64.b64decode(audio_base64)
+        payload, sample_rate, encoding = prepare_audio(audio_bytes, body.get("audio_format", "wav"))
+        import asyncio  # deferred: only voice requests need an event loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        started = time.time()
+        transcript = loop.run_until_complete(transcribe_audio(payload, sample_rate, encoding))
+        log(f"Transcription took {round((time.time() - started) * 1000)} ms")
+        log(f"Transcribed Text: {transcript}")
+        prompt = transcript or "Unable to transcribe audio."
+    if not prompt:
+        raise ValueError("No 'prompt' or 'audio_base64' provided in request.")
+    return prompt
+
+
+def iter_response_events(body):
+    """
+    Full request pipeline as a stream of events, ending with a "done" event that
+    carries the same fields as the buffered JSON response.
+    """
+    session_id = body.get("session_id", "default-session")
+    if DEMO_MODE:
+        log("DEMO MODE ENABLED — returning static response")
+        reply = "Demo Mode: This is a simulated Bedrock response."
+        yield {"type": "text", "text": reply}
+        yield {"type": "done", "reply": reply, "session_id": session_id}
+        return
+    prompt = resolve_prompt(body)
+    if body.get("audio_base64"):
+        yield {"type": "transcript", "text": prompt}
+    turn = get_prompt_cache().start_turn(session_id) if PROMPT_CACHE_ENABLED else 0
+    cache_key, cache_ttl = prompt_cache_policy(prompt, session_id, turn)
+    cached = get_prompt_cache().get(cache_key) if cache_key else None
+    if cached is not None:
+        log(f"Prompt cache hit ({PROMPT_CACHE_SCOPE}): {normalize_prompt(prompt)}")
+        yield {"type": "text", "text": cached["reply"]}
+        if cached.get("url"):
+            yield {"type": "url", "url": cached["url"]}
+        result = {
+            "type": "done",
+            "reply": cached["reply"],
+            "url": cached.get("url"),
+            "session_id": session_id,
+            "cached": True,
+        }
+        if body.get("audio_base64"):
+            result["transcribed_text"] = prompt
+        yield result
+        return
+    reply_text = ""
+    csv_url = None
+    for item in iter_agent_events(prompt, session_id, stream=body.get("stream", False)):
+        if item["type"] == "text":
+            reply_text += item["text"]
+        elif item["type"] == "url":
+            csv_url = item["url"]
+        yield item
+    log(f"Final Reply: {reply_text.strip()}")
+    log(f"CSV URL: {csv_url}")
+    if cache_key and reply_text.strip():
+        get_prompt_cache().set(cache_key, {"reply": reply_text.strip(), "url": csv_url}, cache_ttl)
+    result = {
+        "type": "done",
+        "reply": reply_text.strip(),
+        "url": csv_url,
+        "session_id": session_id,
+    }
+    if body.get("audio_base64"):
+        result["transcribed_text"] = prompt
+    yield result
+
+
 # ---------- Lambda Handler ----------
 def lambda_handler(event, context):
     log("===== INVOCATION START =====")
@@ -68,114 +682,337 @@ def lambda_handler(event, context):
     try:
         # --- Parse body & headers ---
         headers = event.get("headers", {}) or {}
-        body_raw = event.get("body", "{}")
-        body = json.loads(body_raw)
-        session_id = body.get("session_id", "default-session")
-        prompt = body.get("prompt")
-        audio_base64 = body.get("audio_base64")
+        body = json.loads(event.get("body", "{}") or "{}")
 
         # --- Validate demo key ---
-        received_key = headers.get("x-demo-key")
-        if not DEMO_MODE:
-            if not DEMO_KEY:
-                log("Missing DEMO_KEY in environment")
-                return {
-                    "statusCode": 500,
-                    "headers": {"Access-Control-Allow-Origin": "*"},
-                    "body": json.dumps({"error": "Server misconfiguration: DEMO_KEY not set"})
-                }
-
-            if received_key != DEMO_KEY:
-                log("Unauthorized request: invalid or missing DEMO_KEY")
-                return {
-                    "statusCode": 403,
-                    "headers": {"Access-Control-Allow-Origin": "*"},
-                    "body": json.dumps({"error": "Unauthorized: Invalid or missing DEMO_KEY"})
-                }
-
-        # --- DEMO MODE (no AWS cost) ---
-        if DEMO_MODE:
-            log("DEMO MODE ENABLED — returning static response")
-            fake_response = {
-                "reply": "Demo Mode: This is a simulated Bedrock response.",
-                "session_id": session_id,
-            }
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Content-Type": "application/json",
-                },
-                "body": json.dumps(fake_response),
-            }
-
-        # --- Transcribe Audio if Present ---
-        if audio_base64:
-            log("Decoding audio and starting transcription...")
-            audio_bytes = base64.b64decode(audio_base64)
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            transcript = loop.run_until_complete(transcribe_audio(audio_bytes))
-            log(f"Transcribed Text: {transcript}")
-            prompt = transcript or "Unable to transcribe audio."
-
-        # --- Validate prompt ---
-        if not prompt:
-            raise ValueError("No 'prompt' or 'audio_base64' provided in request.")
-
-        # --- Invoke Bedrock Agent ---
-        log("Invoking Bedrock Agent...")
-        response = bedrock.invoke_agent(
-            agentId=AGENT_ID,
-            agentAliasId=ALIAS_ID,
-            sessionId=session_id,
-            inputText=prompt,
-        )
+        denied = authorize(headers)
+        if denied:
+            return denied
 
-        reply_text = ""
-        csv_url = None
-        for event_item in response["completion"]:
-            if "chunk" in event_item:
-                chunk_str = event_item["chunk"]["bytes"].decode("utf-8")
-                try:
-                    chunk_json = json.loads(chunk_str)
-                    if "text" in chunk_json:
-                        reply_text += chunk_json["text"]
-                    if "url" in chunk_json:
-                        csv_url = chunk_json["url"]
-                except json.JSONDecodeError:
-                    reply_text += chunk_str
-            elif "completion" in event_item:
-                break
-
-        log(f"Final Reply: {reply_text.strip()}")
-        log(f"CSV URL: {csv_url}")
-
-        # --- Build Response ---
-        result = {
-            "reply": reply_text.strip(),
-            "url": csv_url,
-            "session_id": session_id,
-        }
-
-        if audio_base64:
-            result["transcribed_text"] = prompt
-
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Content-Type": "application/json",
-            },
-            "body": json.dumps(result),
-        }
+        # --- Run the agent turn and return the final event ---
+        result = {}
+        for item in iter_response_events(body):
+            if item["type"] == "done":
+                result = {k: v for k, v in item.items() if k != "type"}
+        return _json_response(200, result)
 
     except Exception as e:
         log("===== ERROR =====")
         log(f"{type(e).__name__}: {e}")
         log(traceback.format_exc())
-        return {
-            "statusCode": 500,
-            "headers": {"Access-Control-Allow-Origin": "*"},
-            "body": json.dumps({"error": str(e)}),
-        }
+        return _json_response(500, {"error": str(e)})
+
+
+# ---------- Streaming Server (Lambda Web Adapter, response_stream mode) ----------
+def serve_streaming(port=8080):
+    """
+    Serve the same API over HTTP with chunked NDJSON responses, one event per line.
+    Run under the AWS Lambda Web Adapter with AWS_LWA_INVOKE_MODE=response_stream
+    (and a Function URL in RESPONSE_STREAM mode) so chunks reach the client as the
+    agent produces them. The Python managed runtime cannot stream on its own.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StreamingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def _send_plain(self, status_code, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status_code)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # Lambda Web Adapter readiness check
+            self._send_plain(200, {"ok": True})
+
+        def do_POST(self):
+            log("===== STREAMING INVOCATION START =====")
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                return self._send_plain(400, {"error": f"Invalid JSON body: {e}"})
+            denied = authorize({k.lower(): v for k, v in self.headers.items()})
+            if denied:
+                return self._send_plain(denied["statusCode"], json.loads(denied["body"]))
+            body["stream"] = True
+            self.send_response(200)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            try:
+                for item in iter_response_events(body):
+                    self._write_chunk(json_dumps_bytes(item) + b"\n")
+            except Exception as e:
+                log("===== ERROR =====")
+                log(f"{type(e).__name__}: {e}")
+                log(traceback.format_exc())
+                self._write_chunk((json.dumps({"type": "error", "error": str(e)}) + "\n").encode("utf-8"))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            log(format % args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), StreamingHandler)
+    log(f"Streaming server listening on :{port}")
+    server.serve_forever()
+
+
+# ---------- Live Voice Server (WebSocket) ----------
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _WebSocket:
+    """Minimal RFC 6455 server-side connection on top of asyncio streams."""
+
+    def __init__(self, reader, writer):
+        import asyncio
+        self.reader = reader
+        self.writer = writer
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    async def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes([0x80 | opcode, length])
+        elif length < 1 << 16:
+            header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, "big")
+        else:
+            header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, "big")
+        async with self.send_lock:
+            if self.closed:
+                return
+            self.writer.write(header + payload)
+            await self.writer.drain()
+
+    async def send_json(self, payload):
+        await self._send_frame(0x1, json.dumps(payload).encode("utf-8"))
+
+    async def close(self, code=1000):
+        if not self.closed:
+            try:
+                await self._send_frame(0x8, code.to_bytes(2, "big"))
+            except ConnectionError:
+                pass
+            self.closed = True
+        self.writer.close()
+
+    async def _read_frame(self):
+        b1, b2 = await self.reader.readexactly(2)
+        length = b2 & 0x7F
+        if length == 126:
+            length = int.from_bytes(await self.reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await self.reader.readexactly(8), "big")
+        if length > WS_MAX_MESSAGE_BYTES:
+            raise ValueError(f"WebSocket frame of {length} bytes exceeds WS_MAX_MESSAGE_BYTES")
+        mask = await self.reader.readexactly(4) if b2 & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask and length:
+            # Unmask as one big-int XOR; per-byte loops are too slow for audio frames
+            key = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+        return bool(b1 & 0x80), b1 & 0x0F, payload
+
+    async def recv(self):
+        """Next data message as (opcode, payload); (0x8, b"") once the peer closes."""
+        parts, message_opcode = [], None
+        while True:
+            try:
+                fin, opcode, payload = await self._read_frame()
+            except Exception:
+                # IncompleteReadError/ConnectionError: treat a dropped socket as a close
+                return 0x8, b""
+            if opcode == 0x8:
+                await self.close()
+                return 0x8, b""
+            if opcode == 0x9:
+                await self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            if opcode != 0x0:
+                message_opcode = opcode
+            parts.append(payload)
+            if fin:
+                return message_opcode, b"".join(parts)
+
+
+async def _ws_handshake(reader, writer):
+    """Complete the HTTP upgrade; returns lower-cased request headers, or None if rejected."""
+    import hashlib
+    request = await reader.readuntil(b"\r\n\r\n")
+    headers = {}
+    for line in request.decode("latin-1").split("\r\n")[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    ws_key = headers.get("sec-websocket-key")
+    if headers.get("upgrade", "").lower() != "websocket" or not ws_key:
+        writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+        return None
+    accept = base64.b64encode(hashlib.sha1((ws_key + _WS_GUID).encode("ascii")).digest()).decode("ascii")
+    writer.write((
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+    ).encode("ascii"))
+    await writer.drain()
+    return headers
+
+
+async def _forward_response_events(ws, body):
+    """Run the (blocking) agent pipeline in a worker thread and relay each event as it lands."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def produce():
+        try:
+            for item in iter_response_events(body):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            log(f"{type(e).__name__}: {e}")
+            log(traceback.format_exc())
+            loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    loop.run_in_executor(None, produce)
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        if item["type"] == "done":
+            item["transcribed_text"] = body["prompt"]
+        await ws.send_json(item)
+
+
+async def _voice_session(ws, headers):
+    """
+    One live voice turn. Protocol (client → server):
+      text   {"type": "start", "session_id", "sample_rate", "channels", "demo_key"?}
+      binary raw 16-bit little-endian PCM chunks, whole frames, while the user speaks
+      text   {"type": "end"}
+    Server → client: {"type": "partial", "text", "final"} while audio streams, then
+    {"type": "transcript"}, then the same text/url/done events as the streaming HTTP API.
+    """
+    import asyncio
+    opcode, payload = await ws.recv()
+    if opcode != 0x1:
+        return await ws.close(1002)
+    start = json.loads(payload)
+    if start.get("demo_key"):
+        # Browsers cannot set headers on a WebSocket upgrade, so the key may ride in the start message
+        headers = dict(headers, **{"x-demo-key": start["demo_key"]})
+    denied = authorize(headers)
+    if denied:
+        await ws.send_json({"type": "error", "error": json.loads(denied["body"])["error"]})
+        return await ws.close(1008)
+    session_id = start.get("session_id", "default-session")
+    sample_rate = int(start.get("sample_rate", TARGET_SAMPLE_RATE))
+    channels = int(start.get("channels", 1))
+    started = time.time()
+
+    async def audio_chunks():
+        while True:
+            opcode, payload = await ws.recv()
+            if opcode == 0x2:
+                if channels > 1:
+                    payload = downmix_to_mono(to_int16_samples(payload, 2), channels).tobytes()
+                yield payload
+            elif opcode == 0x8 or (opcode == 0x1 and json.loads(payload).get("type") == "end"):
+                return
+
+    if DEMO_MODE:
+        received = 0
+        async for chunk in audio_chunks():
+            received += len(chunk)
+        transcript = "Demo Mode: simulated transcript."
+        log(f"DEMO MODE ENABLED — received {received} audio bytes over WebSocket")
+    else:
+        from amazon_transcribe.client import TranscribeStreamingClient
+        client = TranscribeStreamingClient(region=REGION)
+        stream = await client.start_stream_transcription(
+            language_code="en-US",
+            media_sample_rate_hz=sample_rate,
+            media_encoding="pcm"
+        )
+
+        async def on_result(text, is_final):
+            await ws.send_json({"type": "partial", "text": text, "final": is_final})
+
+        handler = get_event_handler_class()(stream.output_stream, on_result=on_result)
+
+        async def send_audio():
+            async for chunk in audio_chunks():
+                await stream.input_stream.send_audio_event(audio_chunk=chunk)
+            await stream.input_stream.end_stream()
+
+        await asyncio.gather(send_audio(), handler.handle_events())
+        transcript = handler.full_text.strip()
+    log(f"Live transcript ready {round((time.time() - started) * 1000)} ms after start: {transcript}")
+    await ws.send_json({"type": "transcript", "text": transcript})
+    if not transcript:
+        await ws.send_json({"type": "error", "error": "Unable to transcribe audio."})
+        return await ws.close()
+    # Invoke the agent as soon as the final transcript lands
+    await _forward_response_events(ws, {"prompt": transcript, "session_id": session_id, "stream": True})
+    await ws.close()
+
+
+def serve_voice_websocket(port=8081):
+    """
+    Accept live voice over WebSocket: audio chunks are forwarded to Transcribe while the
+    user is still speaking, partial transcripts flow back, and the agent reply streams
+    once the final transcript arrives. Needs a long-lived host (container, ECS, App
+    Runner); Lambda Function URLs and the Web Adapter do not carry WebSocket upgrades.
+    """
+    import asyncio
+
+    async def handle(reader, writer):
+        ws = None
+        try:
+            headers = await _ws_handshake(reader, writer)
+            if headers is None:
+                return
+            log("===== VOICE WEBSOCKET SESSION START =====")
+            ws = _WebSocket(reader, writer)
+            await _voice_session(ws, headers)
+        except Exception as e:
+            log("===== ERROR =====")
+            log(f"{type(e).__name__}: {e}")
+            log(traceback.format_exc())
+            if ws is not None and not ws.closed:
+                await ws.send_json({"type": "error", "error": str(e)})
+                await ws.close(1011)
+
+    async def run():
+        server = await asyncio.start_server(handle, "0.0.0.0", port)
+        log(f"Voice WebSocket server listening on :{port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    if VOICE_WS_PORT:
+        import threading
+        threading.Thread(target=serve_voice_websocket, args=(int(VOICE_WS_PORT),), daemon=True).start()
+    serve_streaming(int(os.getenv("PORT", "8080")))
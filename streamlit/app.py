@@ -1,7 +1,11 @@
 import streamlit as st
 import json, requests, uuid, os, base64, time, random
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from audio_recorder_streamlit import audio_recorder  # pip install audio-recorder-streamlit
+from demo_engine import DemoEngine
 
 # ---------- Environment ----------
 load_dotenv()
@@ -9,6 +13,23 @@ API_URL = os.getenv("API_URL")
 DEMO_MODE = os.getenv("DEMO_MODE", "true").lower() == "true"
 DEMO_KEY = os.getenv("DEMO_KEY")
 API_KEY = os.getenv("API_KEY")  # Add this to your .env file
+# Optional: Function URL of the streaming frontend (Lambda Web Adapter, response_stream mode)
+STREAM_API_URL = os.getenv("STREAM_API_URL")
+# Optional: live voice WebSocket endpoint (frontend serve_voice_websocket)
+VOICE_WS_URL = os.getenv("VOICE_WS_URL")
+# Optional: replay recorded live responses in demo mode / record them in live mode (JSON Lines)
+DEMO_REPLAY_FILE = os.getenv("DEMO_REPLAY_FILE")
+DEMO_RECORD_FILE = os.getenv("DEMO_RECORD_FILE")
+DEMO_REPLAY_SPEED = float(os.getenv("DEMO_REPLAY_SPEED", "1.0"))
+# HTTP client: timeouts are (connect, read); an agent turn can take a while to read
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+# Async mode: backend calls run on a shared worker pool; the page polls for partial replies
+ASYNC_REQUESTS = os.getenv("ASYNC_REQUESTS", "false").lower() == "true"
+ASYNC_POLL_SECONDS = float(os.getenv("ASYNC_POLL_SECONDS", "0.5"))
+REQUEST_WORKERS = int(os.getenv("REQUEST_WORKERS", "16"))
 
 # ---------- Validate Live Mode Configuration ----------
 def validate_live_mode_config():
@@ -25,29 +46,173 @@ def validate_live_mode_config():
         return errors
     return []
 
-# ---------- Load Demo Responses ----------
-def load_demo_responses():
-    """Load mock responses from JSON file for demo mode"""
-    try:
-        with open('demo_responses.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"responses": [], "default_response": "💬 Demo Mode: This is a simulated response for demonstration."}
+# ---------- Demo Responses ----------
+@st.cache_resource
+def get_demo_engine():
+    """One engine per server process; it re-reads demo_responses.json only when the file changes"""
+    return DemoEngine(
+        "demo_responses.json",
+        replay_path=DEMO_REPLAY_FILE,
+        record_path=DEMO_RECORD_FILE,
+        replay_speed=DEMO_REPLAY_SPEED,
+    )
 
 def get_demo_response(query):
     """Get appropriate demo response based on query keywords"""
-    demo_data = load_demo_responses()
-    query_lower = query.lower()
-    
-    # Search for matching keywords
-    for response_item in demo_data.get("responses", []):
-        keywords = response_item.get("keywords", [])
-        if any(keyword in query_lower for keyword in keywords):
-            return response_item.get("response")
-    
-    # Return default response if no match found
-    default = demo_data.get("default_response", "💬 Demo Mode: This is a simulated response for demonstration.")
-    return default.replace("{query}", query)
+    return get_demo_engine().get_response(query)
+
+# ---------- Backend Calls ----------
+@st.cache_resource
+def get_http_session():
+    """
+    One pooled keep-alive session per server process, shared by all users.
+    Retries are bounded and limited to cases where the agent turn never ran
+    (connection failures, 429 and 503), since POSTs are not idempotent.
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=0,
+        status=HTTP_MAX_RETRIES,
+        status_forcelist=(429, 503),
+        allowed_methods=frozenset(["GET", "POST"]),
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return session
+
+@st.cache_resource
+def get_request_executor():
+    """Worker pool for async mode, so script threads are not held for a whole agent turn"""
+    return ThreadPoolExecutor(max_workers=REQUEST_WORKERS, thread_name_prefix="backend-call")
+
+def backend_headers():
+    headers = {}
+    # Always send x-demo-key header in live mode
+    headers["x-demo-key"] = DEMO_KEY if DEMO_KEY else ""
+    # Add API Gateway key if available
+    if API_KEY:
+        headers["x-api-key"] = API_KEY
+    return headers
+
+def call_backend(payload, on_text=None):
+    """
+    Run one agent turn against the backend and return the response body.
+    Text prompts use the streaming endpoint when configured; on_text then receives
+    the reply-so-far after every chunk. Safe to call from worker threads.
+    """
+    session = get_http_session()
+    timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    if STREAM_API_URL and "audio_base64" not in payload:
+        return stream_agent_reply(payload, backend_headers(), on_text, session=session, timeout=timeout)
+    res = session.post(API_URL, json=payload, headers=backend_headers(), timeout=timeout)
+    res.raise_for_status()
+    return res.json()
+
+def submit_backend_call(prompt, payload):
+    """Async mode: start the call on the worker pool and remember it in the session"""
+    partial = {"text": ""}
+
+    def on_text(text):
+        partial["text"] = text
+
+    st.session_state.pending_reply = {
+        "prompt": prompt,
+        "future": get_request_executor().submit(call_backend, payload, on_text),
+        "partial": partial,
+        "started": time.time(),
+    }
+
+def stream_agent_reply(payload, headers, on_text=None, session=None, timeout=None):
+    """
+    POST to the streaming endpoint, reporting the reply-so-far to on_text as chunks arrive.
+    Returns the final "done" event (same shape as the buffered JSON response).
+    """
+    started = time.time()
+    first_token_at = None
+    reply_so_far = ""
+    final = {}
+    with (session or requests).post(STREAM_API_URL, json=payload, headers=headers, stream=True, timeout=timeout) as res:
+        res.raise_for_status()
+        for line in res.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            item = json.loads(line)
+            kind = item.get("type")
+            if kind == "text":
+                if first_token_at is None:
+                    first_token_at = time.time()
+                reply_so_far += item["text"]
+                if on_text:
+                    on_text(reply_so_far)
+            elif kind == "done":
+                final = item
+            elif kind == "error":
+                raise RuntimeError(item.get("error", "Streaming request failed"))
+    if first_token_at is not None:
+        print(f"Streaming time to first token: {round((first_token_at - started) * 1000)} ms")
+    final.setdefault("reply", reply_so_far)
+    return final
+
+def stream_voice_reply(audio_bytes, placeholder):
+    """
+    Send a recording over the live voice WebSocket in ~100 ms PCM chunks, showing partial
+    transcripts and reply text as they arrive. Returns the final "done" event.
+    """
+    import io, wave
+    import websocket  # pip install websocket-client
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        sample_rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        pcm = wav.readframes(wav.getnframes())
+    if width != 2:
+        raise ValueError(f"Expected 16-bit audio from the recorder, got {width * 8}-bit")
+    headers = [f"x-demo-key: {DEMO_KEY or ''}"]
+    if API_KEY:
+        headers.append(f"x-api-key: {API_KEY}")
+    ws = websocket.create_connection(VOICE_WS_URL, header=headers, timeout=60)
+    try:
+        ws.send(json.dumps({
+            "type": "start",
+            "session_id": st.session_state.session_id,
+            "sample_rate": sample_rate,
+            "channels": channels
+        }))
+        chunk = sample_rate // 10 * channels * width  # whole frames only
+        for i in range(0, len(pcm), chunk):
+            ws.send_binary(pcm[i:i + chunk])
+        ws.send(json.dumps({"type": "end"}))
+
+        transcript, reply_so_far, final = "", "", {}
+        while True:
+            message = ws.recv()
+            if not message:
+                break
+            item = json.loads(message)
+            kind = item.get("type")
+            if kind in ("partial", "transcript"):
+                transcript = item["text"]
+                placeholder.markdown(f"🎙️ _{transcript}_" + ("" if kind == "transcript" else " ▌"))
+            elif kind == "text":
+                reply_so_far += item["text"]
+                placeholder.markdown(
+                    f"🎙️ _{transcript}_\n\n" + reply_so_far.replace("$", "\\$") + " ▌", unsafe_allow_html=True
+                )
+            elif kind == "done":
+                final = item
+                break
+            elif kind == "error":
+                raise RuntimeError(item.get("error", "Voice session failed"))
+    finally:
+        ws.close()
+    final.setdefault("reply", reply_so_far)
+    final.setdefault("transcribed_text", transcript)
+    return final
 
 st.set_page_config(
     page_title="Quickbase Agent Orchestrator",
@@ -168,7 +333,7 @@ for msg in st.session_state.messages:
 # ---------- Voice Mode ----------
 if st.session_state.voice_mode:
     with st.expander("🎙️ Voice Mode Active — Speak to your Bedrock Agent", expanded=True):
-        audio_bytes = audio_recorder(pause_threshold=1.0, sample_rate=44100)
+        audio_bytes = audio_recorder(pause_threshold=1.0, sample_rate=16000)
         if audio_bytes:
             st.info("Processing your voice input...")
             try:
@@ -187,19 +352,16 @@ if st.session_state.voice_mode:
                     data = {
                         "reply": f"🎙️ **Voice Input Processed**\n\n_Transcribed:_ \"{transcribed_text}\"\n\n---\n\n{demo_response}"
                     }
+                elif VOICE_WS_URL:
+                    data = stream_voice_reply(audio_bytes, st.empty())
                 else:
                     encoded_audio = base64.b64encode(audio_bytes).decode("utf-8")
-                    headers = {}
-                    headers["x-demo-key"] = DEMO_KEY if DEMO_KEY else ""
-                    if API_KEY:
-                        headers["x-api-key"] = API_KEY
-                    res = requests.post(API_URL, json={
+                    data = call_backend({
                         "audio_base64": encoded_audio,
+                        "audio_format": "wav",
                         "session_id": st.session_state.session_id,
                         "voice_mode": True
-                    }, headers=headers)
-                    res.raise_for_status()
-                    data = res.json()
+                    })
                 reply = data.get("reply", "No reply received.")
                 url = data.get("url")
                 if url:
@@ -228,81 +390,128 @@ if st.session_state.voice_mode:
                 st.error(f"Audio processing failed: {e}")
 
 # ---------- Text Mode ----------
-else:
-    if prompt := st.chat_input("Type your message..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-
+def show_reply(data, placeholder):
+    """Render a completed agent reply and add it to the chat history"""
+    reply = data.get("reply", "No reply received.")
+    url = data.get("url")
+    if url:
+        reply += f"\n\n[📎 Download CSV Here]({url})"
+    # Escape dollar signs to prevent Streamlit markdown issues
+    reply = reply.replace("$", "\\$")
+
+    placeholder.markdown(reply, unsafe_allow_html=True)
+    st.session_state.messages.append({"role": "assistant", "content": reply})
+
+
+    # Display AI transparency actions if present
+    actions = data.get("actions", [])
+    if actions:
+        with st.expander("What happened behind the scenes?"):
+            for act in actions:
+                st.markdown(f"- **{act['service']}**: {act['action']}")
+
+def show_backend_error(e, placeholder):
+    if isinstance(e, requests.exceptions.HTTPError):
+        if e.response.status_code == 403:
+            placeholder.markdown("🚫 Unauthorized: Invalid or missing DEMO_KEY.")
+        elif e.response.status_code == 500:
+            try:
+                error_body = e.response.json() if e.response.headers.get('content-type') == 'application/json' else {}
+                error_msg = error_body.get('error', str(e))
+                if 'DEMO_KEY' in error_msg or 'misconfiguration' in error_msg.lower():
+                    placeholder.markdown("⚙️ **Server Configuration Error:** DEMO_KEY is not configured in the Lambda function. Contact your administrator.")
+                else:
+                    placeholder.markdown(f"🔧 Server Error: {error_msg}")
+            except:
+                placeholder.markdown(f"🔧 Server Error: {e}")
+        else:
+            placeholder.markdown(f"API Error: {e}")
+    elif isinstance(e, requests.exceptions.Timeout):
+        placeholder.markdown("⏱️ The agent took too long to respond. Please try again.")
+    else:
+        placeholder.markdown(f"Error: {e}")
+
+@st.fragment(run_every=ASYNC_POLL_SECONDS)
+def render_pending_reply():
+    """Async mode: poll the in-flight call, showing partial text, then rerun once it finishes"""
+    pending = st.session_state.get("pending_reply")
+    if pending is None:
+        return
+    if not pending["future"].done():
+        with st.chat_message("assistant"):
+            partial = pending["partial"]["text"]
+            if partial:
+                st.markdown(partial.replace("$", "\\$") + " ▌", unsafe_allow_html=True)
+            else:
+                st.markdown(f"_Thinking... {int(time.time() - pending['started'])}s_")
+        return
+    st.session_state.pending_reply = None
+    st.session_state.completed_reply = pending
+    st.rerun()
+
+if not st.session_state.voice_mode:
+    completed = st.session_state.pop("completed_reply", None)
+    if completed is not None:
         with st.chat_message("assistant"):
             placeholder = st.empty()
-            placeholder.markdown("_Thinking..._")
-
             try:
-                if DEMO_MODE:
-                    # Simulate thinking time (3-4 seconds)
-                    time.sleep(random.uniform(3.0, 4.0))
-                    # Use smart demo response matching
-                    reply = get_demo_response(prompt)
-                    # Always include mock actions for transparency in demo mode
-                    data = {
-                        "reply": reply,
-                        "actions": [
-                            {"service": "Quickbase", "action": "Queried table: Customers (demo)"},
-                            {"service": "S3", "action": "Stored file: report_demo.csv in bucket: demo-bucket"},
-                            {"service": "Slack", "action": "Sent message to #demo-reports"}
-                        ]
-                    }
-                else:
-                    headers = {}
-                    # Always send x-demo-key header in live mode
-                    headers["x-demo-key"] = DEMO_KEY if DEMO_KEY else ""
-                    # Add API Gateway key if available
-                    if API_KEY:
-                        headers["x-api-key"] = API_KEY
-
-                    res = requests.post(API_URL, json={
-                        "prompt": prompt,
-                        "session_id": st.session_state.session_id
-                    }, headers=headers)
-                    res.raise_for_status()
-                    data = res.json()
+                data = completed["future"].result()
+                get_demo_engine().record(completed["prompt"], data, (time.time() - completed["started"]) * 1000)
+                show_reply(data, placeholder)
+            except Exception as e:
+                show_backend_error(e, placeholder)
 
-                reply = data.get("reply", "No reply received.")
-                url = data.get("url")
-                if url:
-                    reply += f"\n\n[📎 Download CSV Here]({url})"
-                # Escape dollar signs to prevent Streamlit markdown issues
-                reply = reply.replace("$", "\\$")
+    awaiting_reply = st.session_state.get("pending_reply") is not None
+    if prompt := st.chat_input("Type your message...", disabled=awaiting_reply):
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
 
-                placeholder.markdown(reply, unsafe_allow_html=True)
-                st.session_state.messages.append({"role": "assistant", "content": reply})
+        payload = {
+            "prompt": prompt,
+            "session_id": st.session_state.session_id
+        }
+        if ASYNC_REQUESTS and not DEMO_MODE:
+            submit_backend_call(prompt, payload)
+        else:
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                placeholder.markdown("_Thinking..._")
+
+                try:
+                    replayed = get_demo_engine().replay(prompt) if DEMO_MODE and DEMO_REPLAY_FILE else None
+                    if replayed is not None:
+                        # Recorded live response, served after its measured latency
+                        data = replayed
+                    elif DEMO_MODE:
+                        # Simulate thinking time (3-4 seconds)
+                        time.sleep(random.uniform(3.0, 4.0))
+                        # Use smart demo response matching
+                        reply = get_demo_response(prompt)
+                        # Always include mock actions for transparency in demo mode
+                        data = {
+                            "reply": reply,
+                            "actions": [
+                                {"service": "Quickbase", "action": "Queried table: Customers (demo)"},
+                                {"service": "S3", "action": "Stored file: report_demo.csv in bucket: demo-bucket"},
+                                {"service": "Slack", "action": "Sent message to #demo-reports"}
+                            ]
+                        }
+                    else:
+                        started = time.time()
+                        data = call_backend(
+                            payload,
+                            on_text=lambda text: placeholder.markdown(text.replace("$", "\\$") + " ▌", unsafe_allow_html=True)
+                        )
+                        get_demo_engine().record(prompt, data, (time.time() - started) * 1000)
 
+                    show_reply(data, placeholder)
 
-                # Display AI transparency actions if present
-                actions = data.get("actions", [])
-                if actions:
-                    with st.expander("What happened behind the scenes?"):
-                        for act in actions:
-                            st.markdown(f"- **{act['service']}**: {act['action']}")
+                except Exception as e:
+                    show_backend_error(e, placeholder)
 
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 403:
-                    placeholder.markdown("🚫 Unauthorized: Invalid or missing DEMO_KEY.")
-                elif e.response.status_code == 500:
-                    try:
-                        error_body = e.response.json() if e.response.headers.get('content-type') == 'application/json' else {}
-                        error_msg = error_body.get('error', str(e))
-                        if 'DEMO_KEY' in error_msg or 'misconfiguration' in error_msg.lower():
-                            placeholder.markdown("⚙️ **Server Configuration Error:** DEMO_KEY is not configured in the Lambda function. Contact your administrator.")
-                        else:
-                            placeholder.markdown(f"🔧 Server Error: {error_msg}")
-                    except:
-                        placeholder.markdown(f"🔧 Server Error: {e}")
-                else:
-                    placeholder.markdown(f"API Error: {e}")
-            except Exception as e:
-                placeholder.markdown(f"Error: {e}")
+    if st.session_state.get("pending_reply") is not None:
+        render_pending_reply()
 
 # ---------- Footer ----------
 st.markdown("""
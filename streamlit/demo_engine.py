@@ -0,0 +1,194 @@
+"""
+Demo response engine for the Streamlit app.
+
+- demo_responses.json is parsed once and re-parsed only when its mtime changes
+- keywords compile into an Aho-Corasick automaton, so a query is scanned once
+  regardless of how many responses/keywords exist
+- replay mode serves recorded live responses (JSON Lines) with their measured
+  latencies, so the UI can be load tested without AWS; live mode can record them
+
+Match priority: higher "priority" field first, then the longest matching keyword,
+then file order ("projects and tasks" beats the generic "tasks").
+"""
+import json, os, threading, time
+from collections import deque
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESPONSE = "💬 Demo Mode: This is a simulated response for demonstration."
+
+
+def resolve_path(path):
+    """Relative paths are resolved against this directory, not the process cwd."""
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def normalize_prompt(text):
+    return " ".join((text or "").lower().split())
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over (keyword, value) pairs; matching is by substring."""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword, value in keywords:
+            node = 0
+            for ch in keyword:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node].append((keyword, value))
+
+        # Breadth-first fill of failure links; outputs inherit their fallback's outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        """Yield (keyword, value) for every keyword occurrence in text."""
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._out[node]:
+                yield from self._out[node]
+
+
+class DemoEngine:
+    """Keyword-matched demo responses plus optional replay/recording of live responses."""
+
+    def __init__(self, responses_path="demo_responses.json", replay_path=None, record_path=None, replay_speed=1.0):
+        self.responses_path = resolve_path(responses_path)
+        self.replay_path = resolve_path(replay_path)
+        self.record_path = resolve_path(record_path)
+        self.replay_speed = replay_speed
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        self._responses = []
+        self._default = DEFAULT_RESPONSE
+        self._matcher = KeywordMatcher([])
+        self._replay_records = []
+        self._replay_by_prompt = {}
+        self._replay_cursor = 0
+
+    # ---------- Loading ----------
+    def _changed(self, path):
+        """True when path's mtime differs from the last load (missing files count once)."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._mtimes.get(path, "unset") == mtime:
+            return False
+        self._mtimes[path] = mtime
+        return True
+
+    def _refresh(self):
+        with self._lock:
+            if self._changed(self.responses_path):
+                self._load_responses()
+            if self.replay_path and self._changed(self.replay_path):
+                self._load_replay()
+
+    def _load_responses(self):
+        try:
+            with open(self.responses_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        self._responses = data.get("responses", [])
+        self._default = data.get("default_response", DEFAULT_RESPONSE)
+        self._matcher = KeywordMatcher(
+            (keyword.lower(), index)
+            for index, item in enumerate(self._responses)
+            for keyword in item.get("keywords", [])
+            if keyword
+        )
+
+    def _load_replay(self):
+        records = []
+        try:
+            with open(self.replay_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        records.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        self._replay_records = records
+        self._replay_by_prompt = {}
+        for record in records:
+            self._replay_by_prompt.setdefault(normalize_prompt(record.get("prompt")), record)
+        self._replay_cursor = 0
+
+    # ---------- Keyword Responses ----------
+    def match(self, query):
+        """Best matching response item for query, or None."""
+        self._refresh()
+        best, best_rank = None, None
+        for keyword, index in self._matcher.iter_matches(query.lower()):
+            item = self._responses[index]
+            rank = (-item.get("priority", 0), -len(keyword), index)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = item, rank
+        return best
+
+    def get_response(self, query):
+        item = self.match(query)
+        if item is not None:
+            return item.get("response")
+        return self._default.replace("{query}", query)
+
+    # ---------- Replay / Record ----------
+    @property
+    def replay_enabled(self):
+        return bool(self.replay_path)
+
+    def replay(self, prompt, sleep=True):
+        """
+        Recorded response for prompt (exact normalized match, otherwise the next record
+        in rotation so arbitrary load-test prompts still get a realistic reply), after
+        waiting its recorded latency scaled by replay_speed. None if nothing is recorded.
+        """
+        self._refresh()
+        with self._lock:
+            record = self._replay_by_prompt.get(normalize_prompt(prompt))
+            if record is None and self._replay_records:
+                record = self._replay_records[self._replay_cursor % len(self._replay_records)]
+                self._replay_cursor += 1
+        if record is None:
+            return None
+        if sleep and self.replay_speed > 0:
+            time.sleep(record.get("latency_ms", 0) / 1000.0 * self.replay_speed)
+        return {k: v for k, v in record.items() if k not in ("prompt", "latency_ms", "recorded_at")}
+
+    def record(self, prompt, data, latency_ms):
+        """Append a live response to the record file (no-op unless recording is enabled)."""
+        if not self.record_path:
+            return
+        entry = {
+            "prompt": prompt,
+            "latency_ms": round(latency_ms),
+            "recorded_at": int(time.time()),
+            **{k: data[k] for k in ("reply", "url", "actions", "transcribed_text") if data.get(k) is not None},
+        }
+        with self._lock:
+            with open(self.record_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")